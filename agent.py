@@ -1,6 +1,8 @@
 # agent.py
 # Streamlit Frontend for AI Triage System
 
+import json
+
 import streamlit as st
 import requests
 import matplotlib.pyplot as plt
@@ -61,18 +63,69 @@ uploaded_file = st.file_uploader("Or upload a report (.txt or .pdf)", type=["txt
 if "triage_result" not in st.session_state:
     st.session_state.triage_result = None
 
+def iter_sse(resp):
+    """Yield (event, data) pairs from a server-sent events response."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def run_streaming_triage(resp):
+    """Render each pipeline stage as soon as the API emits it."""
+    status = st.status("Analyzing report...", expanded=True)
+    analyzer_box = status.empty()
+    retrieval_box = status.empty()
+    reasoning_box = status.empty()
+    tokens = []
+    for event, data in iter_sse(resp):
+        if event == "analyzer":
+            status.update(label="Retrieving guidelines...")
+            analyzer_box.markdown(
+                "**Symptoms:** " + (", ".join(data.get("symptoms", [])) or "—")
+                + "  \n**Risk factors:** " + (", ".join(data.get("risk_factors", [])) or "—")
+                + "  \n**Diagnoses:** " + (", ".join(data.get("diagnoses", [])) or "—")
+            )
+        elif event == "retrieval":
+            status.update(label="Reasoning...")
+            retrieval_box.markdown("**Guidelines:** " + (", ".join(data.get("guideline_ids", [])) or "none found"))
+        elif event == "token":
+            tokens.append(data)
+            reasoning_box.code("".join(tokens), language="json")
+        elif event == "field" and data.get("key") == "triage_level":
+            status.update(label=f"{data.get('value')} — writing explanation...")
+        elif event == "triage":
+            status.update(label="Triage complete", state="complete", expanded=False)
+            return data
+        elif event == "error":
+            status.update(label="Triage failed", state="error")
+            st.error(f"Triage failed: {data.get('detail')}")
+            return None
+    return None
+
+
 if st.button("Run Triage"):
     if uploaded_file:
-        files = {"file": uploaded_file.getvalue()}
-        resp = requests.post(f"{API_URL}/triage-upload", files={"file": uploaded_file})
+        resp = requests.post(f"{API_URL}/triage-upload/stream", files={"file": uploaded_file}, stream=True)
     elif patient_text.strip():
-        resp = requests.post(f"{API_URL}/triage", json={"text": patient_text})
+        resp = requests.post(f"{API_URL}/triage/stream", json={"text": patient_text}, stream=True)
     else:
         st.error("Please enter text or upload a file.")
         resp = None
 
-    if resp and resp.status_code == 200:
-        st.session_state.triage_result = resp.json()
+    if resp is not None and resp.status_code == 200:
+        result = run_streaming_triage(resp)
+        if result is not None:
+            st.session_state.triage_result = result
+            st.session_state.chat_session_id = None  # next chat message opens a session for this result
     elif resp is not None:
         st.error(f"Triage failed: {resp.text}")
 
@@ -111,17 +164,54 @@ if st.session_state.triage_result:
 st.subheader("💬 Chat with Assistant")
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = None
+
+
+def open_chat_session():
+    """Server-side session holding the triage result and the conversation."""
+    resp = requests.post(f"{API_URL}/chat/sessions", json={"triage": st.session_state.triage_result})
+    resp.raise_for_status()
+    st.session_state.chat_session_id = resp.json()["session_id"]
+
+
+def send_chat_message(query):
+    """Send only the new message; stream the reply into the page. Returns the reply or None."""
+    for _ in range(2):
+        if st.session_state.chat_session_id is None:
+            open_chat_session()
+        resp = requests.post(
+            f"{API_URL}/chat/sessions/{st.session_state.chat_session_id}/messages",
+            json={"query": query},
+            stream=True,
+        )
+        if resp.status_code == 404:  # session expired: start a new one
+            st.session_state.chat_session_id = None
+            continue
+        if resp.status_code != 200:
+            return None
+        box = st.empty()
+        tokens = []
+        for event, data in iter_sse(resp):
+            if event == "token":
+                tokens.append(data)
+                box.markdown("🤖 " + "".join(tokens))
+            elif event == "done":
+                box.empty()
+                return data.get("reply", "".join(tokens))
+            elif event == "error":
+                box.empty()
+                st.error(f"Chat failed: {data.get('detail')}")
+                return None
+        return None
+    return None
+
 
 user_query = st.text_input("Ask a question about the triage result:")
 if st.button("Send"):
     if user_query.strip():
-        history = [{"role": m["role"], "content": m["content"]} for m in st.session_state.chat_history]
-        history.append({"role": "system", "content": f"triage_result: {st.session_state.triage_result}"})
-        payload = {"history": history, "query": user_query}
-        resp = requests.post(f"{API_URL}/chat", json=payload)
-
-        if resp.status_code == 200:
-            reply = resp.json().get("reply", "No response.")
+        reply = send_chat_message(user_query)
+        if reply is not None:
             st.session_state.chat_history.append({"role": "user", "content": user_query})
             st.session_state.chat_history.append({"role": "assistant", "content": reply})
         else:
@@ -155,7 +245,7 @@ if st.button("Send to n8n"):
             "instruction": instruction,
         }
         resp = requests.post(f"{API_URL}/handoff-n8n", json=payload)
-        if resp.status_code == 200:
-            st.success("✅ Sent to n8n successfully.")
+        if resp.status_code == 202:
+            st.success(f"✅ Handoff queued for n8n (id {resp.json().get('handoff_id')}).")
         else:
             st.error(f"n8n handoff failed: {resp.text}")
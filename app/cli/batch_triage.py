@@ -0,0 +1,77 @@
+# app/cli/batch_triage.py
+"""
+Offline batch triage over a directory of .txt/.pdf reports, without the API server.
+
+    python -m app.cli.batch_triage "datasource/Medical Reports  Bundle" -o results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from app.config import BATCH_GROQ_CONCURRENCY
+from app.services.http_client import close_http_client
+from app.services.inference import inference_executor
+from app.services.pdf_extraction import extract_upload_text, shutdown_pdf_pool
+from app.services.pipeline import run_triage_batch
+from app.services.retrieval import close_retrieval
+
+
+def _find_reports(directory: str, recursive: bool):
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith((".txt", ".pdf")):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+async def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    return await extract_upload_text(path, data)
+
+
+async def main(args) -> None:
+    paths = list(_find_reports(args.directory, args.recursive))
+    if not paths:
+        print(f"⚠️ No .txt/.pdf files in {args.directory}")
+        return
+    t0 = time.perf_counter()
+    try:
+        texts = await asyncio.gather(*(_read_text(p) for p in paths), return_exceptions=True)
+        shutdown_pdf_pool()
+        print(f"[INFO] Extracted {len(paths)} files in {time.perf_counter() - t0:.1f}s")
+
+        results = []
+        for start in range(0, len(paths), args.chunk_size):
+            chunk = list(texts[start:start + args.chunk_size])
+            results.extend(await run_triage_batch(chunk, debug=args.debug, concurrency=args.concurrency))
+            print(f"[INFO] {min(start + args.chunk_size, len(paths))}/{len(paths)} triaged")
+    finally:
+        # Same order as the app lifespan: flushes the embedding cache index and the NumpyIndex snapshot
+        await close_http_client()
+        inference_executor.shutdown()
+        shutdown_pdf_pool()
+        close_retrieval()
+
+    ok = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for i, (path, res) in enumerate(zip(paths, results)):
+            res["index"] = i
+            res["id"] = path
+            ok += res["ok"]
+            f.write(json.dumps(res, ensure_ascii=False) + "\n")
+    print(f"[INFO] {ok}/{len(paths)} succeeded in {time.perf_counter() - t0:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("directory")
+    ap.add_argument("-o", "--output", default="batch_results.jsonl")
+    ap.add_argument("-r", "--recursive", action="store_true")
+    ap.add_argument("--concurrency", type=int, default=BATCH_GROQ_CONCURRENCY, help="concurrent Groq calls")
+    ap.add_argument("--chunk-size", type=int, default=32, help="inputs per batched retrieval")
+    ap.add_argument("--debug", action="store_true", help="include analyzer/retrieval details")
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,85 @@
+# app/cli/ingest_guidelines.py
+"""
+Bulk guideline ingest into the configured collection, without the API server.
+Accepts NDJSON (.ndjson/.jsonl, streamed), JSON lists (.json, like guidelines.json)
+and triage PDFs (.pdf, e.g. datasource/WHO.pdf; lines naming a level become items).
+
+    python -m app.cli.ingest_guidelines datasource/WHO.pdf datasource/who_guidelines.json --batch-size 64
+    python -m app.cli.ingest_guidelines --reembed   # re-embed the stored collection (e.g. pooling changed)
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator
+
+from app.config import INGEST_BATCH_SIZE
+from app.services.guideline_ingest import ingest_records, iter_records, ndjson_records, pdf_records
+from app.services.inference import inference_executor
+from app.services.pdf_extraction import shutdown_pdf_pool
+from app.services.retrieval import close_retrieval, reembed_collection
+
+
+async def _file_chunks(path: str, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _records(path: str, source: str):
+    name = path.lower()
+    if name.endswith(".pdf"):
+        with open(path, "rb") as f:
+            return pdf_records(f.read(), source)
+    if name.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        if not isinstance(items, list):
+            items = items.get("items") or []
+        return iter_records(items)
+    return ndjson_records(_file_chunks(path), source)
+
+
+async def main(args) -> None:
+    t0 = time.perf_counter()
+    total = 0
+    try:
+        if args.reembed:
+            print("[INFO] Re-embedding the stored collection...")
+            n = await inference_executor.run(reembed_collection, args.batch_size)
+            print(f"✅ {n} documents re-embedded in {time.perf_counter() - t0:.1f}s")
+        for path in args.paths:
+            source = args.source or os.path.basename(path)
+            print(f"[INFO] Ingesting {path}...")
+            async for p in ingest_records(_records(path, source), batch_size=args.batch_size, source=source):
+                rate = f", {p['docs_per_sec']} docs/s" if p["docs_per_sec"] else ""
+                if p["done"]:
+                    total += p["upserted"]
+                    print(f"✅ {path}: {p['upserted']} upserted, {p['skipped']} skipped in {p['seconds']}s{rate}")
+                    for err in p["errors"]:
+                        print(f"⚠️ {err}")
+                else:
+                    print(f"[INFO] batch {p['batches']}: {p['upserted']}/{p['seen']} upserted{rate}")
+    finally:
+        shutdown_pdf_pool()
+        close_retrieval()
+        inference_executor.shutdown()
+    elapsed = time.perf_counter() - t0
+    if args.paths:
+        print(f"[INFO] {total} guidelines from {len(args.paths)} file(s) in {elapsed:.1f}s ({total / elapsed:.1f} docs/s)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="*")
+    ap.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="items embedded per upsert")
+    ap.add_argument("--source", default=None, help="source metadata (default: file name)")
+    ap.add_argument("--reembed", action="store_true", help="re-embed stored documents with the current model first")
+    args = ap.parse_args()
+    if not args.paths and not args.reembed:
+        ap.error("give at least one path or --reembed")
+    asyncio.run(main(args))
@@ -0,0 +1,234 @@
+# app/cli/serve.py
+"""
+Pre-fork production server: loads the embedding weights once, binds the
+listening socket, then forks N uvicorn workers that share the weights
+copy-on-write (torch parameters are moved to shared memory first). With
+CHROMA_MODE=http every worker talks to one Chroma server, started here when
+none is running. Per-worker RSS/PSS is logged at startup, every
+SERVE_MEMORY_REPORT_S seconds and on SIGUSR1.
+
+Requests land on whichever worker accepts the connection, so several workers
+need CHAT_SESSION_STORE=sqlite (chat sessions in one shared file). Each worker
+keeps to 1/N of the Groq RPM/TPM/concurrency limits, and a guideline ingest
+invalidates the result caches of every worker through a shared generation file.
+
+    CHAT_SESSION_STORE=sqlite CHROMA_MODE=http python -m app.cli.serve --workers 4 --port 8000
+"""
+import os
+
+# Fast tokenizers warn and disable themselves when they were used before a fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import argparse
+import gc
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from app.config import (
+    CHROMA_PATH,
+    CHROMA_MODE,
+    CHROMA_HOST,
+    CHROMA_PORT,
+    CHROMA_SERVER_LAUNCH,
+    CHAT_SESSION_STORE,
+    EMBEDDING_BACKEND,
+    RETRIEVER_BACKEND,
+    SERVE_WORKERS,
+    SERVE_HOST,
+    SERVE_PORT,
+    SERVE_MEMORY_REPORT_S,
+)
+from app.services.process_memory import memory_info
+
+
+# ---------- Chroma server ----------
+def chroma_alive(host: str, port: int) -> bool:
+    for path in ("/api/v2/heartbeat", "/api/v1/heartbeat"):
+        try:
+            if httpx.get(f"http://{host}:{port}{path}", timeout=1.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            return False
+    return False
+
+
+def start_chroma_server(timeout_s: float = 60.0) -> Optional[subprocess.Popen]:
+    """
+    Start `chroma run` on CHROMA_PATH unless a server already answers on CHROMA_HOST:CHROMA_PORT.
+    """
+    if chroma_alive(CHROMA_HOST, CHROMA_PORT):
+        print(f"✅ Using Chroma server at {CHROMA_HOST}:{CHROMA_PORT}")
+        return None
+    exe = shutil.which("chroma")
+    if exe is None:
+        sys.exit("❌ CHROMA_MODE=http but no Chroma server is running and the `chroma` CLI is not installed")
+    cmd = [exe, "run", "--path", CHROMA_PATH, "--host", CHROMA_HOST, "--port", str(CHROMA_PORT)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"❌ Chroma server exited with code {proc.returncode}")
+        if chroma_alive(CHROMA_HOST, CHROMA_PORT):
+            print(f"✅ Chroma server on {CHROMA_HOST}:{CHROMA_PORT} (pid {proc.pid}, path {CHROMA_PATH})")
+            return proc
+        time.sleep(0.5)
+    proc.terminate()
+    sys.exit(f"❌ Chroma server did not answer within {timeout_s:.0f}s")
+
+
+# ---------- workers ----------
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index: int, sock: socket.socket, app, args) -> None:
+    """
+    Child process body: a plain uvicorn server on the inherited socket. Never returns.
+    """
+    code = 0
+    try:
+        os.environ["TRIAGE_WORKER_ID"] = str(index)
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1):
+            signal.signal(sig, signal.SIG_DFL)
+        from app.services.groq_scheduler import groq_scheduler
+        groq_scheduler.split(args.workers)
+        config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"❌ Worker {index} crashed: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def memory_report(workers: Dict[int, int]) -> None:
+    rows = [("master", os.getpid())] + [(f"worker {i}", pid) for pid, i in sorted(workers.items(), key=lambda x: x[1])]
+    print(f"{'process':<10} {'pid':>7} {'rss_mb':>8} {'pss_mb':>8} {'shared_mb':>9} {'private_mb':>10}")
+    total_rss = total_pss = 0.0
+    for name, pid in rows:
+        m = memory_info(pid)
+        total_rss += m["rss_mb"] or 0.0
+        total_pss += m["pss_mb"] or 0.0
+        print(f"{name:<10} {pid:>7} {m['rss_mb'] or '-':>8} {m['pss_mb'] or '-':>8} "
+              f"{m['shared_mb'] or '-':>9} {m['private_mb'] or '-':>10}")
+    # RSS double-counts the shared weights; PSS is what the machine actually spends
+    print(f"{'total':<10} {'':>7} {total_rss:>8.1f} {total_pss:>8.1f}")
+
+
+def main(args) -> None:
+    if args.workers > 1 and RETRIEVER_BACKEND == "chroma" and CHROMA_MODE != "http":
+        sys.exit("❌ Several workers must not open one PersistentClient directory: set CHROMA_MODE=http")
+    if args.workers > 1 and CHAT_SESSION_STORE != "sqlite":
+        sys.exit("❌ Chat sessions would only exist in the worker that created them: set CHAT_SESSION_STORE=sqlite")
+    if args.workers > 1 and RETRIEVER_BACKEND == "numpy":
+        print("⚠️ RETRIEVER_BACKEND=numpy: each worker holds its own index; ingests reach the others on restart")
+
+    chroma_proc = start_chroma_server() if CHROMA_MODE == "http" and CHROMA_SERVER_LAUNCH else None
+
+    t0 = time.perf_counter()
+    from app.main import app  # imported once here so workers share the module pages too
+    if args.preload and EMBEDDING_BACKEND != "onnx":
+        from app.services.retrieval import preload_model
+        try:
+            timings = preload_model()
+            print(f"✅ Weights loaded before fork in {time.perf_counter() - t0:.1f}s ({timings})")
+        except Exception as e:
+            print(f"⚠️ Preload failed, workers will load the model themselves: {e}")
+    elif args.preload:
+        # onnxruntime sessions own thread pools, which do not survive fork()
+        print("⚠️ EMBEDDING_BACKEND=onnx is loaded per worker (sessions are not fork-safe)")
+    # Keep the GC from touching (and so un-sharing) every object inherited from the master
+    gc.collect()
+    gc.freeze()
+
+    # Identifies this server run in the guideline sync marker worker 0 writes for the others
+    os.environ["TRIAGE_SERVE_ID"] = f"{os.getpid()}-{time.time_ns()}"
+    sock = bind_socket(args.host, args.port)
+    workers: Dict[int, int] = {}
+    crashes: List[float] = []
+    state = {"stopping": False, "report": False}
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, sock, app, args)
+        workers[pid] = index
+
+    def on_stop(signum, frame):
+        state["stopping"] = True
+
+    def on_report(signum, frame):
+        state["report"] = True
+
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGUSR1, on_report)
+
+    for i in range(args.workers):
+        spawn(i)
+    print(f"✅ Serving on {args.host}:{args.port} with {args.workers} workers (master pid {os.getpid()})")
+
+    next_report = time.monotonic() + args.report_after
+    try:
+        while not state["stopping"]:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in workers:
+                index = workers.pop(pid)
+                crashes = [t for t in crashes if time.monotonic() - t < 60] + [time.monotonic()]
+                if len(crashes) > 3 * args.workers:
+                    print("❌ Workers keep exiting, giving up")
+                    break
+                print(f"⚠️ Worker {index} (pid {pid}) exited with status {status}, restarting")
+                spawn(index)
+            if state["report"] or time.monotonic() >= next_report:
+                state["report"] = False
+                memory_report(workers)
+                next_report = time.monotonic() + (SERVE_MEMORY_REPORT_S if SERVE_MEMORY_REPORT_S > 0 else float("inf"))
+            time.sleep(0.2)
+    finally:
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + args.graceful_timeout
+        while workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            workers.pop(pid, None) if pid else time.sleep(0.1)
+        for pid in workers:
+            os.kill(pid, signal.SIGKILL)
+        sock.close()
+        if chroma_proc is not None:
+            chroma_proc.terminate()
+            chroma_proc.wait(timeout=10)
+        print("✅ Server stopped")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    ap.add_argument("--host", default=SERVE_HOST)
+    ap.add_argument("--port", type=int, default=SERVE_PORT)
+    ap.add_argument("--no-preload", dest="preload", action="store_false", help="let each worker load the model")
+    ap.add_argument("--report-after", type=float, default=30.0, help="seconds before the first memory report")
+    ap.add_argument("--graceful-timeout", type=float, default=30.0)
+    ap.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout (s)")
+    ap.add_argument("--log-level", default="info")
+    main(ap.parse_args())
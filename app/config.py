@@ -4,20 +4,179 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use the same environment variable names and defaults as original
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Use the same environment variable names and defaults as original.
+# A missing GROQ_API_KEY no longer fails the import: /readyz reports it and Groq calls return 500.
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise RuntimeError("Missing GROQ_API_KEY in environment (.env).")
 
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")  # optional
 CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "guidelines")
+# "persistent" opens CHROMA_PATH in-process; "http" talks to a Chroma server (required for >1 worker)
+CHROMA_MODE = os.getenv("CHROMA_MODE", "persistent").strip().lower()
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
 
-GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_CHAT_URL = os.getenv("GROQ_CHAT_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_MODEL_REASON = "llama-3.3-70b-versatile"
 TEMPERATURE_REASON = 0.2
 TEMPERATURE_CHAT = 0.3
 HTTP_TIMEOUT = 90
 
+# Groq admission control (0 disables a limit; set them to the account's plan). Requests beyond the
+# budget queue by priority; a call that would wait longer than GROQ_MAX_QUEUE_WAIT_S, or finds
+# GROQ_MAX_QUEUE_DEPTH callers already queued, fails fast with 503 + Retry-After.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "0"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "0"))
+GROQ_MAX_QUEUE_WAIT_S = float(os.getenv("GROQ_MAX_QUEUE_WAIT_S", "30"))
+GROQ_MAX_QUEUE_DEPTH = int(os.getenv("GROQ_MAX_QUEUE_DEPTH", "256"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_RETRY_BASE_S = float(os.getenv("GROQ_RETRY_BASE_S", "0.5"))
+GROQ_HEDGE_AFTER_S = float(os.getenv("GROQ_HEDGE_AFTER_S", "0"))  # >0 enables hedged reasoning calls
+
+# Shared outbound HTTP client (Groq + n8n). Read/write default to HTTP_TIMEOUT.
+HTTP_HTTP2 = _env_bool("HTTP_HTTP2", True)  # only used when the `h2` package is installed
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", str(HTTP_TIMEOUT)))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", str(HTTP_TIMEOUT)))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+
+# Load and warm the embedding model and sync GUIDELINES_FILE in the background at startup
+# (otherwise on the first retrieval request; /readyz turns 200 after it)
+WARMUP_ON_STARTUP = _env_bool("WARMUP_ON_STARTUP", True)
+
+# Blocking embedding / Chroma work runs on a bounded thread pool; requests
+# beyond workers + queue depth are rejected with 503.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "16"))
+
+# Embedding backend: torch | torch-int8 | onnx | sentence-transformers.
+# The collection records which backend/model/dimension built it and refuses mismatches.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or None  # default depends on the backend
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # 0 = library default
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", os.path.join(CHROMA_PATH, "onnx"))
+# Texts are sorted by token length and embedded in sub-batches of this size (ingest/preload)
+EMBED_BULK_BATCH_SIZE = int(os.getenv("EMBED_BULK_BATCH_SIZE", "32"))
+
+# Retriever: "chroma" (persistent client) or "numpy" (exact in-memory index snapshotted to .npy).
+# RETRIEVER_SPACE=l2 keeps Chroma's default distance/ranking; float16 halves index memory
+# at ~10x query latency (upcast per query).
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma")
+RETRIEVER_SNAPSHOT_DIR = os.getenv("RETRIEVER_SNAPSHOT_DIR", os.path.join(CHROMA_PATH, "numpy_index"))
+RETRIEVER_SPACE = os.getenv("RETRIEVER_SPACE", "l2")
+RETRIEVER_DTYPE = os.getenv("RETRIEVER_DTYPE", "float32")
+
+# Micro-batching of concurrent retrieval-query embeddings into one padded forward pass
+EMBED_BATCHING = _env_bool("EMBED_BATCHING", True)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "16"))
+
+# Persistent content-addressed embedding cache (memory-mapped float32 rows + LRU)
+EMBED_CACHE_ENABLED = _env_bool("EMBED_CACHE_ENABLED", True)
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(CHROMA_PATH, "embedding_cache"))
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", "100000"))
+EMBED_CACHE_LRU_SIZE = int(os.getenv("EMBED_CACHE_LRU_SIZE", "2048"))
+
+# Optional TTL cache of /triage results (exact input) and of final reasoning (same query + guideline ids)
+RESULT_CACHE_ENABLED = _env_bool("RESULT_CACHE_ENABLED", False)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+# Guideline changes bump this file's mtime so every worker process drops its cached results
+RESULT_CACHE_GENERATION_FILE = os.getenv(
+    "RESULT_CACHE_GENERATION_FILE", os.path.join(CHROMA_PATH, "result_cache.generation")
+)
+
+# Speculative retrieval: query with the raw text while the analyzer runs, keep the
+# hits when the refined query's embedding re-scores the candidate pool to a similar top-5
+SPECULATIVE_RETRIEVAL = _env_bool("SPECULATIVE_RETRIEVAL", False)
+SPECULATIVE_POOL = int(os.getenv("SPECULATIVE_POOL", "15"))
+SPECULATIVE_MIN_OVERLAP = float(os.getenv("SPECULATIVE_MIN_OVERLAP", "0.6"))
+
+# Prompt context packing: token budgets (local estimate) per call type, near-duplicate threshold
+CONTEXT_BUDGET_REASONING = int(os.getenv("CONTEXT_BUDGET_REASONING", "1200"))
+CONTEXT_BUDGET_CHAT = int(os.getenv("CONTEXT_BUDGET_CHAT", "1500"))
+CONTEXT_CHAT_MAX_MESSAGES = int(os.getenv("CONTEXT_CHAT_MAX_MESSAGES", "12"))
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.85"))
+
+# Server-side chat sessions: LRU/TTL store, recent turns kept verbatim, older ones folded into a summary
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+CHAT_SESSION_KEEP_MESSAGES = int(os.getenv("CHAT_SESSION_KEEP_MESSAGES", "6"))
+CHAT_SESSION_SUMMARIZE_AFTER = int(os.getenv("CHAT_SESSION_SUMMARIZE_AFTER", "10"))
+CHAT_SESSION_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SESSION_SUMMARY_MAX_TOKENS", "250"))
+# "memory" (per process) or "sqlite": one file shared by every worker, required by app.cli.serve --workers > 1
+CHAT_SESSION_STORE = os.getenv("CHAT_SESSION_STORE", "memory").strip().lower()
+CHAT_SESSION_DB = os.getenv("CHAT_SESSION_DB", os.path.join(CHROMA_PATH, "chat_sessions.sqlite3"))
+
+# Local pre-analyzer: gazetteer match of guideline metadata + vocabulary; confident matches skip the Groq analyzer
+PRE_ANALYZER_ENABLED = _env_bool("PRE_ANALYZER_ENABLED", False)
+PRE_ANALYZER_VOCAB = os.getenv("PRE_ANALYZER_VOCAB", "datasource/clinical_vocabulary.json")
+PRE_ANALYZER_SOURCES = [p for p in os.getenv(
+    "PRE_ANALYZER_SOURCES", "guidelines.json,datasource/who_guidelines.json"
+).split(",") if p.strip()]
+PRE_ANALYZER_MIN_CONFIDENCE = float(os.getenv("PRE_ANALYZER_MIN_CONFIDENCE", "0.8"))
+PRE_ANALYZER_MAX_TOKENS = int(os.getenv("PRE_ANALYZER_MAX_TOKENS", "40"))
+# Distinct vocabulary findings (negated ones included) needed before the Groq analyzer is skipped
+PRE_ANALYZER_MIN_TERMS = int(os.getenv("PRE_ANALYZER_MIN_TERMS", "2"))
+
+# Prometheus /metrics, per-stage histograms and the Server-Timing header
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+
+# n8n handoffs: durable SQLite outbox drained by a background worker (202 + handoff id on enqueue)
+N8N_OUTBOX_PATH = os.getenv("N8N_OUTBOX_PATH", os.path.join(CHROMA_PATH, "n8n_outbox.sqlite3"))
+N8N_OUTBOX_CONCURRENCY = int(os.getenv("N8N_OUTBOX_CONCURRENCY", "4"))
+N8N_OUTBOX_BATCH_SIZE = int(os.getenv("N8N_OUTBOX_BATCH_SIZE", "1"))  # >1 posts {"handoffs": [...]} per request
+N8N_OUTBOX_MAX_ATTEMPTS = int(os.getenv("N8N_OUTBOX_MAX_ATTEMPTS", "8"))
+N8N_OUTBOX_RETRY_BASE_S = float(os.getenv("N8N_OUTBOX_RETRY_BASE_S", "2"))
+N8N_OUTBOX_RETRY_MAX_S = float(os.getenv("N8N_OUTBOX_RETRY_MAX_S", "600"))
+N8N_OUTBOX_POLL_S = float(os.getenv("N8N_OUTBOX_POLL_S", "1"))
+# A claimed handoff not resolved within the lease (worker died mid-delivery) is claimed again;
+# keep it above the HTTP timeout so a slow but live delivery is never sent twice
+N8N_OUTBOX_LEASE_S = float(os.getenv("N8N_OUTBOX_LEASE_S", "300"))
+
+# Streaming guideline ingest (/ingest-guidelines/stream, app.cli.ingest_guidelines): upsert batch size,
+# shortest text kept, and PDF limits (looser than the per-request triage ones)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_MIN_CHARS = int(os.getenv("INGEST_MIN_CHARS", "12"))
+INGEST_PDF_MAX_PAGES = int(os.getenv("INGEST_PDF_MAX_PAGES", "500"))
+INGEST_PDF_TIME_BUDGET_S = float(os.getenv("INGEST_PDF_TIME_BUDGET_S", "600"))
+
+# Coalesce concurrent identical requests (triage/analyzer by input hash, embeddings by query text)
+SINGLE_FLIGHT_ENABLED = _env_bool("SINGLE_FLIGHT_ENABLED", True)
+
+# Pre-fork server (python -m app.cli.serve): worker count, bind address, whether to start a local
+# Chroma server for CHROMA_MODE=http, and how often to log per-worker memory (0 = only at startup)
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("PORT", "8000"))
+CHROMA_SERVER_LAUNCH = _env_bool("CHROMA_SERVER_LAUNCH", True)
+SERVE_MEMORY_REPORT_S = float(os.getenv("SERVE_MEMORY_REPORT_S", "300"))
+
+# /triage/batch: max items per request and concurrent Groq calls per batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_GROQ_CONCURRENCY = int(os.getenv("BATCH_GROQ_CONCURRENCY", "4"))
+
+# PDF extraction: page-parallel process pool, adaptive OCR resolution, per-document budget
+# (PDF_MAX_PAGES=0: no page limit; pages past a limit or the budget are reported as skipped)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_OCR_LOW_DPI = int(os.getenv("PDF_OCR_LOW_DPI", "150"))
+PDF_OCR_HIGH_DPI = int(os.getenv("PDF_OCR_HIGH_DPI", "300"))
+PDF_OCR_MIN_CONFIDENCE = float(os.getenv("PDF_OCR_MIN_CONFIDENCE", "70"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+PDF_TIME_BUDGET_S = float(os.getenv("PDF_TIME_BUDGET_S", "60"))
+
 # Keep original default filename (note original had a typo "guidlines.json")
 GUIDELINES_FILE = os.getenv("GUIDELINES_FILE", "guidelines.json")
+# Records which GUIDELINES_FILE items (and content hashes) are already embedded in Chroma
+GUIDELINES_MANIFEST = os.getenv("GUIDELINES_MANIFEST", os.path.join(CHROMA_PATH, "guidelines_manifest.json"))
+# Written by app.cli.serve worker 0 once the guideline sync finished; the other workers stay unready until then
+GUIDELINES_SYNC_MARKER = os.getenv("GUIDELINES_SYNC_MARKER", os.path.join(CHROMA_PATH, "guidelines.synced"))
@@ -1,13 +1,54 @@
 # app/main.py
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import routers
-from app.routes import triage, chat, guidelines, n8n_handoff
-from app.routes.guidelines import preload_guidelines
+from app.routes import triage, chat, guidelines, n8n_handoff, ops
+from app.config import WARMUP_ON_STARTUP
+from app.services.http_client import start_http_client, close_http_client
+from app.services.metrics import MetricsMiddleware
+from app.services.outbox import start_outbox_worker, stop_outbox_worker
+from app.services.inference import inference_executor
+from app.services.pdf_extraction import shutdown_pdf_pool
+from app.services.retrieval import close_retrieval
+from app.services.startup import warm_up
+from app.utils import FastJSONResponse
+
 
-app = FastAPI(title="AI Triage System (Analyzer + BioGPT + Chroma + Llama/Groq)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"✅ App imported in {(time.perf_counter() - _import_started) * 1000:.0f} ms")
+    # One pooled keep-alive client per worker, shared by Groq and n8n calls
+    await start_http_client()
+    # n8n handoffs are drained from the durable outbox in the background
+    await start_outbox_worker()
+    # Model load + guideline sync run in the background; /readyz turns 200 when done
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up)) if WARMUP_ON_STARTUP else None
+    try:
+        yield
+    finally:
+        if warmup_task is not None and not warmup_task.done():
+            warmup_task.cancel()
+        await stop_outbox_worker()
+        await close_http_client()
+        inference_executor.shutdown()
+        shutdown_pdf_pool()
+        close_retrieval()
+
+
+# orjson-backed JSON bodies for every route (stdlib fallback when orjson is missing)
+app = FastAPI(
+    title="AI Triage System (Analyzer + BioGPT + Chroma + Llama/Groq)",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 # CORS for local Streamlit or web UIs
 app.add_middleware(
@@ -18,11 +59,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request metrics and the Server-Timing header
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(triage.router)
 app.include_router(chat.router)
 app.include_router(guidelines.router)
 app.include_router(n8n_handoff.router)
+app.include_router(ops.router)
 
 
 @app.get("/")
@@ -30,9 +75,5 @@ def root():
     return {"status": "ok", "service": "AI Triage API (Analyzer + BioGPT + Chroma + Llama/Groq)"}
 
 
-# Preload guidelines at startup
-preload_guidelines()
-
-
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=int(__import__("os").environ.get("PORT", "8000")), reload=True)
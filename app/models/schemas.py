@@ -9,6 +9,17 @@ class PatientInput(BaseModel):
     debug: Optional[bool] = False
 
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    text: Optional[str] = None
+    report: Optional[str] = None
+
+
+class BatchTriageRequest(BaseModel):
+    items: List[BatchItem] = Field(default_factory=list)
+    debug: Optional[bool] = False
+
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -17,6 +28,16 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     history: List[ChatMessage] = Field(default_factory=list)
     query: str
+    debug: Optional[bool] = False
+
+
+class ChatSessionCreate(BaseModel):
+    triage: Optional[Dict[str, Any]] = None
+
+
+class ChatSessionMessage(BaseModel):
+    query: str
+    debug: Optional[bool] = False
 
 
 class HandoffRequest(BaseModel):
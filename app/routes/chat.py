@@ -1,40 +1,109 @@
 # app/routes/chat.py
-from fastapi import APIRouter
-from app.models.schemas import ChatRequest
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.schemas import ChatRequest, ChatSessionCreate, ChatSessionMessage
 from app.services.groq import groq_chat
-from app.config import TEMPERATURE_CHAT
+from app.services.context_packer import estimate_tokens, pack_history
+from app.services.pipeline import format_sse
+from app.services.sessions import CHAT_SYSTEM_PROMPT, session_store, session_reply_events
+from app.config import TEMPERATURE_CHAT, CONTEXT_BUDGET_CHAT, CONTEXT_CHAT_MAX_MESSAGES, CHAT_SESSION_TTL
 
 router = APIRouter()
 
 
+def _small_talk(query: str) -> Optional[str]:
+    """
+    Canned replies for greetings/acknowledgements (no Groq call).
+    """
+    user_text = (query or "").strip().lower()
+    if user_text in {"hi", "hello", "hey"}:
+        return "Hello 👋 I’m your clinical triage assistant."
+    if user_text in {"ok", "okay", "thanks", "thank you"}:
+        return "You’re welcome ✅. Do you want more details about the triage?"
+    return None
+
+
 @router.post("/chat")
 async def chat_with_triage_assistant(req: ChatRequest):
-    user_text = (req.query or "").strip().lower()
-
     # Small-talk guardrails
-    if user_text in {"hi", "hello", "hey"}:
-        return {"reply": "Hello 👋 I’m your clinical triage assistant."}
-    if user_text in {"ok", "okay", "thanks", "thank you"}:
-        return {"reply": "You’re welcome ✅. Do you want more details about the triage?"}
+    canned = _small_talk(req.query)
+    if canned is not None:
+        return {"reply": canned}
 
-    # Look for triage result in history (added by frontend)
+    # Look for triage result in history (added by frontend); it is pinned in the
+    # packed history instead of being repeated in the system prompt
+    history = [{"role": m.role, "content": m.content} for m in req.history]
     last_triage = None
-    for m in reversed(req.history):
-        if m.role == "system" and "triage_result" in m.content:
-            last_triage = m.content
+    for i in range(len(history) - 1, -1, -1):
+        if history[i]["role"] == "system" and "triage_result" in history[i]["content"]:
+            last_triage = i
             break
 
-    system_msg = (
-        "You are a safe clinical assistant. You explain triage results, guidelines, "
-        "and medical concepts. NEVER provide personal medical advice or dosing."
+    system_msg = CHAT_SYSTEM_PROMPT
+    if last_triage is not None:
+        system_msg += "\n\nThe last triage result is in the conversation as a system message."
+
+    packed, context = pack_history(
+        history,
+        budget=max(0, CONTEXT_BUDGET_CHAT - estimate_tokens(system_msg) - estimate_tokens(req.query)),
+        max_messages=CONTEXT_CHAT_MAX_MESSAGES,
+        pinned=last_triage,
     )
-    if last_triage:
-        system_msg += f"\n\nContext: The last triage result was:\n{last_triage}"
+    if last_triage is not None:
+        # The triage result used to be sent twice (system prompt + history)
+        context["tokens_saved"] += estimate_tokens(history[last_triage]["content"])
 
-    messages = [{"role": "system", "content": system_msg}]
-    for m in req.history[-12:]:
-        messages.append({"role": m.role, "content": m.content})
+    messages = [{"role": "system", "content": system_msg}] + packed
     messages.append({"role": "user", "content": req.query})
 
     reply = await groq_chat(messages, temperature=TEMPERATURE_CHAT, max_tokens=600)
+    if req.debug:
+        return {"reply": reply, "context": context}
     return {"reply": reply}
+
+
+@router.post("/chat/sessions")
+async def create_chat_session(req: ChatSessionCreate):
+    """
+    Start a server-side conversation about a triage result; clients then send
+    only new messages to /chat/sessions/{session_id}/messages.
+    """
+    session = session_store.create(req.triage)
+    return {"session_id": session.id, "ttl_seconds": CHAT_SESSION_TTL}
+
+
+@router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    return session_store.require(session_id).snapshot()
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired chat session.")
+    return {"deleted": session_id}
+
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def post_chat_message(session_id: str, req: ChatSessionMessage):
+    """
+    Server-sent events: one `token` per reply delta, then `done` with the full
+    reply (plus prompt packing stats when debug=true). Failures after the
+    stream has started arrive as an `error` event and the turn is not recorded.
+    """
+    session = session_store.require(session_id)
+
+    async def events():
+        try:
+            async for event, data in session_reply_events(session, req.query, canned=_small_talk(req.query)):
+                if event == "done" and not req.debug:
+                    data = {k: v for k, v in data.items() if k != "context"}
+                yield format_sse(event, data)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            yield format_sse("error", {"status_code": 500, "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
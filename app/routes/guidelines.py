@@ -1,65 +1,212 @@
 # app/routes/guidelines.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import hashlib
 import os
 import json
-from app.services.retrieval import collection
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from app.services import retrieval
+from app.services.guideline_ingest import ingest_records, iter_records, legacy_record, ndjson_records, pdf_records
+from app.services.pipeline import format_sse
+from app.services.retrieval import get_collection, persist_collection
+from app.services.result_cache import invalidate_result_caches
+from app.services.metrics import record_timing
 from app.utils import _hash_id
-from app.config import GUIDELINES_FILE
+from app.config import GUIDELINES_FILE, GUIDELINES_MANIFEST, CHROMA_COLLECTION, RETRIEVER_BACKEND, INGEST_BATCH_SIZE
 
 router = APIRouter()
 
 
 @router.post("/ingest-guidelines")
-def ingest_guidelines(payload: dict):
+async def ingest_guidelines(payload: dict):
     """
     Payload:
     { "items": [
         {"id": "optional", "text": "guideline text", "metadata": {"source":"...", "level":"..."}}
       ]
     }
+    Items are upserted, so re-sending an id replaces it instead of failing.
+    Texts and ids are taken as sent (see /ingest-guidelines/stream for normalization).
     """
     items = payload.get("items", [])
     if not items:
         raise HTTPException(status_code=400, detail="No items provided.")
-    ids, docs, metas = [], [], []
-    for it in items:
-        text = (it.get("text") or "").strip()
-        if not text:
-            continue
-        gid = (it.get("id") or _hash_id(text)).strip()
-        ids.append(gid)
-        docs.append(text)
-        metas.append(it.get("metadata") or {})
-    if not ids:
+    summary: Dict[str, Any] = {}
+    async for summary in ingest_records(iter_records(items), normalize=legacy_record):
+        pass
+    if not summary.get("upserted"):
         raise HTTPException(status_code=400, detail="No valid guideline texts.")
-    collection.add(ids=ids, documents=docs, metadatas=metas)
-    return {"ingested": len(ids)}
+    return {"ingested": summary["upserted"], "seconds": summary["seconds"], "docs_per_sec": summary["docs_per_sec"]}
+
+
+async def _spool_body(request: Request) -> tempfile.SpooledTemporaryFile:
+    # The streaming response also listens on receive(), so the body is drained first;
+    # past 8 MB it spills to disk, keeping memory bounded for large corpora
+    spool = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def _spooled_chunks(spool, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            chunk = spool.read(size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+async def _ingest_events(records, batch_size: int, source: Optional[str]) -> AsyncIterator[str]:
+    try:
+        async for progress in ingest_records(records, batch_size=batch_size, source=source):
+            yield format_sse("done" if progress["done"] else "progress", progress)
+    except HTTPException as e:
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        yield format_sse("error", {"status_code": 500, "detail": str(e)})
+
+
+@router.post("/ingest-guidelines/stream")
+async def ingest_guidelines_stream(
+    request: Request,
+    source: Optional[str] = Query(default=None, description="source metadata for items without one"),
+    batch_size: int = Query(default=INGEST_BATCH_SIZE, ge=1, le=1024),
+):
+    """
+    Bulk ingest from the raw request body:
+    - application/x-ndjson: one guideline item per line, parsed line by line
+    - application/pdf: a triage guideline PDF; every line naming a triage level becomes an item
+    Items are embedded and upserted in batches of `batch_size`. Progress is streamed
+    as server-sent `progress` events (one per batch), then `done` with docs/sec.
+    """
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type == "application/pdf":
+        data = await request.body()
+        if not data:
+            raise HTTPException(status_code=400, detail="Empty PDF file.")
+        records = pdf_records(data, source or "upload.pdf")
+    elif content_type in ("application/x-ndjson", "application/jsonl", "application/json-seq", "text/plain"):
+        records = ndjson_records(_spooled_chunks(await _spool_body(request)), source)
+    else:
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson or application/pdf.")
+    return StreamingResponse(
+        _ingest_events(records, batch_size, source),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _embedding_signature() -> str:
+    return "|".join(str(v) for v in retrieval.embedding_info.values())
+
+
+def _content_hash(text: str, metadata: Dict[str, Any]) -> str:
+    # The embedding signature is part of the hash: a new backend/pooling re-embeds the file once
+    payload = text + "\x1f" + json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+    return _hash_id(payload + "\x1f" + _embedding_signature())
+
+
+def _load_manifest() -> Dict[str, Any]:
+    try:
+        with open(GUIDELINES_MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(GUIDELINES_MANIFEST) or ".", exist_ok=True)
+    tmp = GUIDELINES_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, GUIDELINES_MANIFEST)
 
 
 def preload_guidelines():
     """
-    Auto-load the GUIDELINES_FILE at startup (keeps the original filename default).
+    Sync GUIDELINES_FILE into the collection at startup (keeps the original filename default).
+    Only new or changed items are embedded, items dropped from the file are deleted, and
+    a manifest of content hashes makes a warm restart with an unchanged file a no-op.
     """
     if not os.path.exists(GUIDELINES_FILE):
         print(f"⚠️ No {GUIDELINES_FILE} found, skipping preload")
         return
+    collection = get_collection()
+    if retrieval.embedding_mismatch:
+        print(f"⚠️ Embedding backend mismatch, skipping preload of {GUIDELINES_FILE}")
+        return
+    t0 = time.perf_counter()
     try:
-        with open(GUIDELINES_FILE, "r", encoding="utf-8") as f:
-            items = json.load(f)
+        with open(GUIDELINES_FILE, "rb") as f:
+            raw = f.read()
+        file_hash = hashlib.sha256(raw).hexdigest()
+        manifest = _load_manifest()
+        previous: Dict[str, str] = manifest.get("items") or {}
+
+        # Fast path: same file, same collection, nothing missing from the store
+        if (
+            manifest.get("file_hash") == file_hash
+            and manifest.get("collection") == CHROMA_COLLECTION
+            and manifest.get("retriever") == RETRIEVER_BACKEND
+            and manifest.get("embedding") == _embedding_signature()
+            and collection.count() >= len(previous)
+        ):
+            elapsed = (time.perf_counter() - t0) * 1000
+            print(f"✅ {GUIDELINES_FILE} unchanged ({len(previous)} guidelines), nothing to embed [{elapsed:.0f} ms]")
+            return
+
+        items = json.loads(raw.decode("utf-8"))
         if not isinstance(items, list):
             print(f"⚠️ {GUIDELINES_FILE} is not a list, skipping preload")
             return
-        ids, docs, metas = [], [], []
+        wanted: Dict[str, Tuple[str, Dict[str, Any], str]] = {}
         for it in items:
             text = (it.get("text") or "").strip()
             if not text:
                 continue
             gid = (it.get("id") or _hash_id(text)).strip()
-            ids.append(gid)
-            docs.append(text)
-            metas.append(it.get("metadata") or {})
-        if ids:
-            collection.add(ids=ids, documents=docs, metadatas=metas)
-            print(f"✅ Preloaded {len(ids)} guidelines from {GUIDELINES_FILE}")
+            meta = it.get("metadata") or {}
+            wanted[gid] = (text, meta, _content_hash(text, meta))
+
+        stored = set(collection.get(ids=list(wanted), include=[])["ids"]) if wanted else set()
+        changed = [gid for gid, (_, _, h) in wanted.items() if gid not in stored or previous.get(gid) != h]
+        removed = [gid for gid in previous if gid not in wanted]
+
+        if removed:
+            collection.delete(ids=removed)
+        t_embed = time.perf_counter()
+        if changed:
+            collection.upsert(
+                ids=changed,
+                documents=[wanted[gid][0] for gid in changed],
+                metadatas=[wanted[gid][1] for gid in changed],
+            )
+        embed_s = time.perf_counter() - t_embed
+        if changed:
+            record_timing("guideline_ingest", embed_s)
+        if removed or changed:
+            persist_collection()
+            invalidate_result_caches()
+        _save_manifest({
+            "file": os.path.abspath(GUIDELINES_FILE),
+            "file_hash": file_hash,
+            "collection": CHROMA_COLLECTION,
+            "retriever": RETRIEVER_BACKEND,
+            "embedding": _embedding_signature(),
+            "items": {gid: h for gid, (_, _, h) in wanted.items()},
+        })
+        elapsed = (time.perf_counter() - t0) * 1000
+        rate = f", {len(changed) / embed_s:.1f} docs/s" if changed and embed_s else ""
+        print(
+            f"✅ Synced {GUIDELINES_FILE}: {len(changed)} embedded, {len(removed)} removed, "
+            f"{len(wanted) - len(changed)} unchanged [{elapsed:.0f} ms{rate}]"
+        )
     except Exception as e:
         print(f"❌ Error loading {GUIDELINES_FILE}: {e}")
@@ -1,16 +1,21 @@
 # app/routes/n8n_handoff.py
+import asyncio
+
 from fastapi import APIRouter, HTTPException
-import httpx
 from app.models.schemas import HandoffRequest
-from app.config import N8N_WEBHOOK_URL, HTTP_TIMEOUT
+from app.config import N8N_WEBHOOK_URL
+from app.utils import FastJSONResponse
+from app.services.outbox import enqueue_handoff, n8n_outbox, n8n_worker
 
 router = APIRouter()
 
 
-@router.post("/handoff-n8n")
+@router.post("/handoff-n8n", status_code=202)
 async def handoff_to_n8n(req: HandoffRequest):
     """
     Optional: hand off the triage JSON + patient info to an n8n webhook.
+    The handoff is stored in the durable outbox and delivered in the background;
+    poll GET /handoff-n8n/{handoff_id} for the delivery state.
     """
     if not N8N_WEBHOOK_URL:
         raise HTTPException(status_code=500, detail="Missing N8N_WEBHOOK_URL in .env")
@@ -20,18 +25,42 @@ async def handoff_to_n8n(req: HandoffRequest):
         "triage": req.triage,
         "instruction": req.instruction,
     }
-    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-        try:
-            r = await client.post(N8N_WEBHOOK_URL, json=payload)
-            if r.status_code != 200:
-                # Surface n8n error message clearly
-                raise HTTPException(status_code=500, detail=f"n8n error: {r.text}")
-            # Return n8n JSON (if any)
-            try:
-                return r.json()
-            except Exception:
-                return {"status": "ok", "message": "Handoff sent to n8n."}
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error calling n8n: {str(e)}")
+    try:
+        handoff_id = await enqueue_handoff(payload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queuing n8n handoff: {str(e)}")
+    return FastJSONResponse(
+        {"handoff_id": handoff_id, "status": "queued"},
+        status_code=202,
+        headers={"Location": f"/handoff-n8n/{handoff_id}"},
+    )
+
+
+@router.get("/handoff-n8n/dead-letters")
+async def handoff_dead_letters(limit: int = 50):
+    """
+    Handoffs that exhausted their retries, newest first.
+    """
+    return {"dead": await asyncio.to_thread(n8n_outbox.dead_letters, limit)}
+
+
+@router.get("/handoff-n8n/{handoff_id}")
+async def handoff_status(handoff_id: str):
+    """
+    Delivery state of a queued handoff: pending, in_flight, delivered or dead.
+    """
+    item = await asyncio.to_thread(n8n_outbox.get, handoff_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Unknown handoff id")
+    return item
+
+
+@router.post("/handoff-n8n/{handoff_id}/retry", status_code=202)
+async def retry_handoff(handoff_id: str):
+    """
+    Re-queue a dead-lettered handoff with a fresh attempt budget.
+    """
+    if not await asyncio.to_thread(n8n_outbox.requeue, handoff_id):
+        raise HTTPException(status_code=409, detail="Handoff is not in the dead-letter queue")
+    n8n_worker.notify()
+    return {"handoff_id": handoff_id, "status": "queued"}
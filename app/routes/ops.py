@@ -0,0 +1,60 @@
+# app/routes/ops.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.groq_scheduler import groq_scheduler
+from app.services.inference import inference_executor
+from app.services.metrics import render_metrics
+from app.services.outbox import outbox_stats
+from app.services.process_memory import process_stats
+from app.services.result_cache import result_cache_stats
+from app.services.retrieval import retrieval_stats
+from app.services.sessions import session_store
+from app.services.single_flight import single_flight_stats
+from app.services.pre_analyzer import pre_analyzer
+from app.services.startup import startup_state
+from app.utils import FastJSONResponse
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+def healthz():
+    """
+    Liveness: the process is up and serving (models may still be loading).
+    """
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+def readyz():
+    """
+    Readiness: embedding model loaded and guideline collection synced.
+    """
+    body = startup_state.snapshot()
+    return FastJSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@router.get("/stats")
+def service_stats():
+    """
+    Queue depths, wait times and cache counters of the shared services.
+    """
+    return {
+        "groq": groq_scheduler.stats(),
+        "inference": inference_executor.stats(),
+        "retrieval": retrieval_stats(),
+        "result_cache": result_cache_stats(),
+        "chat_sessions": session_store.stats(),
+        "pre_analyzer": pre_analyzer.stats(),
+        "n8n_outbox": outbox_stats(),
+        "single_flight": single_flight_stats(),
+        "process": process_stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text exposition of the stage/Groq/PDF histograms and counters.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,53 +1,66 @@
 # app/routes/triage.py
+import asyncio
+from typing import AsyncIterator, List
 from fastapi import APIRouter, UploadFile, File, Query, HTTPException
-from typing import List
-from app.models.schemas import PatientInput
-from app.services.analyzer import run_report_analyzer
-from app.services.retrieval import collection
-from app.services.reasoning import run_final_reasoning
-from app.utils import extract_text_from_pdf_bytes, build_retrieval_query_from_analyzer
+from fastapi.responses import StreamingResponse
+from app.models.schemas import PatientInput, BatchTriageRequest
+from app.services.pdf_extraction import extract_upload_text, iter_pdf_pages
+from app.services.pipeline import run_triage_pipeline, stream_triage_pipeline, run_triage_batch, format_sse
+from app.utils import extract_text_from_upload
+from app.config import BATCH_MAX_ITEMS
 
 router = APIRouter()
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _input_text(input_data: PatientInput) -> str:
+    raw_text = ((input_data.text or "") + "\n" + (input_data.report or "")).strip()
+    if not raw_text:
+        raise HTTPException(status_code=400, detail="No input text or report provided.")
+    return raw_text
+
+
+async def _upload_text(file: UploadFile) -> str:
+    return await extract_upload_text(file.filename, await file.read())
+
+
+async def _stream_upload(filename: str, data: bytes, debug: bool) -> AsyncIterator[str]:
+    """
+    PDF pages are streamed as `page` events while they are extracted, then the triage stages follow.
+    """
+    if not filename.lower().endswith(".pdf") or not data:
+        try:
+            raw_text = extract_text_from_upload(filename, data)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+    else:
+        texts: List[str] = []
+        try:
+            async for page in iter_pdf_pages(data):
+                texts.append(page["text"])
+                meta = {k: v for k, v in page.items() if k != "text"}
+                meta["chars"] = len(page["text"])
+                yield format_sse("page", meta)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        raw_text = "\n\n".join([t for t in texts if t])
+        if not raw_text.strip():
+            yield format_sse("error", {"status_code": 400, "detail": "No text extracted from PDF."})
+            return
+    async for chunk in stream_triage_pipeline(raw_text, debug=debug):
+        yield chunk
+
 
 @router.post("/triage")
 async def triage_patient(input_data: PatientInput):
     """
     Full triage pipeline for raw text.
     """
-    raw_text = ((input_data.text or "") + "\n" + (input_data.report or "")).strip()
-    if not raw_text:
-        raise HTTPException(status_code=400, detail="No input text or report provided.")
-
-    # 1) Analyzer
-    analyzer_json = await run_report_analyzer(raw_text)
-
-    # 2) Retrieval
-    retrieval_query = build_retrieval_query_from_analyzer(analyzer_json, raw_text)
-    results = collection.query(query_texts=[retrieval_query], n_results=5)
-
-    guideline_snippets: List[str] = []
-    guideline_ids: List[str] = []
-    if results and results.get("documents"):
-        docs = results["documents"][0] or []
-        ids_ = results.get("ids", [[]])[0] or []
-        for d, gid in zip(docs, ids_):
-            if d and str(d).strip():
-                guideline_snippets.append(d)
-                guideline_ids.append(gid)
-
-    # 3) Final reasoning
-    triage_json = await run_final_reasoning(analyzer_json, guideline_snippets)
-
-    if input_data.debug:
-        return {
-            "triage": triage_json,
-            "analyzer": analyzer_json,
-            "retrieval_query": retrieval_query,
-            "guideline_ids": guideline_ids,
-            "guideline_snippets": guideline_snippets[:3],
-        }
-    return triage_json
+    raw_text = _input_text(input_data)
+    return await run_triage_pipeline(raw_text, debug=bool(input_data.debug))
 
 
 @router.post("/triage-upload")
@@ -55,45 +68,72 @@ async def triage_upload(file: UploadFile = File(...), debug: bool = Query(defaul
     """
     Triage for uploaded .txt or .pdf.
     """
-    fname = file.filename.lower()
-    if fname.endswith(".txt"):
-        raw_text = (await file.read()).decode("utf-8", errors="ignore")
-    elif fname.endswith(".pdf"):
-        pdf_bytes = await file.read()
-        if not pdf_bytes:
-            raise HTTPException(status_code=400, detail="Empty PDF file.")
-        raw_text = extract_text_from_pdf_bytes(pdf_bytes)
-        if not raw_text.strip():
-            raise HTTPException(status_code=400, detail="No text extracted from PDF.")
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file type. Use .txt or .pdf")
-
-    # 1) Analyzer
-    analyzer_json = await run_report_analyzer(raw_text)
-
-    # 2) Retrieval
-    retrieval_query = build_retrieval_query_from_analyzer(analyzer_json, raw_text)
-    results = collection.query(query_texts=[retrieval_query], n_results=5)
-
-    guideline_snippets: List[str] = []
-    guideline_ids: List[str] = []
-    if results and results.get("documents"):
-        docs = results["documents"][0] or []
-        ids_ = results.get("ids", [[]])[0] or []
-        for d, gid in zip(docs, ids_):
-            if d and str(d).strip():
-                guideline_snippets.append(d)
-                guideline_ids.append(gid)
-
-    # 3) Final reasoning
-    triage_json = await run_final_reasoning(analyzer_json, guideline_snippets)
-
-    if debug:
-        return {
-            "triage": triage_json,
-            "analyzer": analyzer_json,
-            "retrieval_query": retrieval_query,
-            "guideline_ids": guideline_ids,
-            "guideline_snippets": guideline_snippets[:3],
-        }
-    return triage_json
+    raw_text = await _upload_text(file)
+    return await run_triage_pipeline(raw_text, debug=debug)
+
+
+@router.post("/triage/stream")
+async def triage_patient_stream(input_data: PatientInput):
+    """
+    Same as /triage, streamed as server-sent events per pipeline stage.
+    """
+    raw_text = _input_text(input_data)
+    return StreamingResponse(
+        stream_triage_pipeline(raw_text, debug=bool(input_data.debug)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.post("/triage-upload/stream")
+async def triage_upload_stream(file: UploadFile = File(...), debug: bool = Query(default=False)):
+    """
+    Same as /triage-upload, streamed as server-sent events: one `page` event per
+    extracted PDF page, then the pipeline stages.
+    """
+    data = await file.read()  # read before streaming: the upload is closed afterwards
+    return StreamingResponse(
+        _stream_upload(file.filename or "", data, debug),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+def _check_batch_size(n: int) -> None:
+    if not n:
+        raise HTTPException(status_code=400, detail="No items provided.")
+    if n > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items ({n} > {BATCH_MAX_ITEMS}).")
+
+
+@router.post("/triage/batch")
+async def triage_batch(req: BatchTriageRequest):
+    """
+    Triage many texts in one call. Results come back in input order with per-item errors.
+    """
+    _check_batch_size(len(req.items))
+    texts = []
+    for it in req.items:
+        raw_text = ((it.text or "") + "\n" + (it.report or "")).strip()
+        texts.append(raw_text or HTTPException(status_code=400, detail="No input text or report provided."))
+    results = await run_triage_batch(texts, debug=bool(req.debug))
+    for it, res in zip(req.items, results):
+        res["id"] = it.id
+    return {"results": results}
+
+
+@router.post("/triage-upload/batch")
+async def triage_upload_batch(files: List[UploadFile] = File(...), debug: bool = Query(default=False)):
+    """
+    Triage many uploaded .txt/.pdf files; PDF pages are extracted in parallel in the process pool.
+    """
+    _check_batch_size(len(files))
+    payloads = [(f.filename, await f.read()) for f in files]
+    texts = await asyncio.gather(
+        *(extract_upload_text(name, data) for name, data in payloads),
+        return_exceptions=True,
+    )
+    results = await run_triage_batch(list(texts), debug=debug)
+    for (name, _), res in zip(payloads, results):
+        res["id"] = name
+    return {"results": results}
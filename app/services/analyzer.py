@@ -1,7 +1,14 @@
 # app/services/analyzer.py
-from typing import Dict, Any
+import copy
+import time
+from typing import Dict, Any, Tuple
 from app.services.groq import groq_chat
+from app.services.groq_scheduler import PRIORITY_ANALYZER
+from app.services.pre_analyzer import pre_analyzer
+from app.services.result_cache import input_cache_key
+from app.services.single_flight import analyzer_flight
 from app.utils import extract_json_from_text
+from app.config import PRE_ANALYZER_ENABLED
 
 
 async def run_report_analyzer(raw_text: str) -> Dict[str, Any]:
@@ -12,6 +19,44 @@ async def run_report_analyzer(raw_text: str) -> Dict[str, Any]:
       - diagnoses: list[str]
     Always returns a dict with those keys (lists).
     """
+    data, _ = await analyze_report(raw_text)
+    return data
+
+
+async def analyze_report(raw_text: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    run_report_analyzer plus how it was answered: with PRE_ANALYZER_ENABLED a
+    confident local gazetteer match skips the Groq call. Returns (data, info)
+    with info = {"source": "local"|"groq", "confidence", "local_ms", "groq_ms"}.
+    Concurrent calls for the same (normalized) text share one analysis.
+    """
+    (data, info), shared = await analyzer_flight.do(input_cache_key(raw_text), lambda: _analyze_report(raw_text))
+    if shared:
+        return copy.deepcopy(data), {**info, "coalesced": True}
+    return data, info
+
+
+async def _analyze_report(raw_text: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    info: Dict[str, Any] = {"source": "groq", "confidence": None, "local_ms": 0.0, "groq_ms": None}
+    if PRE_ANALYZER_ENABLED:
+        local = pre_analyzer.analyze(raw_text)
+        info["confidence"] = local["confidence"]
+        info["local_ms"] = local["ms"]
+        if local["confident"]:
+            info["source"] = "local"
+            info["negated"] = local["negated"]
+            pre_analyzer.record(skipped=True, local_ms=local["ms"])
+            return local["result"], info
+
+    t0 = time.perf_counter()
+    data = await _groq_analyzer(raw_text)
+    info["groq_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    if PRE_ANALYZER_ENABLED:
+        pre_analyzer.record(skipped=False, local_ms=info["local_ms"], groq_ms=info["groq_ms"])
+    return data, info
+
+
+async def _groq_analyzer(raw_text: str) -> Dict[str, Any]:
     sys_prompt = (
         "You are a medical report analyzer. "
         "Return ONLY a valid JSON object (no markdown, no code fences) with keys:\n"
@@ -25,6 +70,7 @@ async def run_report_analyzer(raw_text: str) -> Dict[str, Any]:
         temperature=0.1,
         max_tokens=400,
         force_json=True,  # <- Enforce pure JSON
+        priority=PRIORITY_ANALYZER,
     )
 
     data = extract_json_from_text(content) or {"symptoms": [], "risk_factors": [], "diagnoses": []}
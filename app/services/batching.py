@@ -0,0 +1,79 @@
+# app/services/batching.py
+import asyncio
+from typing import Callable, List, Optional, Set, Tuple
+
+from app.services.inference import InferenceExecutor
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching scheduler: concurrent embed() calls arriving within
+    `window_ms` (or until `max_batch` texts are queued) share one padded
+    forward pass on the inference executor; each caller gets its own vector.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        executor: InferenceExecutor,
+        window_ms: float = 5.0,
+        max_batch: int = 16,
+    ):
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()  # strong refs: the loop only keeps weak ones
+        self.batches = 0
+        self.items = 0
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch or self.window == 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed(t) for t in texts)))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch:]
+            # Callers that gave up while waiting don't need a slot in the batch
+            batch = [(t, f) for t, f in batch if not f.done()]
+            if batch:
+                task = asyncio.ensure_future(self._run(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(t for t, _ in batch))  # identical queries embed once
+        try:
+            vectors = await self.executor.run(self.embed_fn, texts)
+        except BaseException as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        by_text = dict(zip(texts, vectors))
+        for t, fut in batch:
+            if not fut.done():
+                fut.set_result(by_text[t])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
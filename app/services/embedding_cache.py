@@ -0,0 +1,251 @@
+# app/services/embedding_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.services.metrics import CACHE_LOOKUPS
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, size-bounded embedding store.
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`), with
+    `index.json` mapping key -> row in least-recently-used order. Disk hits
+    are zero-copy: the returned array is a view of the mmap row. A hit makes
+    its row the most recently used, so it is only overwritten after
+    `max_rows` - 1 newer puts; callers that keep a vector longer than one
+    request must copy it. A small in-process LRU keeps the hottest vectors as
+    resident float32 arrays. When `max_rows` is reached the least recently
+    used row is overwritten.
+
+    index.json is only rewritten every `flush_every` puts, so each row also
+    records a tag of the key it holds (`keys.u64`, written with the vector).
+    A read whose tag does not match, e.g. a row reused after an eviction that
+    the persisted index never saw, is a miss rather than another text's vector.
+    """
+
+    def __init__(self, path: str, max_rows: int = 100_000, lru_size: int = 2048, flush_every: int = 256):
+        self.path = path
+        self.max_rows = max(1, max_rows)
+        self.lru_size = max(0, lru_size)
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._matrix: Optional[np.memmap] = None
+        self._tags: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._dirty = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ---------- keys ----------
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def _tag(key: str) -> int:
+        return int(key[:16], 16) | 1  # never 0, which marks an unwritten row
+
+    # ---------- persistence ----------
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _tags_file(self) -> str:
+        return os.path.join(self.path, "keys.u64")
+
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def _load(self) -> None:
+        try:
+            with open(self._index_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        dim, capacity = state.get("dim"), state.get("capacity", 0)
+        if not dim or not capacity or not os.path.exists(self._vectors_file):
+            return
+        self._dim = int(dim)
+        self._open(int(capacity))
+        rows = state.get("rows") or {}
+        for key, row in rows.items():  # stored in LRU order
+            if 0 <= row < self._capacity:
+                self._index[key] = row
+        used = set(self._index.values())
+        self._free = [r for r in range(self._capacity - 1, -1, -1) if r not in used]
+
+    def _open(self, capacity: int) -> None:
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._tags.flush()
+        for path, nbytes in ((self._vectors_file, capacity * self._dim * 4), (self._tags_file, capacity * 8)):
+            with open(path, "ab") as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+        self._matrix = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        self._tags = np.memmap(self._tags_file, dtype=np.uint64, mode="r+", shape=(capacity,))
+        self._free = list(range(capacity - 1, self._capacity - 1, -1)) + self._free
+        self._capacity = capacity
+
+    def _flush_locked(self) -> None:
+        if self._matrix is None:
+            return
+        self._matrix.flush()
+        self._tags.flush()
+        tmp = self._index_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "capacity": self._capacity, "rows": self._index}, f)
+        os.replace(tmp, self._index_file)
+        self._dirty = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    # ---------- lookups ----------
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        if not self.lru_size:
+            return
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    if key in self._index:
+                        self._index.move_to_end(key)
+                    self.hits_memory += 1
+                    out.append(vec)
+                    continue
+                row = self._index.get(key)
+                if row is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                if int(self._tags[row]) != self._tag(key):
+                    # Row was reused for another key after the index was last persisted
+                    del self._index[key]
+                    self._free.append(row)
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self._index.move_to_end(key)
+                vec = self._matrix[row].view(np.ndarray)  # mmap view, no copy
+                self._remember(key, vec)  # dropped from the LRU before its row can be reused
+                self.hits_disk += 1
+                out.append(vec)
+        return out
+
+    def put_many(self, keys: List[str], vectors: List[Any]) -> None:
+        with self._lock:
+            for key, vec in zip(keys, vectors):
+                arr = np.asarray(vec, dtype=np.float32)
+                if self._dim is None:
+                    self._dim = int(arr.shape[0])
+                    self._open(min(1024, self.max_rows))
+                if arr.shape[0] != self._dim:
+                    continue  # different model dimension: never mix rows
+                row = self._index.get(key)
+                if row is None:
+                    row = self._allocate_locked()
+                self._tags[row] = 0  # a crash mid-write leaves the row unclaimed, not mislabelled
+                self._matrix[row] = arr
+                self._tags[row] = self._tag(key)
+                self._index[key] = row
+                self._index.move_to_end(key)
+                self._remember(key, arr)
+                self._dirty += 1
+            if self._dirty >= self.flush_every:
+                self._flush_locked()
+
+    def _allocate_locked(self) -> int:
+        if not self._free and self._capacity < self.max_rows:
+            self._open(min(self.max_rows, self._capacity * 2))
+        if self._free:
+            return self._free.pop()
+        old_key, row = self._index.popitem(last=False)
+        self._lru.pop(old_key, None)
+        self.evictions += 1
+        return row
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "entries": len(self._index),
+                "max_rows": self.max_rows,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedEmbeddingFunction:
+    """
+    Drop-in wrapper around an embedding function: only texts missing from the
+    cache reach the model. Every vector comes back as a float32 array (cache
+    hits without a copy), which is what Chroma and NumpyIndex work on. The key
+    namespace is backend + model name + max_length + pooling mode, so
+    changing any of them never returns stale vectors.
+    """
+
+    def __init__(self, inner: Callable[[List[str]], List[List[float]]], cache: EmbeddingCache):
+        self.inner = inner
+        self.cache = cache
+        self.namespace = "|".join(
+            str(getattr(inner, attr, "")) for attr in ("backend", "model_name", "max_length", "pooling")
+        )
+
+    def __call__(self, input: List[str]) -> List[Any]:
+        if not isinstance(input, list):
+            input = [str(input)]
+        keys = [self.cache.make_key(self.namespace, t) for t in input]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        CACHE_LOOKUPS.inc(len(keys) - len(missing), cache="embedding", result="hit")
+        CACHE_LOOKUPS.inc(len(missing), cache="embedding", result="miss")
+        if missing:
+            if len(set(keys)) > self.cache.max_rows:
+                # This call's own puts could reuse the rows the hits point at
+                vectors = [np.array(v) if v is not None else None for v in vectors]
+            # Embed each distinct missing text once
+            texts = list(dict.fromkeys(input[i] for i in missing))
+            fresh = {t: np.asarray(v, dtype=np.float32) for t, v in zip(texts, self.inner(texts))}
+            self.cache.put_many([self.cache.make_key(self.namespace, t) for t in texts], [fresh[t] for t in texts])
+            for i in missing:
+                vectors[i] = fresh[input[i]]
+        return vectors
+
+    def name(self) -> str:
+        return self.inner.name()
+
+    def __getattr__(self, item):
+        # model_name / device etc. of the wrapped function
+        if item in {"inner", "cache", "namespace"}:
+            raise AttributeError(item)
+        return getattr(self.inner, item)
@@ -1,32 +1,239 @@
 # app/services/embeddings.py
-from typing import List, Optional
+import os
+from typing import Callable, Dict, List, Optional
 import torch
 from transformers import AutoTokenizer, AutoModel
 
+DEFAULT_MODELS: Dict[str, str] = {
+    "torch": "microsoft/biogpt",
+    "torch-int8": "microsoft/biogpt",
+    "onnx": "microsoft/biogpt",
+    "sentence-transformers": "sentence-transformers/all-MiniLM-L6-v2",
+}
+
+
+def length_bucketed(
+    texts: List[str],
+    tokenizer,
+    max_length: int,
+    batch_size: int,
+    run_batch: Callable[[Dict[str, List[List[int]]]], List[List[float]]],
+) -> List[List[float]]:
+    """
+    Tokenize once, sort by token length and run fixed-size sub-batches so each
+    one is padded only to its own longest member; vectors come back in input order.
+    """
+    enc = tokenizer(texts, truncation=True, max_length=max_length)
+    order = sorted(range(len(texts)), key=lambda i: len(enc["input_ids"][i]))
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    for start in range(0, len(order), max(1, batch_size)):
+        idx = order[start:start + batch_size]
+        batch = {k: [enc[k][i] for i in idx] for k in ("input_ids", "attention_mask")}
+        for i, vec in zip(idx, run_batch(batch)):
+            out[i] = vec
+    return out
+
+
+def _set_torch_threads(threads: Optional[int]) -> None:
+    """
+    Pin intra-op threads explicitly (0/None keeps torch's default of one per core).
+    """
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # can only be set before the first parallel op
+
 
 class BioGPTEmbeddingFunction:
-    def __init__(self, model_name: str = "microsoft/biogpt", device: Optional[str] = None):
+    """
+    Eager full-precision PyTorch backend (the original behaviour).
+    """
+    backend = "torch"
+
+    def __init__(
+        self,
+        model_name: str = "microsoft/biogpt",
+        device: Optional[str] = None,
+        threads: Optional[int] = None,
+        batch_size: int = 32,
+    ):
+        _set_torch_threads(threads)
         self.model_name = model_name
+        self.max_length = 512
+        self.pooling = "masked_mean"  # part of the embedding cache key
+        self.batch_size = batch_size
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModel.from_pretrained(model_name).to(self.device)
         self.model.eval()
+        self.dimension = int(self.model.config.hidden_size)
+
+    def _run_batch(self, batch: Dict[str, List[List[int]]]) -> List[List[float]]:
+        enc = self.tokenizer.pad(batch, padding=True, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            out = self.model(**enc).last_hidden_state          # [B, T, H]
+            # Mean-pool over real tokens only (padding would skew short texts)
+            mask = enc["attention_mask"].unsqueeze(-1).to(out.dtype)
+            emb = (out * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)  # [B, H]
+            return emb.cpu().tolist()
 
     def __call__(self, input: List[str]) -> List[List[float]]:
         if not isinstance(input, list):
             input = [str(input)]
-        with torch.no_grad():
-            enc = self.tokenizer(
-                input,
-                padding=True,
-                truncation=True,
-                max_length=512,
-                return_tensors="pt",
-            ).to(self.device)
-            # Mean-pool last hidden states
-            out = self.model(**enc).last_hidden_state  # [B, T, H]
-            emb = out.mean(dim=1)                      # [B, H]
-            return emb.cpu().tolist()
+        return length_bucketed(input, self.tokenizer, self.max_length, self.batch_size, self._run_batch)
 
     def name(self) -> str:
         return f"BioGPTEmbeddingFunction({self.model_name})"
+
+
+class QuantizedBioGPTEmbeddingFunction(BioGPTEmbeddingFunction):
+    """
+    BioGPT with Linear layers dynamically quantized to int8 (CPU only).
+    """
+    backend = "torch-int8"
+
+    def __init__(
+        self,
+        model_name: str = "microsoft/biogpt",
+        device: Optional[str] = None,
+        threads: Optional[int] = None,
+        batch_size: int = 32,
+    ):
+        super().__init__(model_name, device="cpu", threads=threads, batch_size=batch_size)
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+
+    def name(self) -> str:
+        return f"QuantizedBioGPTEmbeddingFunction({self.model_name})"
+
+
+class _LastHiddenState(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+class OnnxBioGPTEmbeddingFunction:
+    """
+    BioGPT exported once to ONNX and run with ONNX Runtime on CPU.
+    """
+    backend = "onnx"
+
+    def __init__(
+        self,
+        model_name: str = "microsoft/biogpt",
+        onnx_dir: str = "onnx",
+        threads: Optional[int] = None,
+        batch_size: int = 32,
+    ):
+        try:
+            import onnxruntime as ort
+        except Exception as e:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx requires the `onnxruntime` package.") from e
+        self.model_name = model_name
+        self.max_length = 512
+        self.pooling = "masked_mean"
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        path = os.path.join(onnx_dir, model_name.replace("/", "__") + ".onnx")
+        if not os.path.exists(path):
+            self._export(model_name, path)
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.dimension = int(self.session.get_outputs()[0].shape[-1])
+
+    def _export(self, model_name: str, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        model = AutoModel.from_pretrained(model_name).eval()
+        enc = self.tokenizer(["export sample"], return_tensors="pt")
+        tmp = path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                _LastHiddenState(model),
+                (enc["input_ids"], enc["attention_mask"]),
+                tmp,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "seq"},
+                    "attention_mask": {0: "batch", 1: "seq"},
+                    "last_hidden_state": {0: "batch", 1: "seq"},
+                },
+                opset_version=17,
+            )
+        os.replace(tmp, path)
+
+    def _run_batch(self, batch: Dict[str, List[List[int]]]) -> List[List[float]]:
+        enc = self.tokenizer.pad(batch, padding=True, return_tensors="np")
+        mask = enc["attention_mask"].astype("int64")
+        out = self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": enc["input_ids"].astype("int64"), "attention_mask": mask},
+        )[0]  # [B, T, H]
+        weights = mask[..., None].astype(out.dtype)
+        return ((out * weights).sum(axis=1) / weights.sum(axis=1).clip(min=1.0)).tolist()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        if not isinstance(input, list):
+            input = [str(input)]
+        return length_bucketed(input, self.tokenizer, self.max_length, self.batch_size, self._run_batch)
+
+    def name(self) -> str:
+        return f"OnnxBioGPTEmbeddingFunction({self.model_name})"
+
+
+class SentenceTransformerEmbeddingFunction:
+    """
+    Compact sentence-transformers model (e.g. MiniLM, 384-d); much cheaper than BioGPT on CPU.
+    """
+    backend = "sentence-transformers"
+
+    def __init__(self, model_name: str = DEFAULT_MODELS["sentence-transformers"], threads: Optional[int] = None, batch_size: int = 32):
+        _set_torch_threads(threads)
+        self.batch_size = batch_size
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.max_length = int(self.model.max_seq_length)
+        self.pooling = "model"
+        self.dimension = int(self.model.get_sentence_embedding_dimension())
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        if not isinstance(input, list):
+            input = [str(input)]
+        # encode() already sorts by length and masks padding when pooling
+        return self.model.encode(input, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False).tolist()
+
+    def name(self) -> str:
+        return f"SentenceTransformerEmbeddingFunction({self.model_name})"
+
+
+def create_embedding_function(
+    backend: str,
+    model_name: Optional[str] = None,
+    threads: Optional[int] = None,
+    onnx_dir: str = "onnx",
+    batch_size: int = 32,
+):
+    """
+    Build the configured embedding backend (EMBEDDING_BACKEND).
+    """
+    model_name = model_name or DEFAULT_MODELS.get(backend)
+    if backend == "torch":
+        return BioGPTEmbeddingFunction(model_name, threads=threads, batch_size=batch_size)
+    if backend == "torch-int8":
+        return QuantizedBioGPTEmbeddingFunction(model_name, threads=threads, batch_size=batch_size)
+    if backend == "onnx":
+        return OnnxBioGPTEmbeddingFunction(model_name, onnx_dir=onnx_dir, threads=threads, batch_size=batch_size)
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbeddingFunction(model_name, threads=threads, batch_size=batch_size)
+    raise RuntimeError(f"Unknown EMBEDDING_BACKEND '{backend}' (expected one of {', '.join(DEFAULT_MODELS)}).")
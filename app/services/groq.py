@@ -1,16 +1,30 @@
 # app/services/groq.py
-import httpx
-from typing import List, Dict, Any
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List, Dict, Any, Tuple
 from fastapi import HTTPException
-from app.config import GROQ_CHAT_URL, GROQ_MODEL_REASON, HTTP_TIMEOUT, GROQ_API_KEY
+from app.config import GROQ_CHAT_URL, GROQ_MODEL_REASON, GROQ_API_KEY
+from app.services.http_client import get_http_client
+from app.services.context_packer import estimate_message_tokens
+from app.services.metrics import GROQ_LATENCY, GROQ_TOKENS, GROQ_ERRORS
+from app.services.groq_scheduler import (
+    groq_scheduler,
+    PRIORITY_CHAT,
+    PRIORITY_REASONING,
+    PRIORITY_NAMES,
+    RETRYABLE_STATUS,
+)
 
 
-async def groq_chat(
+def _build_request(
     messages: List[Dict[str, str]],
-    temperature: float = 0.2,
-    max_tokens: int = 800,
-    force_json: bool = False,
-) -> str:
+    temperature: float,
+    max_tokens: int,
+    force_json: bool,
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    if not GROQ_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GROQ_API_KEY in environment (.env).")
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json",
@@ -23,10 +37,118 @@ async def groq_chat(
     }
     if force_json:
         payload["response_format"] = {"type": "json_object"}
+    return headers, payload
+
+
+def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """
+    Local prompt-size estimate plus the completion budget, for the tokens/min bucket.
+    """
+    return estimate_message_tokens(messages) + max_tokens
+
+
+def _observe_usage(call: str, usage: Dict[str, Any]) -> None:
+    if usage.get("prompt_tokens") is not None:
+        GROQ_TOKENS.observe(usage["prompt_tokens"], call=call, kind="prompt")
+    if usage.get("completion_tokens") is not None:
+        GROQ_TOKENS.observe(usage["completion_tokens"], call=call, kind="completion")
+
+
+def _groq_error(status_code: int, body: str) -> HTTPException:
+    if status_code == 429:
+        return HTTPException(status_code=503, detail=f"Groq rate limit reached: {body}", headers={"Retry-After": "5"})
+    return HTTPException(status_code=500, detail=f"Groq API error: {body}")
+
+
+async def groq_chat(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: int = 800,
+    force_json: bool = False,
+    priority: int = PRIORITY_CHAT,
+) -> str:
+    headers, payload = _build_request(messages, temperature, max_tokens, force_json)
+    est_tokens = _estimate_tokens(messages, max_tokens)
+    call = PRIORITY_NAMES.get(priority, "chat")
+
+    client = get_http_client()
+    t0 = time.perf_counter()
+
+    def send():
+        nonlocal t0
+        t0 = time.perf_counter()  # latency from admission; the queue wait has its own histogram
+        return client.post(GROQ_CHAT_URL, headers=headers, json=payload)
+
+    try:
+        r = await groq_scheduler.request(
+            send,
+            priority=priority,
+            est_tokens=est_tokens,
+            hedge=priority == PRIORITY_REASONING,
+        )
+    except Exception as e:
+        GROQ_ERRORS.inc(call=call, status=type(e).__name__)
+        raise
+    GROQ_LATENCY.observe(time.perf_counter() - t0, call=call)
+    if r.status_code != 200:
+        GROQ_ERRORS.inc(call=call, status=r.status_code)
+        raise _groq_error(r.status_code, r.text)
+    data = r.json()
+    usage = data.get("usage") or {}
+    _observe_usage(call, usage)
+    groq_scheduler.settle(est_tokens, usage.get("total_tokens"))
+    # follow original shape
+    return data["choices"][0]["message"]["content"]
+
+
+async def groq_chat_stream(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: int = 800,
+    force_json: bool = False,
+    priority: int = PRIORITY_CHAT,
+) -> AsyncIterator[str]:
+    """
+    Same request with `stream: true`; yields content deltas as Groq sends them.
+    Goes through the scheduler too; retries only happen before the first token.
+    """
+    headers, payload = _build_request(messages, temperature, max_tokens, force_json)
+    payload["stream"] = True
+    est_tokens = _estimate_tokens(messages, max_tokens)
+    call = PRIORITY_NAMES.get(priority, "chat")
 
-    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-        r = await client.post(GROQ_CHAT_URL, headers=headers, json=payload)
-        if r.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"Groq API error: {r.text}")
-        # follow original shape
-        return r.json()["choices"][0]["message"]["content"]
+    client = get_http_client()
+    for attempt in range(groq_scheduler.max_retries + 1):
+        delay = 0.0
+        async with groq_scheduler.slot(priority, est_tokens):
+            t0 = time.perf_counter()
+            async with client.stream("POST", GROQ_CHAT_URL, headers=headers, json=payload) as r:
+                groq_scheduler.observe(r)
+                if r.status_code != 200:
+                    body = (await r.aread()).decode("utf-8", errors="ignore")
+                    if r.status_code not in RETRYABLE_STATUS or attempt >= groq_scheduler.max_retries:
+                        GROQ_ERRORS.inc(call=call, status=r.status_code)
+                        raise _groq_error(r.status_code, body)
+                    delay = groq_scheduler.backoff(attempt, r)
+                else:
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        # Groq reports usage on the last chunk under x_groq
+                        usage = (chunk.get("x_groq") or {}).get("usage") or chunk.get("usage")
+                        if usage:
+                            _observe_usage(call, usage)
+                        choices = chunk.get("choices") or [{}]
+                        delta = choices[0].get("delta") or {}
+                        if delta.get("content"):
+                            yield delta["content"]
+                    GROQ_LATENCY.observe(time.perf_counter() - t0, call=call)
+                    return
+        await asyncio.sleep(delay)
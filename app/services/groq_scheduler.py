@@ -0,0 +1,403 @@
+# app/services/groq_scheduler.py
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from app.config import (
+    GROQ_RPM,
+    GROQ_TPM,
+    GROQ_MAX_QUEUE_WAIT_S,
+    GROQ_MAX_QUEUE_DEPTH,
+    GROQ_MAX_CONCURRENCY,
+    GROQ_MAX_RETRIES,
+    GROQ_RETRY_BASE_S,
+    GROQ_HEDGE_AFTER_S,
+)
+from app.services.metrics import GROQ_QUEUE_DEPTH, GROQ_QUEUE_WAIT
+
+# Lower value = served first
+PRIORITY_REASONING = 0
+PRIORITY_ANALYZER = 1
+PRIORITY_CHAT = 2
+PRIORITY_BACKGROUND = 3
+PRIORITY_NAMES = {
+    PRIORITY_REASONING: "reasoning",
+    PRIORITY_ANALYZER: "analyzer",
+    PRIORITY_CHAT: "chat",
+    PRIORITY_BACKGROUND: "background",
+}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Groq reset headers look like "7.66s", "2m59.56s" or "120ms"; Retry-After is plain seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for num, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously. capacity <= 0 disables the limit.
+    `parts` > 1 keeps this process to its share of a budget split between workers.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.parts = 1
+        self._stamp = time.monotonic()
+
+    def split(self, parts: int) -> None:
+        parts = max(1, parts)
+        self.capacity = self.capacity * self.parts / parts
+        self.available = min(self.capacity, self.available * self.parts / parts)
+        self.parts = parts
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.capacity > 0:
+            self.available = min(self.capacity, self.available + (now - self._stamp) * self.capacity / 60.0)
+        self._stamp = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        if self.capacity > 0:
+            self._refill()
+            self.available -= amount
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """
+        The server's view wins: adopt its limit and remaining budget (this
+        process's share of both; the headers describe the whole API key).
+        """
+        if self.capacity <= 0:
+            return
+        self._refill()
+        if limit:
+            self.capacity = limit / self.parts
+        if remaining is not None:
+            self.available = min(self.capacity, remaining / self.parts)
+
+
+class GroqScheduler:
+    """
+    Single admission point for every Groq call in the process:
+      - requests/min and tokens/min token buckets, corrected from the
+        x-ratelimit-* response headers;
+      - a priority queue (reasoning > analyzer > chat) plus a concurrency cap
+        (hedged duplicates count against it too);
+      - load shedding: 503 + Retry-After instead of queueing past
+        max_queue_wait_s / max_queue_depth (e.g. while paused for a daily quota);
+      - jittered exponential retry on 429/5xx and transport errors;
+      - optional hedging: a duplicate request after GROQ_HEDGE_AFTER_S, first answer wins.
+    """
+
+    def __init__(
+        self,
+        rpm: float = GROQ_RPM,
+        tpm: float = GROQ_TPM,
+        max_concurrency: int = GROQ_MAX_CONCURRENCY,
+        max_retries: int = GROQ_MAX_RETRIES,
+        retry_base_s: float = GROQ_RETRY_BASE_S,
+        hedge_after_s: float = GROQ_HEDGE_AFTER_S,
+        max_queue_wait_s: float = GROQ_MAX_QUEUE_WAIT_S,
+        max_queue_depth: int = GROQ_MAX_QUEUE_DEPTH,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue_wait_s = max_queue_wait_s
+        self.max_queue_depth = max_queue_depth
+        self.max_concurrency = max(1, max_concurrency)
+        self._workers = 1
+        self.max_retries = max(0, max_retries)
+        self.retry_base_s = retry_base_s
+        self.hedge_after_s = hedge_after_s
+        self._heap: List[Any] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Any] = {
+            "admitted": 0, "retries": 0, "rate_limited": 0, "errors": 0, "shed": 0,
+            "hedges": 0, "hedge_wins": 0,
+            "wait_ms": {name: {"count": 0, "total": 0.0, "max": 0.0} for name in PRIORITY_NAMES.values()},
+        }
+
+    def split(self, workers: int) -> None:
+        """
+        Called in each of `workers` processes sharing one API key (app.cli.serve):
+        every worker keeps to 1/workers of GROQ_RPM, GROQ_TPM and GROQ_MAX_CONCURRENCY.
+        """
+        workers = max(1, workers)
+        self.requests.split(workers)
+        self.tokens.split(workers)
+        self.max_concurrency = max(1, -(-self.max_concurrency * self._workers // workers))
+        self._workers = workers
+
+    # ---------- admission ----------
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # New event loop (tests, CLI runs): start from a clean queue
+            self._loop, self._heap, self._active = loop, [], 0
+            self._wake = asyncio.Event()
+            self._task = None
+            self._publish_depth()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            while self._heap and self._heap[0][3].done():
+                heapq.heappop(self._heap)  # waiter gave up
+                self._publish_depth()
+            if not self._heap or self._active >= self.max_concurrency:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            priority, _, est_tokens, fut, enqueued = self._heap[0]
+            delay = max(
+                self._paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(est_tokens),
+            )
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            self.requests.consume(1)
+            self.tokens.consume(est_tokens)
+            self._active += 1
+            name = PRIORITY_NAMES.get(priority, "chat")
+            waited = time.monotonic() - enqueued
+            GROQ_QUEUE_WAIT.observe(waited, priority=name)
+            self._publish_depth()
+            w = self._stats["wait_ms"][name]
+            w["count"] += 1
+            w["total"] += waited * 1000
+            w["max"] = max(w["max"], waited * 1000)
+            self._stats["admitted"] += 1
+            fut.set_result(None)
+
+    def _release(self) -> None:
+        self._active -= 1
+        if self._wake is not None:
+            self._wake.set()
+
+    def _queue_depth(self) -> int:
+        return sum(1 for item in self._heap if not item[3].done())
+
+    def _publish_depth(self) -> None:
+        depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for item in self._heap:
+            if not item[3].done():
+                depth[PRIORITY_NAMES.get(item[0], "chat")] += 1
+        for name, n in depth.items():
+            GROQ_QUEUE_DEPTH.set(n, priority=name)
+
+    def _shed(self, reason: str, retry_after: float) -> HTTPException:
+        self._stats["shed"] += 1
+        return HTTPException(
+            status_code=503,
+            detail=f"Groq queue is saturated ({reason}), retry later.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_CHAT, est_tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Hold one admitted request slot (used directly for streamed calls).
+        Raises 503 when the queue is full or admission would take longer than
+        max_queue_wait_s.
+        """
+        self._ensure_dispatcher()
+        if self.max_queue_wait_s > 0:
+            paused = self._paused_until - time.monotonic()
+            if paused > self.max_queue_wait_s:
+                raise self._shed("rate limit pause", paused)
+        if self.max_queue_depth > 0 and self._queue_depth() >= self.max_queue_depth:
+            raise self._shed("queue full", self.max_queue_wait_s or 1)
+        fut = self._loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), est_tokens, fut, time.monotonic()))
+        self._publish_depth()
+        self._wake.set()
+        try:
+            await asyncio.wait({fut}, timeout=self.max_queue_wait_s if self.max_queue_wait_s > 0 else None)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # admitted just as we were cancelled
+            else:
+                fut.cancel()
+                self._publish_depth()
+            raise
+        if not fut.done():
+            fut.cancel()  # the dispatcher skips it
+            self._publish_depth()
+            raise self._shed("wait timeout", max(self._paused_until - time.monotonic(), self.max_queue_wait_s))
+        try:
+            yield
+        finally:
+            self._release()
+
+    # ---------- feedback ----------
+    def observe(self, response: httpx.Response) -> None:
+        """
+        Feed rate-limit headers back into the buckets; pause admission on 429.
+        """
+        h = response.headers
+
+        def num(name: str) -> Optional[float]:
+            try:
+                return float(h[name])
+            except (KeyError, ValueError):
+                return None
+
+        self.tokens.sync(num("x-ratelimit-limit-tokens"), num("x-ratelimit-remaining-tokens"))
+        if num("x-ratelimit-remaining-requests") == 0:
+            # Groq's request header is a daily quota: stop until it resets
+            reset = parse_reset(h.get("x-ratelimit-reset-requests"))
+            if reset:
+                self._paused_until = max(self._paused_until, time.monotonic() + reset)
+        if response.status_code == 429:
+            self._stats["rate_limited"] += 1
+            retry_after = parse_reset(h.get("retry-after")) or parse_reset(h.get("x-ratelimit-reset-tokens"))
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def settle(self, est_tokens: int, actual_tokens: Optional[int]) -> None:
+        """
+        Correct the token bucket once the response `usage` is known.
+        """
+        if actual_tokens is not None:
+            self.tokens.consume(actual_tokens - est_tokens)
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        retry_after = parse_reset(response.headers.get("retry-after")) if response is not None else None
+        if retry_after:
+            return retry_after + random.uniform(0, self.retry_base_s)
+        return random.uniform(0, self.retry_base_s * (2 ** attempt))  # full jitter
+
+    # ---------- request execution ----------
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]], priority: int, est_tokens: int) -> httpx.Response:
+        primary = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after_s)
+        if (done or self._active >= self.max_concurrency
+                or self.requests.wait_time(1) > 0 or self.tokens.wait_time(est_tokens) > 0):
+            return await primary  # finished in time, or no slot/budget left for a duplicate
+        self._stats["hedges"] += 1
+        self.requests.consume(1)
+        self.tokens.consume(est_tokens)
+        self._active += 1  # the duplicate holds its own concurrency slot until it is done
+        backup = asyncio.ensure_future(send())
+        backup.add_done_callback(lambda _t: self._release())
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code == 200:
+                        if task is backup:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+            return await primary  # both failed: surface the primary outcome
+        finally:
+            for task in (primary, backup):
+                task.cancel()
+
+    async def request(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        priority: int = PRIORITY_CHAT,
+        est_tokens: int = 0,
+        hedge: bool = False,
+    ) -> httpx.Response:
+        """
+        Run `send` under admission control with retries; returns the last response.
+        Transport errors are re-raised once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot(priority, est_tokens):
+                    if hedge and self.hedge_after_s > 0:
+                        r = await self._hedged(send, priority, est_tokens)
+                    else:
+                        r = await send()
+            except httpx.TransportError:
+                self._stats["errors"] += 1
+                if attempt >= self.max_retries:
+                    raise
+                self._stats["retries"] += 1
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            self.observe(r)
+            if r.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                self._stats["retries"] += 1
+                await asyncio.sleep(self.backoff(attempt, r))
+                continue
+            if r.status_code != 200:
+                self._stats["errors"] += 1
+            return r
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for name, w in self._stats["wait_ms"].items():
+            waits[name] = {
+                "count": w["count"],
+                "avg_ms": round(w["total"] / w["count"], 1) if w["count"] else 0.0,
+                "max_ms": round(w["max"], 1),
+            }
+        return {
+            "queue_depth": self._queue_depth(),
+            "workers": self._workers,
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "tokens_available": round(self.tokens.available, 1),
+            "admitted": self._stats["admitted"],
+            "retries": self._stats["retries"],
+            "rate_limited": self._stats["rate_limited"],
+            "errors": self._stats["errors"],
+            "shed": self._stats["shed"],
+            "hedges": self._stats["hedges"],
+            "hedge_wins": self._stats["hedge_wins"],
+            "wait": waits,
+        }
+
+
+groq_scheduler = GroqScheduler()
@@ -0,0 +1,219 @@
+# app/services/guideline_ingest.py
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import INGEST_BATCH_SIZE, INGEST_MIN_CHARS, INGEST_PDF_MAX_PAGES, INGEST_PDF_TIME_BUDGET_S
+from app.services.inference import inference_executor
+from app.services.metrics import record_timing
+from app.services.pdf_extraction import iter_pdf_pages
+from app.services.result_cache import invalidate_result_caches
+from app.services.retrieval import get_collection, ensure_retrieval, assert_embedding_compatible, persist_collection
+from app.utils import _hash_id
+
+# Same colour/label keywords as the WHO.pdf extraction notebook (datasource/Untitled.ipynb)
+TRIAGE_PATTERNS = [
+    ("Level 1", re.compile(r"\b(Red|Immediate|Resuscitation)\b", re.I)),
+    ("Level 2", re.compile(r"\b(Orange|Emergency)\b", re.I)),
+    ("Level 3", re.compile(r"\b(Yellow|Urgent)\b", re.I)),
+    ("Level 4", re.compile(r"\b(Green|Standard)\b", re.I)),
+    ("Level 5", re.compile(r"\b(Blue|Non[- ]?urgent)\b", re.I)),
+]
+
+_WS = re.compile(r"\s+")
+
+Record = Tuple[str, str, Dict[str, Any]]  # (id, text, metadata)
+
+
+def detect_triage_level(text: str) -> str:
+    """
+    First triage level whose keywords appear in `text`, or "".
+    """
+    for level, pat in TRIAGE_PATTERNS:
+        if pat.search(text):
+            return level
+    return ""
+
+
+def _scalar_metadata(meta: Dict[str, Any]) -> Dict[str, Any]:
+    # Chroma metadata values must be str/int/float/bool: join lists, drop empties and nested objects
+    out: Dict[str, Any] = {}
+    for k, v in (meta or {}).items():
+        if isinstance(v, (list, tuple)):
+            v = ", ".join(str(x) for x in v if x not in (None, ""))
+        elif isinstance(v, dict):
+            v = json.dumps(v, ensure_ascii=False)
+        if v is None or v == "":
+            continue
+        out[str(k)] = v
+    return out
+
+
+def normalize_record(item: Dict[str, Any], source: Optional[str] = None) -> Optional[Record]:
+    """
+    One guideline item ({"id", "text", "metadata", "source"?}) -> (id, text, metadata),
+    or None when the text is too short to be useful. Whitespace is collapsed, the
+    id defaults to the content hash and a missing level is detected from the text.
+    """
+    text = _WS.sub(" ", str(item.get("text") or "")).strip()
+    if len(text) < INGEST_MIN_CHARS:
+        return None
+    meta = dict(item.get("metadata") or {})
+    src = item.get("source") or source
+    if src and "source" not in meta:
+        meta["source"] = src
+    if not meta.get("level"):
+        meta["level"] = detect_triage_level(text)
+    gid = str(item.get("id") or _hash_id(text)).strip()
+    return gid, text, _scalar_metadata(meta)
+
+
+def legacy_record(item: Dict[str, Any], source: Optional[str] = None) -> Optional[Record]:
+    """
+    The original POST /ingest-guidelines rules: text only stripped (any
+    non-empty text kept), id defaults to _hash_id of the stripped text (same
+    ids as preload), metadata passed through as given.
+    """
+    text = str(item.get("text") or "").strip()
+    if not text:
+        return None
+    gid = str(item.get("id") or _hash_id(text)).strip()
+    return gid, text, dict(item.get("metadata") or {})
+
+
+# ---------- record sources ----------
+async def ndjson_records(chunks: AsyncIterable[bytes], source: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Guideline items from an NDJSON byte stream, parsed line by line as chunks
+    arrive. Blank lines are skipped; a malformed line yields {"error": ...}.
+    """
+    buf = b""
+    line_no = 0
+
+    def parse(line: bytes) -> Optional[Dict[str, Any]]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            return {"error": f"line {line_no}: {e}"}
+        if not isinstance(item, dict):
+            return {"error": f"line {line_no}: expected an object"}
+        if source and "source" not in item:
+            item["source"] = source
+        return item
+
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            item = parse(line)
+            if item is not None:
+                yield item
+    line_no += 1
+    item = parse(buf)
+    if item is not None:
+        yield item
+
+
+async def pdf_records(pdf_bytes: bytes, source: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Guideline items from a triage PDF, page by page: like the notebook, every
+    line that names a triage level becomes one guideline.
+    """
+    async for page in iter_pdf_pages(pdf_bytes, max_pages=INGEST_PDF_MAX_PAGES, time_budget_s=INGEST_PDF_TIME_BUDGET_S):
+        for line in (page["text"] or "").split("\n"):
+            line = line.strip()
+            level = detect_triage_level(line)
+            if level:
+                # Notebook-style id (md5[:12] of the line) so this upserts over who_guidelines.json entries
+                gid = hashlib.md5(line.encode()).hexdigest()[:12]
+                yield {"id": gid, "text": line, "source": source, "metadata": {"level": level, "page": page["page"]}}
+
+
+async def iter_records(items: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    for it in items:
+        yield it
+
+
+# ---------- batched upsert ----------
+def _upsert_batch(batch: List[Record]) -> None:
+    collection = get_collection()
+    collection.upsert(
+        ids=[gid for gid, _, _ in batch],
+        documents=[text for _, text, _ in batch],
+        metadatas=[meta for _, _, meta in batch],
+    )
+
+
+async def ingest_records(
+    items: AsyncIterable[Dict[str, Any]],
+    batch_size: int = INGEST_BATCH_SIZE,
+    source: Optional[str] = None,
+    normalize: Callable[[Dict[str, Any], Optional[str]], Optional[Record]] = normalize_record,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Normalize (`normalize`, default normalize_record) and upsert guideline
+    items in fixed-size batches; only one batch is held in memory. Yields a progress dict after every batch and a final
+    summary (`"done": True`). Upserts make re-ingesting the same corpus a no-op
+    apart from re-embedding; duplicate ids inside a batch keep the last item.
+    """
+    await ensure_retrieval()
+    assert_embedding_compatible()
+    batch_size = max(1, batch_size)
+    t0 = time.perf_counter()
+    embed_s = 0.0
+    seen = upserted = skipped = batches = 0
+    errors: List[str] = []
+    pending: Dict[str, Record] = {}
+
+    async def flush() -> Dict[str, Any]:
+        nonlocal embed_s, upserted, batches
+        batch = list(pending.values())
+        pending.clear()
+        t_batch = time.perf_counter()
+        await inference_executor.run(_upsert_batch, batch)
+        embed_s += time.perf_counter() - t_batch
+        upserted += len(batch)
+        batches += 1
+        return progress()
+
+    def progress(done: bool = False) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - t0
+        return {
+            "done": done,
+            "seen": seen,
+            "upserted": upserted,
+            "skipped": skipped,
+            "batches": batches,
+            "errors": errors[:20],
+            "seconds": round(elapsed, 3),
+            "docs_per_sec": round(upserted / elapsed, 1) if elapsed and upserted else None,
+        }
+
+    try:
+        async for item in items:
+            seen += 1
+            if "error" in item and "text" not in item:
+                errors.append(item["error"])
+                skipped += 1
+                continue
+            record = normalize(item, source)
+            if record is None:
+                skipped += 1
+                continue
+            pending[record[0]] = record
+            if len(pending) >= batch_size:
+                yield await flush()
+        if pending:
+            yield await flush()
+    finally:
+        if upserted:
+            record_timing("guideline_ingest", embed_s)
+            persist_collection()
+            invalidate_result_caches()
+    yield progress(done=True)
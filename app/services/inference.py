@@ -0,0 +1,78 @@
+# app/services/inference.py
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.config import INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking model forward passes and Chroma calls.
+    Admits at most `workers + queue_depth` jobs; anything beyond that is
+    rejected with a 503 instead of queueing behind a slow embedding.
+    Threads (not processes) so the loaded weights are shared; torch releases
+    the GIL during the forward pass.
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, queue_depth: int = INFERENCE_QUEUE_DEPTH):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._pool
+
+    def _release(self, _fut) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._inflight >= self.capacity:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Inference queue is full, retry shortly.",
+                    headers={"Retry-After": "1"},
+                )
+            self._inflight += 1
+        try:
+            fut = self._get_pool().submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        # Slot is freed when the job actually finishes, even if the caller is cancelled
+        fut.add_done_callback(self._release)
+        return await asyncio.wrap_future(fut)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "inflight": self._inflight,
+                "queued": max(0, self._inflight - self.workers),
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+inference_executor = InferenceExecutor()
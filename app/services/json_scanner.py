@@ -0,0 +1,223 @@
+# app/services/json_scanner.py
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonScanner:
+    """
+    Single-pass, brace/quote-aware scanner for the first JSON object in LLM
+    output. Text before the object (prose, code fences) is skipped; feed()
+    accepts streamed chunks and, with `emit_fields`, returns the top-level
+    fields that closed in them (each value decoded once). close() returns the
+    whole object, repairing a trailing comma or a truncated tail (open string,
+    missing brackets, a dangling key) when the strict parse fails. Trailing
+    commas are located while scanning, so commas inside strings are never touched.
+
+    The scan is a single forward pass that jumps between structural
+    characters; the object slice is handed to json.loads once it closes.
+    """
+
+    def __init__(self, emit_fields: bool = False):
+        self.emit_fields = emit_fields
+        self._buf = ""
+        self._pos = 0  # next character to scan
+        self._start = -1  # index of the object's "{"
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._key_start = -1  # depth-1 key string being read
+        self._key: Optional[str] = None  # last depth-1 key, waiting for its value
+        self._value_start = -1  # depth-1 value offset (after ":")
+        self._safe: Tuple[int, int] = (-1, 0)  # (cut offset, stack depth) where the prefix is complete
+        self._comma = -1  # last comma outside strings
+        self._trailing: List[int] = []  # offsets of commas followed only by whitespace and a closer
+        self.fields: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.outcome: Optional[str] = None  # strict | extracted | repaired | failed
+        self._prefix_clean = True  # only whitespace before "{"
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.done or not chunk:
+            return []
+        self._buf += chunk
+        closed: List[Tuple[str, Any]] = []
+        buf, stack = self._buf, self._stack
+        i, n = self._pos, len(buf)
+        while i < n:
+            if self._in_string:
+                # Jump to the next quote or backslash inside the string
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(buf, i)
+                if m is None:
+                    i = n
+                    break
+                i = m.start()
+                if buf[i] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    if self._key_start >= 0:
+                        self._key = _loads(buf[self._key_start:i + 1])
+                        self._key_start = -1
+                i += 1
+                continue
+            if self._start < 0:
+                j = buf.find("{", i)
+                skipped = buf[i:n if j < 0 else j]
+                if skipped and not skipped.isspace():
+                    self._prefix_clean = False
+                if j < 0:
+                    i = n
+                    break
+                self._start = j
+                stack.append("{")
+                self._safe = (j + 1, 1)
+                i = j + 1
+                continue
+            m = _STRUCTURAL.search(buf, i)
+            if m is None:
+                i = n
+                break
+            i = m.start()
+            c = buf[i]
+            depth = len(stack)
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and self._value_start < 0:
+                    self._key_start = i
+            elif c in "{[":
+                stack.append(c)
+                self._safe = (i + 1, len(stack))
+            elif c in "}]":
+                if self._comma >= 0 and not buf[self._comma + 1:i].strip():
+                    self._trailing.append(self._comma)
+                self._comma = -1
+                if depth == 1 and c == "}":
+                    self._close_field(buf, i, closed)
+                    stack.pop()
+                    self._finish(buf[self._start:i + 1], buf[i + 1:])
+                    if self.done:
+                        self._pos = i + 1
+                        return closed
+                    # Not JSON after all ("{placeholder}" in prose): look for the next object
+                    self._reset_object()
+                    i += 1
+                    continue
+                if stack:
+                    stack.pop()
+                self._safe = (i + 1, len(stack))
+            elif c == ":":
+                if depth == 1:
+                    self._value_start = i + 1
+            else:  # ","
+                self._comma = i
+                if depth == 1:
+                    self._close_field(buf, i, closed)
+                self._safe = (i, depth)
+            i += 1
+        self._pos = n
+        return closed
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        """
+        End of input: the parsed object (repaired if it was cut off), or None.
+        """
+        if self.done or self._start < 0:
+            self.outcome = self.outcome or "failed"
+            return self.result
+        body = self._buf[self._start:]
+        if self._in_string:
+            body += '"'
+        stack_closers = "".join(_CLOSERS[b] for b in reversed(self._stack))
+        obj = _loads(self._without_trailing(body, self._start).rstrip().rstrip(",") + stack_closers)
+        if not isinstance(obj, dict):
+            # Cut back to the last complete member and close what was open there
+            cut, depth = self._safe
+            head = self._without_trailing(self._buf[self._start:cut], self._start).rstrip().rstrip(",")
+            obj = _loads(head + "".join(_CLOSERS[b] for b in reversed(self._stack[:depth])))
+        if not isinstance(obj, dict) and self.fields:
+            obj = dict(self.fields)
+        self.result = obj if isinstance(obj, dict) else None
+        self.outcome = "repaired" if self.result is not None else "failed"
+        return self.result
+
+    # ---------- internals ----------
+    def _close_field(self, buf: str, end: int, closed: List[Tuple[str, Any]]) -> None:
+        if self.emit_fields and self._key is not None and self._value_start >= 0:
+            raw = buf[self._value_start:end]
+            value = _loads(raw, _MISSING)
+            if value is _MISSING:
+                value = _loads(self._without_trailing(raw, self._value_start), _MISSING)
+            if value is not _MISSING:
+                self.fields[self._key] = value
+                closed.append((self._key, value))
+        self._key = None
+        self._value_start = -1
+        self._safe = (end, 1)
+
+    def _finish(self, text: str, rest: str) -> None:
+        obj = _loads(text, _MISSING)
+        outcome = "strict" if self._prefix_clean and not rest.strip() else "extracted"
+        if not isinstance(obj, dict):
+            obj = _loads(self._without_trailing(text, self._start), _MISSING)
+            outcome = "repaired"
+        if isinstance(obj, dict):
+            self.result, self.outcome = obj, outcome
+
+    def _without_trailing(self, text: str, offset: int) -> str:
+        """
+        `text` (which starts at buffer offset `offset`) minus the trailing commas found by the scan.
+        """
+        cuts = [p - offset for p in self._trailing if offset <= p < offset + len(text)]
+        if not cuts:
+            return text
+        parts, prev = [], 0
+        for p in cuts:
+            parts.append(text[prev:p])
+            prev = p + 1
+        parts.append(text[prev:])
+        return "".join(parts)
+
+    def _reset_object(self) -> None:
+        self._start = -1
+        self._comma = -1
+        self._trailing = []
+        self._stack.clear()
+        self._key = None
+        self._key_start = -1
+        self._value_start = -1
+        self._safe = (-1, 0)
+        self.fields = {}
+        self._prefix_clean = False
+
+
+_MISSING = object()
+
+
+def _loads(text: str, default: Any = None) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return default
+
+
+def scan_json(text: str) -> JsonScanner:
+    """
+    Scan a complete string; the scanner carries `result` and `outcome`.
+    """
+    scanner = JsonScanner()
+    scanner.feed(text)
+    scanner.close()
+    return scanner
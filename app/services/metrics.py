@@ -0,0 +1,291 @@
+# app/services/metrics.py
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import METRICS_ENABLED
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels (Prometheus `counter`).
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name if name.endswith("_total") else name + "_total"
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge:
+    """
+    Value that goes up and down, with optional labels (Prometheus `gauge`).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels: Any) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with optional labels (Prometheus `histogram`);
+    observe() is a bisect plus a few additions under a lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., +Inf count, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines: List[str] = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                le = ("le", _format_value(bound) if bound == math.inf else repr(float(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {repr(float(series[-1]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+_registry: List[Any] = []
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, help_text, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+    metric = Gauge(name, help_text, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format (0.0.4).
+    """
+    out: List[str] = []
+    for metric in _registry:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.render())
+    return "\n".join(out) + "\n"
+
+
+# ---------- application metrics ----------
+HTTP_REQUESTS = counter("triage_http_requests", "HTTP requests by route and status class.", ("method", "route", "status"))
+HTTP_LATENCY = histogram("triage_http_request_seconds", "HTTP request latency until the response starts.", ("route",))
+STAGE_LATENCY = histogram("triage_stage_seconds", "Pipeline stage latency.", ("stage",))
+GROQ_LATENCY = histogram("triage_groq_request_seconds", "Groq chat completion latency from admission (excl. queue wait).",
+                         ("call",))
+GROQ_QUEUE_DEPTH = gauge("triage_groq_queue_depth", "Groq calls waiting for admission by priority.", ("priority",))
+GROQ_QUEUE_WAIT = histogram("triage_groq_queue_wait_seconds", "Time Groq calls waited in the scheduler queue.",
+                            ("priority",))
+GROQ_TOKENS = histogram("triage_groq_tokens", "Groq prompt/completion tokens per call (response usage).",
+                        ("call", "kind"), buckets=TOKEN_BUCKETS)
+GROQ_ERRORS = counter("triage_groq_errors", "Groq calls that failed, by status code.", ("call", "status"))
+PDF_PAGE_LATENCY = histogram("triage_pdf_page_seconds", "Per-page PDF extraction time by method.", ("method",))
+JSON_EXTRACT = counter("triage_json_extract", "LLM JSON extraction outcomes (strict/extracted/repaired/failed).",
+                       ("outcome",))
+CACHE_LOOKUPS = counter("triage_cache_lookups", "Cache lookups by cache and result.", ("cache", "result"))
+ERRORS = counter("triage_errors", "Unhandled errors by stage.", ("stage",))
+SINGLE_FLIGHT_CALLS = counter("triage_single_flight_calls", "Coalescable calls by group; followers joined an in-flight one.",
+                              ("group", "role"))
+SINGLE_FLIGHT_WAITERS = histogram("triage_single_flight_callers", "Callers served per in-flight key when it finished.",
+                                  ("group",), buckets=(1, 2, 3, 4, 8, 16, 32, 64))
+OUTBOX_DELIVERIES = counter("triage_outbox_deliveries", "n8n outbox delivery attempts by outcome (delivered/retry/dead).",
+                            ("outcome",))
+OUTBOX_LATENCY = histogram("triage_outbox_delivery_seconds", "n8n webhook POST latency from the outbox worker.")
+
+# Per-request stage timings, exported as the Server-Timing header
+_server_timing: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "server_timing", default=None
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Time a block into triage_stage_seconds{stage} and the current request's
+    Server-Timing header. Exceptions are counted in triage_errors{stage}.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        timings = _server_timing.get()
+        if timings is not None:
+            timings.append((stage, elapsed * 1000))
+
+
+def record_timing(stage: str, seconds: float) -> None:
+    """
+    Same as stage_timer for a duration measured elsewhere (e.g. in a worker process).
+    """
+    if not METRICS_ENABLED:
+        return
+    STAGE_LATENCY.observe(seconds, stage=stage)
+    timings = _server_timing.get()
+    if timings is not None:
+        timings.append((stage, seconds * 1000))
+
+
+def _server_timing_header(timings: List[Tuple[str, float]], total_ms: float) -> bytes:
+    totals: Dict[str, float] = {}
+    for name, ms in timings:
+        totals[name] = totals.get(name, 0.0) + ms
+    parts = [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+    parts.append(f"app;dur={total_ms:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (works with streaming responses): request counters and
+    latency per route template, and a Server-Timing header listing the stages
+    finished before the response started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = _server_timing.set(timings)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                elapsed = time.perf_counter() - t0
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", _server_timing_header(timings, elapsed * 1000)))
+                message = {**message, "headers": headers}
+                HTTP_LATENCY.observe(elapsed, route=_route(scope))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _server_timing.reset(token)
+            HTTP_REQUESTS.inc(method=scope.get("method", ""), route=_route(scope), status=f"{status['code'] // 100}xx")
+
+
+def _route(scope) -> str:
+    # Route template ("/chat/sessions/{session_id}"), never the raw path: keeps label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -0,0 +1,324 @@
+# app/services/outbox.py
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.config import (
+    N8N_WEBHOOK_URL,
+    N8N_OUTBOX_PATH,
+    N8N_OUTBOX_CONCURRENCY,
+    N8N_OUTBOX_BATCH_SIZE,
+    N8N_OUTBOX_MAX_ATTEMPTS,
+    N8N_OUTBOX_RETRY_BASE_S,
+    N8N_OUTBOX_RETRY_MAX_S,
+    N8N_OUTBOX_POLL_S,
+    N8N_OUTBOX_LEASE_S,
+)
+from app.services.http_client import get_http_client
+from app.services.metrics import OUTBOX_DELIVERIES, OUTBOX_LATENCY
+
+PENDING, IN_FLIGHT, DELIVERED, DEAD = "pending", "in_flight", "delivered", "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS handoffs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    delivered_at REAL,
+    last_error TEXT,
+    response TEXT,
+    claimed_by TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS handoffs_due ON handoffs (status, next_attempt_at);
+"""
+# Columns added after the first release of the table
+_MIGRATIONS = {"claimed_by": "TEXT", "lease_until": "REAL"}
+
+
+class Outbox:
+    """
+    SQLite-backed outbox for n8n handoffs. Rows go pending -> in_flight ->
+    delivered, or back to pending with exponential backoff on failure, and to
+    dead (the dead-letter queue) after `max_attempts`. Delivery is
+    at-least-once: every POST carries an X-Handoff-Id header n8n can dedupe on.
+
+    Several processes may share the file (app.cli.serve, uvicorn --workers):
+    a claim records the claiming process and a lease, and an in_flight row is
+    only claimed again once its lease has expired, i.e. its worker died.
+    """
+
+    def __init__(self, path: str, max_attempts: int = N8N_OUTBOX_MAX_ATTEMPTS,
+                 retry_base_s: float = N8N_OUTBOX_RETRY_BASE_S, retry_max_s: float = N8N_OUTBOX_RETRY_MAX_S,
+                 lease_s: float = N8N_OUTBOX_LEASE_S):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.lease_s = lease_s
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    # ---------- storage ----------
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable across process crashes
+            db.executescript(_SCHEMA)
+            columns = {r["name"] for r in db.execute("PRAGMA table_info(handoffs)")}
+            for name, kind in _MIGRATIONS.items():
+                if name not in columns:
+                    db.execute(f"ALTER TABLE handoffs ADD COLUMN {name} {kind}")
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def _owner() -> str:
+        # Evaluated per call: the instance is created before app.cli.serve forks
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        handoff_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn().execute(
+                "INSERT INTO handoffs (id, payload, status, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (handoff_id, json.dumps(payload, ensure_ascii=False), PENDING, now, now, now),
+            )
+        return handoff_id
+
+    def claim_due(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Mark up to `limit` due rows in_flight under this process's lease and
+        return them (oldest first). Due rows are pending ones past their
+        backoff and in_flight ones whose lease expired (or that predate leases).
+        """
+        now = time.time()
+        owner = self._owner()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    "SELECT id, payload, attempts FROM handoffs "
+                    "WHERE (status=? AND next_attempt_at<=?) OR (status=? AND (lease_until IS NULL OR lease_until<?)) "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (PENDING, now, IN_FLIGHT, now, limit),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE handoffs SET status=?, updated_at=?, claimed_by=?, lease_until=? WHERE id=?",
+                    [(IN_FLIGHT, now, owner, now + self.lease_s, r["id"]) for r in rows],
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return [{"id": r["id"], "payload": json.loads(r["payload"]), "attempts": r["attempts"]} for r in rows]
+
+    def mark_delivered(self, ids: List[str], response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn().executemany(
+                "UPDATE handoffs SET status=?, attempts=attempts+1, delivered_at=?, updated_at=?, "
+                "response=?, last_error=NULL, lease_until=NULL WHERE id=? AND status<>?",
+                [(DELIVERED, now, now, response[:2000], i, DELIVERED) for i in ids],
+            )
+
+    def mark_failed(self, rows: List[Dict[str, Any]], error: str) -> None:
+        now = time.time()
+        updates = []
+        for r in rows:
+            attempts = r["attempts"] + 1
+            if attempts >= self.max_attempts:
+                updates.append((DEAD, attempts, now, now, error[:2000], r["id"]))
+                OUTBOX_DELIVERIES.inc(outcome="dead")
+            else:
+                OUTBOX_DELIVERIES.inc(outcome="retry")
+                delay = min(self.retry_max_s, self.retry_base_s * (2 ** (attempts - 1)))
+                delay *= random.uniform(0.5, 1.0)  # jitter so a recovered n8n is not hit all at once
+                updates.append((PENDING, attempts, now + delay, now, error[:2000], r["id"]))
+        owner = self._owner()
+        with self._lock:
+            # Only while we still hold the claim: a row re-claimed after our lease ran out is not ours
+            self._conn().executemany(
+                "UPDATE handoffs SET status=?, attempts=?, next_attempt_at=?, updated_at=?, last_error=?, "
+                "lease_until=NULL WHERE id=? AND status=? AND claimed_by=?",
+                [u + (IN_FLIGHT, owner) for u in updates],
+            )
+
+    def requeue(self, handoff_id: str) -> bool:
+        """
+        Move a dead-lettered handoff back to the queue with a fresh attempt budget.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn().execute(
+                "UPDATE handoffs SET status=?, attempts=0, next_attempt_at=?, updated_at=? WHERE id=? AND status=?",
+                (PENDING, now, now, handoff_id, DEAD),
+            )
+        return cur.rowcount > 0
+
+    def get(self, handoff_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT id, status, attempts, next_attempt_at, created_at, delivered_at, last_error, response "
+                "FROM handoffs WHERE id=?",
+                (handoff_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        out = dict(row)
+        if out["status"] != PENDING:
+            out.pop("next_attempt_at")
+        return out
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT id, attempts, created_at, updated_at, last_error FROM handoffs WHERE status=? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (DEAD, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM handoffs GROUP BY status").fetchall()
+            oldest = self._conn().execute(
+                "SELECT MIN(created_at) FROM handoffs WHERE status IN (?, ?)", (PENDING, IN_FLIGHT)
+            ).fetchone()[0]
+        counts = {s: 0 for s in (PENDING, IN_FLIGHT, DELIVERED, DEAD)}
+        counts.update({r["status"]: r["n"] for r in rows})
+        counts["oldest_pending_s"] = round(time.time() - oldest, 1) if oldest else None
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class OutboxWorker:
+    """
+    Background delivery loop: claims due handoffs, posts them over the shared
+    keep-alive client with at most `concurrency` requests in flight (optionally
+    `batch_size` handoffs per request), and records the outcome.
+    """
+
+    def __init__(self, outbox: Outbox, url: Optional[str], concurrency: int = N8N_OUTBOX_CONCURRENCY,
+                 batch_size: int = N8N_OUTBOX_BATCH_SIZE, poll_s: float = N8N_OUTBOX_POLL_S):
+        self.outbox = outbox
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.poll_s = poll_s
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._task is None and self.url:
+            self._wake = asyncio.Event()
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    def notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            free = self.concurrency - len(self._inflight)
+            rows = await asyncio.to_thread(self.outbox.claim_due, free * self.batch_size) if free > 0 else []
+            for start in range(0, len(rows), self.batch_size):
+                await self._sem.acquire()
+                task = asyncio.create_task(self._deliver(rows[start:start + self.batch_size]))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+            if not rows:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_s)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            if self.batch_size > 1:
+                body: Any = {"handoffs": [{"handoff_id": r["id"], **r["payload"]} for r in rows]}
+            else:
+                body = rows[0]["payload"]
+            headers = {"X-Handoff-Id": ",".join(r["id"] for r in rows)}
+            try:
+                with OUTBOX_LATENCY.time():
+                    r = await get_http_client().post(self.url, json=body, headers=headers)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if 200 <= r.status_code < 300:
+                    await asyncio.to_thread(self.outbox.mark_delivered, [row["id"] for row in rows], r.text)
+                    self.sent += len(rows)
+                    OUTBOX_DELIVERIES.inc(len(rows), outcome="delivered")
+                    return
+                error = f"n8n HTTP {r.status_code}: {r.text}"
+            self.failed += len(rows)
+            await asyncio.to_thread(self.outbox.mark_failed, rows, error)
+        finally:
+            self._sem.release()
+            self.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self._task is not None, "in_flight": len(self._inflight),
+                "sent": self.sent, "failed_attempts": self.failed}
+
+
+n8n_outbox = Outbox(N8N_OUTBOX_PATH)
+n8n_worker = OutboxWorker(n8n_outbox, N8N_WEBHOOK_URL)
+
+
+async def start_outbox_worker() -> None:
+    if N8N_WEBHOOK_URL:
+        n8n_worker.start()
+
+
+async def enqueue_handoff(payload: Dict[str, Any]) -> str:
+    """
+    Persist a handoff (committed before returning) and wake the worker.
+    """
+    handoff_id = await asyncio.to_thread(n8n_outbox.enqueue, payload)
+    n8n_worker.notify()
+    return handoff_id
+
+
+async def stop_outbox_worker() -> None:
+    await n8n_worker.stop()
+    n8n_outbox.close()
+
+
+def outbox_stats() -> Dict[str, Any]:
+    return {**n8n_outbox.stats(), "worker": n8n_worker.stats()}
@@ -0,0 +1,225 @@
+# app/services/pdf_extraction.py
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import pdfplumber
+from fastapi import HTTPException
+
+from app.utils import extract_text_from_upload
+from app.services.metrics import PDF_PAGE_LATENCY, stage_timer
+from app.config import (
+    PDF_WORKERS,
+    PDF_OCR_LOW_DPI,
+    PDF_OCR_HIGH_DPI,
+    PDF_OCR_MIN_CONFIDENCE,
+    PDF_MAX_PAGES,
+    PDF_TIME_BUDGET_S,
+)
+
+try:
+    import pytesseract
+    OCR_AVAILABLE = True
+except Exception:
+    OCR_AVAILABLE = False
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: never fork a parent that holds torch/uvicorn threads
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ---------- worker side (runs in the process pool) ----------
+# Documents this worker process has open, so each page task does not parse the page tree again
+_open_docs: "OrderedDict[Tuple[str, int, int], Any]" = OrderedDict()
+_MAX_OPEN_DOCS = 4
+
+
+def _open_pdf(path: str):
+    st = os.stat(path)
+    key = (path, st.st_ino, st.st_mtime_ns)  # temp paths can be reused by a later upload
+    for stale in [k for k in _open_docs if k != key and not os.path.exists(k[0])]:
+        _open_docs.pop(stale).close()  # upload finished and its temp file is gone
+    pdf = _open_docs.get(key)
+    if pdf is None:
+        pdf = pdfplumber.open(path)
+        _open_docs[key] = pdf
+        while len(_open_docs) > _MAX_OPEN_DOCS:
+            _open_docs.popitem(last=False)[1].close()
+    _open_docs.move_to_end(key)
+    return pdf
+
+
+def _ocr(page, resolution: int):
+    """
+    OCR one rasterized page; returns (text, mean word confidence 0-100).
+    """
+    img = page.to_image(resolution=resolution).original
+    data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+    lines: Dict[Any, List[str]] = {}
+    confs: List[float] = []
+    for i, word in enumerate(data.get("text", [])):
+        word = (word or "").strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        confs.append(conf)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, (sum(confs) / len(confs) if confs else 0.0)
+
+
+def _extract_page(path: str, page_no: int) -> Dict[str, Any]:
+    """
+    Text layer first; for image-only pages OCR at low DPI and re-OCR at high
+    DPI only when the low-resolution pass is not confident enough.
+    """
+    t0 = time.perf_counter()
+    page = _open_pdf(path).pages[page_no]
+    try:
+        text = (page.extract_text() or "").strip()
+        method, confidence = "text", None
+        if not text and OCR_AVAILABLE:
+            text, confidence = _ocr(page, PDF_OCR_LOW_DPI)
+            method = f"ocr@{PDF_OCR_LOW_DPI}"
+            if confidence < PDF_OCR_MIN_CONFIDENCE and PDF_OCR_HIGH_DPI > PDF_OCR_LOW_DPI:
+                hi_text, hi_conf = _ocr(page, PDF_OCR_HIGH_DPI)
+                if hi_conf >= confidence:
+                    text, confidence, method = hi_text, hi_conf, f"ocr@{PDF_OCR_HIGH_DPI}"
+            text = text.strip()
+    finally:
+        page.close()  # drop the parsed layout; the document stays open
+    return {
+        "page": page_no + 1,
+        "text": text,
+        "method": method,
+        "confidence": round(confidence, 1) if confidence is not None else None,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def _page_count(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+# ---------- caller side ----------
+def _unlink_when_done(path: str, futures: List[Future]) -> None:
+    """
+    Remove the temp file once no page task can still be reading it.
+    """
+    pending = [f for f in futures if not f.done()]
+    if not pending:
+        os.unlink(path)
+        return
+    lock = threading.Lock()
+    left = [len(pending)]
+
+    def done(_f: Future) -> None:
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    for f in pending:
+        f.add_done_callback(done)
+
+
+async def iter_pdf_pages(
+    pdf_bytes: bytes,
+    max_pages: int = PDF_MAX_PAGES,
+    time_budget_s: float = PDF_TIME_BUDGET_S,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Pages are extracted in parallel in the process pool and yielded in page
+    order as soon as each is ready. Pages past `max_pages` (0 = no limit) or
+    still pending when `time_budget_s` runs out are yielded with method "skipped".
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    tasks: List[Future] = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        try:
+            # Parsing the page tree can take a while on large files: keep it off the event loop
+            n_pages = await asyncio.to_thread(_page_count, path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"PDF extraction error: {str(e)}")
+
+        loop = asyncio.get_running_loop()
+        pool = _get_pool()
+        deadline = loop.time() + time_budget_s
+        limit = min(n_pages, max_pages) if max_pages > 0 else n_pages
+        tasks = [pool.submit(_extract_page, path, i) for i in range(limit)]
+        futures = [asyncio.wrap_future(t) for t in tasks]
+        try:
+            for i, fut in enumerate(futures):
+                remaining = deadline - loop.time()
+                try:
+                    page = await asyncio.wait_for(asyncio.shield(fut), timeout=max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    yield {"page": i + 1, "text": "", "method": "skipped", "confidence": None, "seconds": 0.0}
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"PDF extraction error: {str(e)}")
+                else:
+                    PDF_PAGE_LATENCY.observe(page["seconds"], method=page["method"])
+                    yield page
+        finally:
+            # Pages not started yet are dropped; running ones finish before the file is removed
+            for t in tasks:
+                t.cancel()
+        for i in range(len(futures), n_pages):
+            yield {"page": i + 1, "text": "", "method": "skipped", "confidence": None, "seconds": 0.0}
+    finally:
+        _unlink_when_done(path, tasks)
+
+
+async def extract_pdf_text(pdf_bytes: bytes) -> str:
+    """
+    Async, parallel counterpart of utils.extract_text_from_pdf_bytes.
+    """
+    with stage_timer("pdf_extraction"):
+        pages = [p async for p in iter_pdf_pages(pdf_bytes)]
+    skipped = [p["page"] for p in pages if p["method"] == "skipped"]
+    if skipped:
+        print(f"⚠️ PDF truncated: {len(skipped)}/{len(pages)} pages skipped "
+              f"(PDF_MAX_PAGES={PDF_MAX_PAGES}, PDF_TIME_BUDGET_S={PDF_TIME_BUDGET_S})")
+    return "\n\n".join([p["text"] for p in pages if p["text"]])
+
+
+async def extract_upload_text(filename: str, data: bytes) -> str:
+    """
+    Async counterpart of utils.extract_text_from_upload (PDFs go through the process pool).
+    """
+    fname = (filename or "").lower()
+    if not fname.endswith(".pdf"):
+        return extract_text_from_upload(filename, data)
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty PDF file.")
+    raw_text = await extract_pdf_text(data)
+    if not raw_text.strip():
+        raise HTTPException(status_code=400, detail="No text extracted from PDF.")
+    return raw_text
@@ -0,0 +1,320 @@
+# app/services/pipeline.py
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+
+from app.services.analyzer import analyze_report, run_report_analyzer
+from app.services.reasoning import run_final_reasoning, stream_final_reasoning, reasoning_from_scanner
+from app.services.json_scanner import JsonScanner
+from app.services.retrieval import collection_space, embed_queries, query_guidelines
+from app.services.speculative import SPECULATIVE_INCLUDE, rescore_candidates
+from app.services.context_packer import pack_snippets
+from app.services.metrics import stage_timer, record_timing
+from app.services.single_flight import triage_flight
+from app.services.result_cache import (
+    triage_cache,
+    reasoning_cache,
+    result_cache_enabled,
+    result_cache_stats,
+    input_cache_key,
+    reasoning_cache_key,
+)
+from app.utils import build_retrieval_query_from_analyzer, json_dumps
+from app.config import (
+    BATCH_GROQ_CONCURRENCY,
+    CONTEXT_BUDGET_REASONING,
+    SPECULATIVE_RETRIEVAL,
+    SPECULATIVE_POOL,
+    SPECULATIVE_MIN_OVERLAP,
+)
+
+Hits = Tuple[List[str], List[str], List[float]]
+
+
+async def retrieve_guidelines(retrieval_query: str, query_embedding: Optional[List[float]] = None) -> Hits:
+    """
+    Top-5 guideline snippets/ids/distances; the embedding + Chroma query run off the event loop.
+    """
+    results = await query_guidelines(
+        [retrieval_query], n_results=5, query_embeddings=[query_embedding] if query_embedding is not None else None
+    )
+    return _snippets_from_results(results, 0)
+
+
+async def retrieve_after_analyzer(
+    speculation: Optional["asyncio.Task[Dict[str, Any]]"],
+    retrieval_query: str,
+) -> Tuple[List[str], List[str], List[float], Optional[Dict[str, Any]]]:
+    """
+    Resolve retrieval once the analyzer has returned. With a speculative
+    raw-text query in flight, the refined query is embedded and the
+    speculative pool's stored vectors are re-scored against it; if the
+    refined top-5 within the pool overlaps the speculative top-5 by at least
+    SPECULATIVE_MIN_OVERLAP the hits are reused, otherwise (or if the
+    speculation failed) the refined query searches the whole index.
+    """
+    if speculation is None:
+        return (*await retrieve_guidelines(retrieval_query), None)
+    info: Dict[str, Any] = {"used": False, "overlap": None}
+    try:
+        results = await speculation
+    except Exception as e:
+        info["error"] = _error_detail(e)
+        return (*await retrieve_guidelines(retrieval_query), info)
+    with stage_timer("embedding"):
+        query_embedding = (await embed_queries([retrieval_query]))[0]
+    snippets, ids_, distances, overlap = rescore_candidates(results, query_embedding, 5, collection_space())
+    info["overlap"] = round(overlap, 2)
+    if ids_ and overlap >= SPECULATIVE_MIN_OVERLAP:
+        info["used"] = True
+        return snippets, ids_, distances, info
+    return (*await retrieve_guidelines(retrieval_query, query_embedding), info)
+
+
+def _snippets_from_results(results: Dict[str, Any], pos: int) -> Hits:
+    """
+    Non-empty documents/ids/distances for the `pos`-th query of a Chroma query result.
+    """
+    guideline_snippets: List[str] = []
+    guideline_ids: List[str] = []
+    guideline_distances: List[float] = []
+    if results and results.get("documents"):
+        docs = results["documents"][pos] or []
+        ids_ = (results.get("ids") or [])[pos] or []
+        dists = ((results.get("distances") or [])[pos:pos + 1] or [None])[0] or [0.0] * len(docs)
+        for d, gid, dist in zip(docs, ids_, dists):
+            if d and str(d).strip():
+                guideline_snippets.append(d)
+                guideline_ids.append(gid)
+                guideline_distances.append(dist)
+    return guideline_snippets, guideline_ids, guideline_distances
+
+
+def _respond(state: Dict[str, Any], debug: bool) -> Dict[str, Any]:
+    if debug:
+        return {
+            "triage": state["triage"],
+            "analyzer": state["analyzer"],
+            "retrieval_query": state["retrieval_query"],
+            "guideline_ids": state["guideline_ids"],
+            "guideline_snippets": state["guideline_snippets"][:3],
+            "cache": state["cache"],
+            "speculative_retrieval": state.get("speculative_retrieval"),
+            "context": state.get("context"),
+            "analyzer_info": state.get("analyzer_info"),
+        }
+    return state["triage"]
+
+
+async def triage_events(raw_text: str, stream_tokens: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Analyzer -> retrieval -> final reasoning as a sequence of (stage, data) events:
+    "analyzer", "retrieval", "token" and "field" (only with stream_tokens) and finally
+    "result" carrying the full pipeline state. With RESULT_CACHE_ENABLED, exact
+    repeats skip everything and repeated (query, guideline ids) pairs skip the
+    reasoning call. With SPECULATIVE_RETRIEVAL the raw text is queried while
+    the analyzer runs (see retrieve_after_analyzer).
+    """
+    t0 = time.perf_counter()
+    use_cache = result_cache_enabled()
+    input_key = input_cache_key(raw_text)
+    if use_cache:
+        hit = triage_cache.get(input_key)
+        if hit is not None:
+            state, cost_ms = hit
+            state["cache"] = {"hit": "exact", "saved_ms": round(cost_ms, 1), "stats": result_cache_stats()}
+            yield "analyzer", state["analyzer"]
+            yield "retrieval", {"retrieval_query": state["retrieval_query"], "guideline_ids": state["guideline_ids"]}
+            yield "result", state
+            return
+
+    # 1) Analyzer, with the speculative raw-text retrieval running alongside
+    speculation = None
+    if SPECULATIVE_RETRIEVAL:
+        speculation = asyncio.create_task(
+            query_guidelines([raw_text], n_results=max(5, SPECULATIVE_POOL), include=SPECULATIVE_INCLUDE)
+        )
+    try:
+        with stage_timer("analyzer"):
+            analyzer_json, analyzer_info = await analyze_report(raw_text)
+        yield "analyzer", analyzer_json
+
+        # 2) Retrieval
+        retrieval_query = build_retrieval_query_from_analyzer(analyzer_json, raw_text)
+        with stage_timer("retrieval"):
+            hit_snippets, hit_ids, hit_distances, speculative = await retrieve_after_analyzer(
+                speculation, retrieval_query
+            )
+    finally:
+        if speculation is not None and not speculation.done():
+            speculation.cancel()
+    guideline_snippets, guideline_ids, context = pack_snippets(
+        hit_snippets, hit_ids, hit_distances, CONTEXT_BUDGET_REASONING
+    )
+    retrieval_event: Dict[str, Any] = {"retrieval_query": retrieval_query, "guideline_ids": guideline_ids}
+    if speculative is not None:
+        retrieval_event["speculative"] = speculative["used"]
+    yield "retrieval", retrieval_event
+
+    # 3) Final reasoning
+    cache_hit, saved_ms = None, 0.0
+    r_key = reasoning_cache_key(retrieval_query, guideline_ids)
+    hit = reasoning_cache.get(r_key) if use_cache else None
+    if hit is not None:
+        triage_json, saved_ms = hit
+        cache_hit = "reasoning"
+    else:
+        t_reason = time.perf_counter()
+        if stream_tokens:
+            scanner = JsonScanner(emit_fields=True)
+            async for token in stream_final_reasoning(analyzer_json, guideline_snippets):
+                yield "token", token
+                for key, value in scanner.feed(token):
+                    yield "field", {"key": key, "value": value}
+            triage_json = reasoning_from_scanner(scanner)
+            record_timing("reasoning", time.perf_counter() - t_reason)
+        else:
+            with stage_timer("reasoning"):
+                triage_json = await run_final_reasoning(analyzer_json, guideline_snippets)
+        if use_cache:
+            reasoning_cache.set(r_key, triage_json, (time.perf_counter() - t_reason) * 1000)
+
+    state = {
+        "triage": triage_json,
+        "analyzer": analyzer_json,
+        "retrieval_query": retrieval_query,
+        "guideline_ids": guideline_ids,
+        "guideline_snippets": guideline_snippets,
+        "speculative_retrieval": speculative,
+        "context": context,
+        "analyzer_info": analyzer_info,
+    }
+    if use_cache:
+        triage_cache.set(input_key, state, (time.perf_counter() - t0) * 1000 + saved_ms)
+    state["cache"] = {
+        "hit": cache_hit,
+        "saved_ms": round(saved_ms, 1),
+        "stats": result_cache_stats() if use_cache else None,
+    }
+    yield "result", state
+
+
+async def run_triage_pipeline(raw_text: str, debug: bool = False) -> Dict[str, Any]:
+    """
+    Full pipeline, shared by /triage and /triage-upload. Identical inputs
+    already in flight are awaited instead of recomputed (cache hit "coalesced").
+    """
+    async def compute() -> Dict[str, Any]:
+        state: Dict[str, Any] = {}
+        async for stage, data in triage_events(raw_text):
+            if stage == "result":
+                state = data
+        return state
+
+    # Concurrent duplicates (double submits) share one pipeline run
+    state, shared = await triage_flight.do(input_cache_key(raw_text), compute)
+    if shared:
+        state = {**state, "cache": {**state["cache"], "hit": "coalesced"}}
+    return _respond(state, debug)
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+
+async def stream_triage_pipeline(raw_text: str, debug: bool = False) -> AsyncIterator[str]:
+    """
+    Server-sent events for /triage/stream: `analyzer`, `retrieval`, one `token`
+    per reasoning delta, a `field` ({"key", "value"}) as each top-level reasoning
+    field closes, then `triage` with the validated JSON (same body as
+    /triage). Failures after the stream has started arrive as an `error` event.
+    """
+    try:
+        async for stage, data in triage_events(raw_text, stream_tokens=True):
+            if stage == "result":
+                yield format_sse("triage", _respond(data, debug))
+            else:
+                yield format_sse(stage, data)
+    except HTTPException as e:
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        yield format_sse("error", {"status_code": 500, "detail": str(e)})
+
+
+def _error_detail(e: BaseException) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    return str(e) or e.__class__.__name__
+
+
+async def run_triage_batch(
+    texts: List[Union[str, BaseException]],
+    debug: bool = False,
+    concurrency: int = BATCH_GROQ_CONCURRENCY,
+) -> List[Dict[str, Any]]:
+    """
+    Triage many inputs at once. Analyzer and reasoning calls fan out under a
+    shared Groq concurrency limit; all retrieval queries go through a single
+    batched embedding + Chroma query. Returns one entry per input, in input
+    order: {"index", "ok": True, "result"} or {"index", "ok": False, "error"}.
+    Inputs passed as exceptions (e.g. a failed PDF extraction) are reported as errors.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    errors: Dict[int, str] = {i: _error_detail(t) for i, t in enumerate(texts) if isinstance(t, BaseException)}
+    live = [i for i in range(len(texts)) if i not in errors]
+
+    async def limited(coro):
+        async with sem:
+            return await coro
+
+    # 1) Analyzer fan-out
+    analyzed = await asyncio.gather(*(limited(run_report_analyzer(texts[i])) for i in live), return_exceptions=True)
+    analyzers: Dict[int, Dict[str, Any]] = {}
+    for i, res in zip(live, analyzed):
+        if isinstance(res, BaseException):
+            errors[i] = _error_detail(res)
+        else:
+            analyzers[i] = res
+    live = [i for i in live if i in analyzers]
+
+    # 2) One batched retrieval for every query
+    queries = {i: build_retrieval_query_from_analyzer(analyzers[i], texts[i]) for i in live}
+    retrieved: Dict[int, Tuple[List[str], List[str], Dict[str, Any]]] = {}
+    if live:
+        try:
+            results = await query_guidelines([queries[i] for i in live], n_results=5)
+            for pos, i in enumerate(live):
+                retrieved[i] = pack_snippets(*_snippets_from_results(results, pos), CONTEXT_BUDGET_REASONING)
+        except Exception as e:
+            for i in live:
+                errors[i] = _error_detail(e)
+            live = []
+
+    # 3) Reasoning fan-out
+    reasoned = await asyncio.gather(
+        *(limited(run_final_reasoning(analyzers[i], retrieved[i][0])) for i in live),
+        return_exceptions=True,
+    )
+    out: List[Dict[str, Any]] = []
+    by_index = dict(zip(live, reasoned))
+    for i in range(len(texts)):
+        res = by_index.get(i)
+        if i in errors or res is None:
+            out.append({"index": i, "ok": False, "error": errors.get(i, "Not processed.")})
+        elif isinstance(res, BaseException):
+            out.append({"index": i, "ok": False, "error": _error_detail(res)})
+        else:
+            snippets, ids_, context = retrieved[i]
+            state = {
+                "triage": res,
+                "analyzer": analyzers[i],
+                "retrieval_query": queries[i],
+                "guideline_ids": ids_,
+                "guideline_snippets": snippets,
+                "cache": None,
+                "context": context,
+            }
+            out.append({"index": i, "ok": True, "result": _respond(state, debug)})
+    return out
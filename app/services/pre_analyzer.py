@@ -0,0 +1,277 @@
+# app/services/pre_analyzer.py
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    PRE_ANALYZER_VOCAB,
+    PRE_ANALYZER_SOURCES,
+    PRE_ANALYZER_MIN_CONFIDENCE,
+    PRE_ANALYZER_MAX_TOKENS,
+    PRE_ANALYZER_MIN_TERMS,
+)
+
+CATEGORIES = ("symptoms", "risk_factors", "diagnoses")
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+# Negation scope ends at a clause break; commas included so "no fever, chest pain" keeps the chest pain
+_CLAUSE = re.compile(r"[.,;:\n]|\bbut\b|\bhowever\b|\bexcept\b")
+
+NEGATION_CUES = [("no",), ("not",), ("denies",), ("denied",), ("without",), ("negative", "for"),
+                 ("absence", "of"), ("free", "of"), ("never",), ("nor",)]
+NEGATION_WINDOW = 5
+# Words that carry no clinical content; they neither count as covered nor lower confidence
+FILLER = {
+    "a", "an", "and", "or", "the", "of", "with", "in", "on", "at", "for", "to", "has", "have", "had", "is", "are",
+    "was", "were", "since", "from", "patient", "pt", "complains", "complaining", "reports", "reported",
+    "presents", "presenting", "c", "o", "yo", "y", "year", "years", "old", "male", "female", "man", "woman",
+    "boy", "girl", "day", "days", "hour", "hours", "week", "weeks", "h", "also", "some", "mild", "moderate",
+    "severe", "acute", "sudden", "history", "hx", "known", "his", "her", "x", "ago", "today", "yesterday",
+}
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """
+    (token, start, end) for lower-cased word tokens.
+    """
+    return [(m.group(0), m.start(), m.end()) for m in _TOKEN.finditer(text.lower())]
+
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over word tokens: every vocabulary phrase is found
+    in one left-to-right pass regardless of vocabulary size, and matches
+    always align with word boundaries.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.phrases: List[Tuple[Tuple[str, ...], str, str]] = []  # (tokens, category, display text)
+        self._built = False
+
+    def add(self, phrase: str, category: str) -> None:
+        tokens = tuple(t for t, _, _ in tokenize(phrase))
+        if not tokens or all(t in FILLER for t in tokens):
+            return
+        node = 0
+        for tok in tokens:
+            nxt = self._goto[node].get(tok)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][tok] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if self._out[node]:
+            return  # first category wins for duplicate phrases
+        self._out[node].append(len(self.phrases))
+        self.phrases.append((tokens, category, " ".join(tokens)))
+        self._built = False
+
+    def build(self) -> None:
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for tok, child in self._goto[node].items():
+                queue.append(child)
+                if node == 0:
+                    self._fail[child] = 0
+                    continue
+                f = self._fail[node]
+                while f and tok not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(tok, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def find(self, tokens: List[str]) -> List[Tuple[int, int, int]]:
+        """
+        Leftmost-longest non-overlapping matches as (start_token, end_token, phrase_id).
+        """
+        if not self._built:
+            self.build()
+        found: List[Tuple[int, int, int]] = []
+        node = 0
+        for i, tok in enumerate(tokens):
+            while node and tok not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(tok, 0)
+            for pid in self._out[node]:
+                found.append((i + 1 - len(self.phrases[pid][0]), i + 1, pid))
+        found.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        chosen: List[Tuple[int, int, int]] = []
+        end = 0
+        for m in found:
+            if m[0] >= end:
+                chosen.append(m)
+                end = m[1]
+        return chosen
+
+
+def _vocabulary_from_guidelines(items: Iterable[Dict[str, Any]]) -> Iterable[Tuple[str, str]]:
+    # Structured metadata only: the free-text sentences yield fragments, not clinical terms
+    for it in items:
+        meta = it.get("metadata") or {}
+        if meta.get("condition"):
+            yield str(meta["condition"]), "diagnoses"
+        for key, category in (("symptoms", "symptoms"), ("diagnosis", "diagnoses")):
+            values = meta.get(key) or []
+            for v in [values] if isinstance(values, str) else values:
+                yield str(v), category
+
+
+def build_automaton(vocab_path: str, sources: List[str]) -> PhraseAutomaton:
+    """
+    Curated vocabulary first (its categories win), then every phrase found in
+    the guideline files' metadata. Missing files are skipped.
+    """
+    automaton = PhraseAutomaton()
+    if vocab_path and os.path.exists(vocab_path):
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        for category in CATEGORIES:
+            for phrase in vocab.get(category) or []:
+                automaton.add(phrase, category)
+    for path in sources:
+        path = path.strip()
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for phrase, category in _vocabulary_from_guidelines(json.load(f)):
+                automaton.add(phrase, category)
+    automaton.build()
+    return automaton
+
+
+def _negated_spans(text: str, tokens: List[Tuple[str, int, int]]) -> List[bool]:
+    """
+    NegEx-style scope: a token is negated when a negation cue precedes it by
+    at most NEGATION_WINDOW tokens within the same clause.
+    """
+    clause_breaks = [m.start() for m in _CLAUSE.finditer(text.lower())]
+    clause_of = []
+    b = 0
+    for _, start, _ in tokens:
+        while b < len(clause_breaks) and clause_breaks[b] < start:
+            b += 1
+        clause_of.append(b)
+    words = [t for t, _, _ in tokens]
+    negated = [False] * len(tokens)
+    for i in range(len(words)):
+        for cue in NEGATION_CUES:
+            if tuple(words[i:i + len(cue)]) == cue:
+                j0 = i + len(cue)
+                for j in range(j0, min(len(words), j0 + NEGATION_WINDOW)):
+                    if clause_of[j] != clause_of[i]:
+                        break
+                    negated[j] = True
+    return negated
+
+
+def _is_cue_token(i: int, words: List[str]) -> bool:
+    return any(words[i - k:i - k + len(cue)] == list(cue)
+               for cue in NEGATION_CUES for k in range(len(cue)) if i - k >= 0)
+
+
+class PreAnalyzer:
+    """
+    Deterministic extractor producing the analyzer's {symptoms, risk_factors,
+    diagnoses} dict. Confidence is the share of clinical (non-filler) tokens
+    explained by vocabulary matches or negation cues, scaled down for inputs
+    longer than PRE_ANALYZER_MAX_TOKENS; free-text narratives stay with the LLM.
+    An input is only confident with at least `min_terms` distinct findings, so
+    a lone generic word ("pain") always goes to the Groq analyzer.
+    """
+
+    def __init__(self, vocab_path: str = PRE_ANALYZER_VOCAB, sources: Optional[List[str]] = None,
+                 min_confidence: float = PRE_ANALYZER_MIN_CONFIDENCE, max_tokens: int = PRE_ANALYZER_MAX_TOKENS,
+                 min_terms: int = PRE_ANALYZER_MIN_TERMS):
+        self.vocab_path = vocab_path
+        self.sources = PRE_ANALYZER_SOURCES if sources is None else sources
+        self.min_confidence = min_confidence
+        self.max_tokens = max(1, max_tokens)
+        self.min_terms = max(1, min_terms)
+        self._automaton: Optional[PhraseAutomaton] = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "skipped": 0, "local_ms": 0.0, "groq_calls": 0, "groq_ms": 0.0}
+
+    @property
+    def automaton(self) -> PhraseAutomaton:
+        if self._automaton is None:
+            with self._lock:
+                if self._automaton is None:
+                    self._automaton = build_automaton(self.vocab_path, self.sources)
+        return self._automaton
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """
+        {"result": {symptoms, risk_factors, diagnoses}, "confidence", "confident",
+        "terms", "negated": [...], "ms"}.
+        """
+        t0 = time.perf_counter()
+        automaton = self.automaton
+        tokens = tokenize(text or "")
+        words = [t for t, _, _ in tokens]
+        negated = _negated_spans(text or "", tokens)
+        result: Dict[str, List[str]] = {k: [] for k in CATEGORIES}
+        negated_phrases: List[str] = []
+        covered = [False] * len(words)
+        for start, end, pid in automaton.find(words):
+            _, category, display = automaton.phrases[pid]
+            for i in range(start, end):
+                covered[i] = True
+            if all(negated[start:end]):
+                negated_phrases.append(display)
+            elif display not in result[category]:
+                result[category].append(display)
+
+        content = [i for i, w in enumerate(words) if w not in FILLER and not w.isdigit()]
+        explained = sum(1 for i in content if covered[i] or _is_cue_token(i, words))
+        confidence = 0.0
+        if content and any(result.values()):
+            confidence = explained / len(content) * min(1.0, self.max_tokens / len(words))
+        terms = sum(len(v) for v in result.values()) + len(set(negated_phrases))
+        ms = (time.perf_counter() - t0) * 1000
+        return {
+            "result": result,
+            "confidence": round(confidence, 3),
+            "confident": confidence >= self.min_confidence and terms >= self.min_terms,
+            "terms": terms,
+            "negated": negated_phrases,
+            "ms": round(ms, 3),
+        }
+
+    def record(self, skipped: bool, local_ms: float, groq_ms: Optional[float] = None) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["local_ms"] += local_ms
+            if skipped:
+                self._stats["skipped"] += 1
+            if groq_ms is not None:
+                self._stats["groq_calls"] += 1
+                self._stats["groq_ms"] += groq_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        groq_avg = s["groq_ms"] / s["groq_calls"] if s["groq_calls"] else 0.0
+        local_avg = s["local_ms"] / s["calls"] if s["calls"] else 0.0
+        return {
+            "calls": s["calls"],
+            "skipped": s["skipped"],
+            "skip_rate": round(s["skipped"] / s["calls"], 4) if s["calls"] else 0.0,
+            "local_ms_avg": round(local_avg, 3),
+            "groq_analyzer_ms_avg": round(groq_avg, 1),
+            "est_saved_ms": round(s["skipped"] * max(0.0, groq_avg - local_avg), 1),
+            "phrases": len(self._automaton.phrases) if self._automaton is not None else None,
+        }
+
+
+pre_analyzer = PreAnalyzer()
@@ -0,0 +1,60 @@
+# app/services/process_memory.py
+import os
+from typing import Any, Dict, Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except Exception:
+    PSUTIL_AVAILABLE = False
+
+_SMAPS_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_mb",
+    "Shared_Dirty": "shared_mb",
+    "Private_Clean": "private_mb",
+    "Private_Dirty": "private_mb",
+}
+
+
+def _smaps_rollup(pid: int) -> Optional[Dict[str, float]]:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    out = {"rss_mb": 0.0, "pss_mb": 0.0, "shared_mb": 0.0, "private_mb": 0.0}
+    for line in lines:
+        name, _, rest = line.partition(":")
+        key = _SMAPS_FIELDS.get(name)
+        if key is not None:
+            out[key] += int(rest.split()[0]) / 1024.0  # kB
+    return out
+
+
+def memory_info(pid: Optional[int] = None) -> Dict[str, Any]:
+    """
+    RSS plus how much of it is shared: PSS splits shared pages between the
+    processes mapping them, private is what the process alone holds (USS).
+    Summing RSS over forked workers counts shared weights once per worker;
+    summing PSS does not. Linux smaps_rollup first, psutil as fallback.
+    """
+    pid = pid or os.getpid()
+    info = _smaps_rollup(pid)
+    if info is None and PSUTIL_AVAILABLE:
+        try:
+            full = psutil.Process(pid).memory_full_info()
+        except Exception:
+            full = None
+        if full is not None:
+            rss = full.rss / 2**20
+            uss = getattr(full, "uss", 0) / 2**20
+            info = {"rss_mb": rss, "pss_mb": getattr(full, "pss", 0) / 2**20 or None,
+                    "shared_mb": rss - uss if uss else None, "private_mb": uss or None}
+    info = info or {"rss_mb": None, "pss_mb": None, "shared_mb": None, "private_mb": None}
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in info.items()}
+
+
+def process_stats() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "worker_id": os.getenv("TRIAGE_WORKER_ID"), **memory_info()}
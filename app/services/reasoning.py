@@ -1,18 +1,15 @@
 # app/services/reasoning.py
 import json
-from typing import Dict, Any, List
-from app.services.groq import groq_chat
+from typing import AsyncIterator, Dict, Any, List, Optional
+from app.services.groq import groq_chat, groq_chat_stream
+from app.services.groq_scheduler import PRIORITY_REASONING
+from app.services.json_scanner import JsonScanner
+from app.services.metrics import JSON_EXTRACT
 from app.utils import extract_json_from_text
 from app.config import TEMPERATURE_REASON
 
 
-async def run_final_reasoning(analyzer_json: Dict[str, Any], guideline_snippets: List[str]) -> Dict[str, Any]:
-    """
-    Produce STRICT JSON:
-      triage_level: string
-      explanation: string
-      recommendations: string[]
-    """
+def build_reasoning_messages(analyzer_json: Dict[str, Any], guideline_snippets: List[str]) -> List[Dict[str, str]]:
     facts = json.dumps(analyzer_json, ensure_ascii=False)
     ctx = "\n\n".join(guideline_snippets) if guideline_snippets else "No relevant guidelines found."
 
@@ -26,16 +23,59 @@ async def run_final_reasoning(analyzer_json: Dict[str, Any], guideline_snippets:
         "If no guidelines are available, infer a cautious triage level from facts; if insufficient, use 'Unknown'."
     )
     user_prompt = f"Structured patient facts:\n{facts}\n\nRetrieved guideline snippets:\n{ctx}\n\nReturn ONLY the JSON."
+    return [{"role": "system", "content": sys_prompt},
+            {"role": "user", "content": user_prompt}]
+
 
+async def run_final_reasoning(analyzer_json: Dict[str, Any], guideline_snippets: List[str]) -> Dict[str, Any]:
+    """
+    Produce STRICT JSON:
+      triage_level: string
+      explanation: string
+      recommendations: string[]
+    """
     content = await groq_chat(
-        messages=[{"role": "system", "content": sys_prompt},
-                  {"role": "user", "content": user_prompt}],
+        messages=build_reasoning_messages(analyzer_json, guideline_snippets),
         temperature=TEMPERATURE_REASON,
         max_tokens=700,
         force_json=True,  # <- Enforce pure JSON
+        priority=PRIORITY_REASONING,
     )
+    return parse_reasoning_output(content)
+
+
+async def stream_final_reasoning(analyzer_json: Dict[str, Any], guideline_snippets: List[str]) -> AsyncIterator[str]:
+    """
+    Raw reasoning tokens as Groq streams them; feed them to a JsonScanner(emit_fields=True)
+    and finish with reasoning_from_scanner.
+    """
+    async for token in groq_chat_stream(
+        messages=build_reasoning_messages(analyzer_json, guideline_snippets),
+        temperature=TEMPERATURE_REASON,
+        max_tokens=700,
+        force_json=True,
+        priority=PRIORITY_REASONING,
+    ):
+        yield token
+
+
+def parse_reasoning_output(content: str) -> Dict[str, Any]:
+    """
+    Validate model output into the triage schema (safe default if unparsable).
+    """
+    return normalize_reasoning(extract_json_from_text(content))
+
+
+def reasoning_from_scanner(scanner: JsonScanner) -> Dict[str, Any]:
+    """
+    Same as parse_reasoning_output for a streamed response already fed to `scanner`.
+    """
+    parsed = scanner.close()
+    JSON_EXTRACT.inc(outcome=scanner.outcome)
+    return normalize_reasoning(parsed)
+
 
-    parsed = extract_json_from_text(content)
+def normalize_reasoning(parsed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     if parsed is None:
         # Last resort fallback: safe default
         return {
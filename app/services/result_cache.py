@@ -0,0 +1,131 @@
+# app/services/result_cache.py
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_GENERATION_FILE,
+)
+from app.utils import _hash_id
+from app.services.metrics import CACHE_LOOKUPS
+
+
+class TTLCache:
+    """
+    Small LRU cache with per-entry expiry. Each entry remembers how long it
+    took to compute so hits can report the latency they saved. With a
+    `generation_file`, a change of that file's mtime (another worker process
+    invalidated) empties the cache before the next lookup.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, name: str = "result", generation_file: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.generation_file = generation_file
+        self._generation = _generation(generation_file)
+        self._data: "OrderedDict[str, Tuple[float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Returns (value, cost_ms) or None. Values are deep-copied so callers can mutate them.
+        """
+        now = time.monotonic()
+        generation = _generation(self.generation_file)
+        with self._lock:
+            if generation != self._generation:
+                self._data.clear()
+                self._generation = generation
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry[1]
+            CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+            return copy.deepcopy(entry[2]), entry[1]
+
+    def set(self, key: str, value: Any, cost_ms: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, cost_ms, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+
+def _generation(path: Optional[str]) -> int:
+    if not path:
+        return 0
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+# Level 1: whole /triage response keyed on the normalized input text
+triage_cache = TTLCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, name="triage",
+                        generation_file=RESULT_CACHE_GENERATION_FILE)
+# Level 2: final reasoning keyed on retrieval query + retrieved guideline ids
+reasoning_cache = TTLCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, name="reasoning",
+                           generation_file=RESULT_CACHE_GENERATION_FILE)
+
+
+def result_cache_enabled() -> bool:
+    return RESULT_CACHE_ENABLED
+
+
+def input_cache_key(raw_text: str) -> str:
+    return _hash_id(re.sub(r"\s+", " ", raw_text).strip().lower())
+
+
+def reasoning_cache_key(retrieval_query: str, guideline_ids) -> str:
+    return _hash_id(retrieval_query + "\x1f" + ",".join(guideline_ids))
+
+
+def invalidate_result_caches() -> None:
+    """
+    Called whenever guidelines change: cached answers may cite stale guidance.
+    Touching the generation file makes the other worker processes drop theirs too.
+    """
+    triage_cache.clear()
+    reasoning_cache.clear()
+    try:
+        os.makedirs(os.path.dirname(RESULT_CACHE_GENERATION_FILE) or ".", exist_ok=True)
+        with open(RESULT_CACHE_GENERATION_FILE, "w") as f:
+            f.write(str(time.time_ns()))
+    except OSError as e:
+        print(f"⚠️ Could not signal result cache invalidation to other workers: {e}")
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    return {"triage": triage_cache.stats(), "reasoning": reasoning_cache.stats()}
@@ -1,12 +1,379 @@
 # app/services/retrieval.py
-import chromadb
-from app.services.embeddings import BioGPTEmbeddingFunction
-from app.config import CHROMA_PATH, CHROMA_COLLECTION
-
-# ChromaDB persistent client & collection (same as original)
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-embedding_fn = BioGPTEmbeddingFunction()
-collection = chroma_client.get_or_create_collection(
-    name=CHROMA_COLLECTION,
-    embedding_function=embedding_fn,
+import asyncio
+import atexit
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from app.services.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from app.services.inference import inference_executor
+from app.services.batching import EmbeddingBatcher
+from app.services.vector_index import NumpyIndex
+from app.services.metrics import stage_timer
+from app.services.single_flight import embedding_flight
+from app.config import (
+    CHROMA_PATH,
+    CHROMA_COLLECTION,
+    CHROMA_MODE,
+    CHROMA_HOST,
+    CHROMA_PORT,
+    RETRIEVER_BACKEND,
+    RETRIEVER_SNAPSHOT_DIR,
+    RETRIEVER_SPACE,
+    RETRIEVER_DTYPE,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBED_THREADS,
+    EMBED_ONNX_DIR,
+    EMBED_BULK_BATCH_SIZE,
+    EMBED_BATCHING,
+    EMBED_BATCH_WINDOW_MS,
+    EMBED_MAX_BATCH,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_DIR,
+    EMBED_CACHE_MAX_ROWS,
+    EMBED_CACHE_LRU_SIZE,
 )
+
+# Populated by init_retrieval(); nothing heavy happens at import time.
+chroma_client = None
+model_fn = None  # the bare model; embedding_fn wraps it with the cache
+model_warm = False
+embedding_fn = None
+embedding_cache: Optional[EmbeddingCache] = None
+embedding_batcher: Optional[EmbeddingBatcher] = None
+embedding_info: Dict[str, Any] = {}
+embedding_mismatch: Optional[str] = None
+embedding_stale: Optional[str] = None  # pooling changed: old vectors still served until re-embedded
+collection = None
+startup_timings: Dict[str, float] = {}
+
+_init_lock = threading.Lock()
+_initializing = False
+
+
+_SIGNATURE_KEYS = ("embedding_backend", "embedding_model", "embedding_dim", "embedding_pooling")
+# What collections built before a field was recorded were embedded with
+_LEGACY_SIGNATURE = {
+    "embedding_backend": "torch",
+    "embedding_model": "microsoft/biogpt",
+    "embedding_dim": 1024,
+    "embedding_pooling": "mean",
+}
+
+
+def _check_embedding_compat(coll) -> Optional[str]:
+    """
+    Compare the backend that built the collection with the configured one.
+    Collections created before backends were recorded were built by eager BioGPT,
+    and ones created before pooling was recorded used the padded "mean".
+    A pooling-only difference is not fatal: it is recorded in `embedding_stale`
+    and the warm-up re-embeds the collection in place.
+    """
+    global embedding_stale
+    embedding_stale = None
+    stored = dict(coll.metadata or {})
+    if "embedding_backend" not in stored and coll.count() == 0:
+        coll.modify(metadata=embedding_info)
+        return None
+    meta = dict(_LEGACY_SIGNATURE)
+    if "embedding_backend" in stored:
+        meta.update({k: stored[k] for k in _SIGNATURE_KEYS if k in stored})
+    built = tuple(meta.get(k) for k in _SIGNATURE_KEYS)
+    current = tuple(embedding_info[k] for k in _SIGNATURE_KEYS)
+    if built == current:
+        if any(k not in stored for k in _SIGNATURE_KEYS):
+            coll.modify(metadata=embedding_info)
+        return None
+    if built[:3] == current[:3]:
+        embedding_stale = (
+            f"Collection '{CHROMA_COLLECTION}' was embedded with {built[3]} pooling but the model now "
+            f"uses {current[3]}; serving the old vectors until it is re-embedded."
+        )
+        return None
+    return (
+        f"Collection '{CHROMA_COLLECTION}' was built with {built[0]}/{built[1]} ({built[2]}-d) "
+        f"but EMBEDDING_BACKEND is {current[0]}/{current[1]} ({current[2]}-d). "
+        f"Use another CHROMA_COLLECTION or rebuild it with the current backend."
+    )
+
+
+def _load_model(warmup: bool) -> None:
+    global model_fn, model_warm, embedding_info
+    if model_fn is None:
+        t = time.perf_counter()
+        # Heavy imports live here so `import app.main` stays fast
+        from app.services.embeddings import create_embedding_function
+        startup_timings["imports_ms"] = round((time.perf_counter() - t) * 1000, 1)
+
+        t = time.perf_counter()
+        fn = create_embedding_function(
+            EMBEDDING_BACKEND,
+            EMBEDDING_MODEL,
+            threads=EMBED_THREADS,
+            onnx_dir=EMBED_ONNX_DIR,
+            batch_size=EMBED_BULK_BATCH_SIZE,
+        )
+        startup_timings["model_load_ms"] = round((time.perf_counter() - t) * 1000, 1)
+        embedding_info = {
+            "embedding_backend": fn.backend,
+            "embedding_model": fn.model_name,
+            "embedding_dim": fn.dimension,
+            "embedding_pooling": fn.pooling,
+        }
+        model_fn = fn
+    if warmup and not model_warm:
+        t = time.perf_counter()
+        model_fn(["warm-up query: chest pain and shortness of breath"])
+        startup_timings["warmup_ms"] = round((time.perf_counter() - t) * 1000, 1)
+        model_warm = True
+
+
+def preload_model() -> Dict[str, float]:
+    """
+    Load the embedding weights without running them (no thread pools yet), for
+    the pre-fork server: forked workers reuse the weights and warm up on their own.
+    """
+    with _init_lock:
+        _load_model(warmup=False)
+        module = getattr(model_fn, "model", None)
+        if hasattr(module, "share_memory"):
+            # torch: parameters move to shared memory, so no worker ever gets a private copy-on-write page
+            module.share_memory()
+    return dict(startup_timings)
+
+
+def _open_chroma_client():
+    import chromadb
+    if CHROMA_MODE == "http":
+        # One Chroma server shared by every worker process
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    # ChromaDB persistent client & collection (same as original)
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+def _open_chroma_collection(client):
+    """
+    Open the existing collection as is; metadata is only written on creation.
+    Depending on the chromadb version, get_or_create_collection(metadata=...)
+    overwrites an existing collection's metadata, which would hide a backend
+    mismatch from _check_embedding_compat.
+    """
+    try:
+        return client.get_collection(name=CHROMA_COLLECTION, embedding_function=embedding_fn)
+    except Exception:
+        pass
+    try:
+        return client.create_collection(name=CHROMA_COLLECTION, embedding_function=embedding_fn, metadata=embedding_info)
+    except Exception:
+        # Created concurrently by another worker
+        return client.get_collection(name=CHROMA_COLLECTION, embedding_function=embedding_fn)
+
+
+def init_retrieval(warmup: bool = True) -> Dict[str, float]:
+    """
+    Load the embedding model, run one dummy batch so kernels/buffers are
+    allocated before real traffic, then open Chroma. Idempotent and thread-safe;
+    returns the per-step timings in ms. Weights already loaded by
+    preload_model() are reused.
+    """
+    global chroma_client, embedding_fn, embedding_cache, embedding_batcher
+    global embedding_mismatch, collection, _initializing
+    with _init_lock:
+        if collection is not None:
+            return startup_timings
+        _initializing = True
+        try:
+            _load_model(warmup)
+            fn = model_fn
+
+            # Repeated guideline texts / retrieval queries are served from disk instead of re-embedded
+            if EMBED_CACHE_ENABLED:
+                # Pre-fork workers each get their own cache directory: the store is single-writer
+                worker = os.getenv("TRIAGE_WORKER_ID")
+                cache_dir = os.path.join(EMBED_CACHE_DIR, f"worker-{worker}") if worker else EMBED_CACHE_DIR
+                embedding_cache = EmbeddingCache(cache_dir, max_rows=EMBED_CACHE_MAX_ROWS, lru_size=EMBED_CACHE_LRU_SIZE)
+                fn = CachedEmbeddingFunction(fn, embedding_cache)
+                atexit.register(embedding_cache.flush)
+            embedding_fn = fn
+
+            t = time.perf_counter()
+            if RETRIEVER_BACKEND == "numpy":
+                coll = NumpyIndex.load_or_create(
+                    os.path.join(RETRIEVER_SNAPSHOT_DIR, CHROMA_COLLECTION),
+                    CHROMA_COLLECTION,
+                    embedding_function=embedding_fn,
+                    metadata=embedding_info,
+                    space=RETRIEVER_SPACE,
+                    dtype=RETRIEVER_DTYPE,
+                )
+            else:
+                chroma_client = _open_chroma_client()
+                coll = _open_chroma_collection(chroma_client)
+            embedding_mismatch = _check_embedding_compat(coll)
+            if embedding_mismatch:
+                print(f"❌ {embedding_mismatch}")
+            elif embedding_stale:
+                print(f"⚠️ {embedding_stale}")
+            startup_timings["index_open_ms"] = round((time.perf_counter() - t) * 1000, 1)
+
+            embedding_batcher = EmbeddingBatcher(
+                embedding_fn,
+                inference_executor,
+                window_ms=EMBED_BATCH_WINDOW_MS,
+                max_batch=EMBED_MAX_BATCH,
+            )
+            collection = coll  # set last: marks retrieval as ready
+        finally:
+            _initializing = False
+    return startup_timings
+
+
+def retrieval_ready() -> bool:
+    return collection is not None
+
+
+def get_collection():
+    """
+    The guideline collection, initializing retrieval on first use (scripts, CLI).
+    """
+    if collection is None:
+        init_retrieval()
+    return collection
+
+
+async def ensure_retrieval() -> None:
+    """
+    Request-path guard: 503 while the lifespan warm-up is still running,
+    otherwise run the whole warm-up (model, collection, guideline sync and
+    readiness flags) off the event loop.
+    """
+    if collection is not None:
+        return
+    if _initializing:
+        raise HTTPException(
+            status_code=503,
+            detail="Retrieval index is warming up, retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+    from app.services.startup import startup_state, warm_up
+
+    await asyncio.to_thread(warm_up)
+    if collection is None:
+        raise HTTPException(status_code=503, detail=f"Retrieval is unavailable: {startup_state.error}")
+
+
+def assert_embedding_compatible() -> None:
+    """
+    Refuse queries/writes that would mix vectors from different embedding backends.
+    """
+    if embedding_mismatch:
+        raise HTTPException(status_code=409, detail=embedding_mismatch)
+
+
+def persist_collection() -> None:
+    """
+    Snapshot the in-memory index after writes (Chroma persists on its own).
+    """
+    if isinstance(collection, NumpyIndex):
+        collection.persist()
+
+
+def reembed_collection(batch_size: int = 64) -> int:
+    """
+    Re-embed every stored document with the current model, e.g. after the
+    pooling changed; ids, documents and metadata are kept. Only valid when
+    backend, model and dimension still match. Returns the number of documents.
+    """
+    global embedding_mismatch, embedding_stale
+    coll = get_collection()
+    stored = dict(coll.metadata or {})
+    if any(stored.get(k, _LEGACY_SIGNATURE[k]) != embedding_info[k] for k in _SIGNATURE_KEYS[:3]):
+        raise RuntimeError(embedding_mismatch or "Collection was built with another embedding model.")
+    total = coll.count()
+    done = 0
+    for offset in range(0, total, batch_size):
+        page = coll.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        coll.upsert(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=embedding_fn(page["documents"]),
+        )
+        done += len(page["ids"])
+    coll.modify(metadata={**stored, **embedding_info})
+    embedding_mismatch = embedding_stale = None
+    persist_collection()
+    return done
+
+
+def close_retrieval() -> None:
+    if embedding_cache is not None:
+        embedding_cache.flush()
+    persist_collection()
+
+
+def retrieval_stats() -> Dict[str, Any]:
+    return {
+        "ready": retrieval_ready(),
+        "backend": RETRIEVER_BACKEND,
+        "documents": collection.count() if collection is not None else None,
+        "embedding": embedding_info or None,
+        "embedding_stale": embedding_stale,
+        "embedding_batcher": embedding_batcher.stats() if embedding_batcher is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+    }
+
+
+async def embed_queries(query_texts: List[str]) -> List[List[float]]:
+    """
+    Query vectors, coalesced with identical queries already being embedded.
+    Through the micro-batcher each text is its own flight; without it the
+    whole list is one executor call and one flight.
+    """
+    if EMBED_BATCHING:
+        flights = await asyncio.gather(*(
+            embedding_flight.do(text, lambda text=text: embedding_batcher.embed(text)) for text in query_texts
+        ))
+        return [vector for vector, _ in flights]
+    vectors, _ = await embedding_flight.do(
+        "\x1e".join(query_texts), lambda: inference_executor.run(embedding_fn, list(query_texts))
+    )
+    return vectors
+
+
+async def query_guidelines(
+    query_texts: List[str],
+    n_results: int = 5,
+    include: Optional[List[str]] = None,
+    query_embeddings: Optional[List[List[float]]] = None,
+) -> Dict[str, Any]:
+    """
+    collection.query on the inference executor (embedding + HNSW search are
+    blocking); raises 503 when the executor queue is full. With EMBED_BATCHING
+    the query embeddings go through the micro-batcher first. Embedding and the
+    index search are timed as separate stages. `query_embeddings` skips the
+    embedding of texts the caller already embedded.
+    """
+    await ensure_retrieval()
+    assert_embedding_compatible()
+    if query_embeddings is None:
+        with stage_timer("embedding"):
+            query_embeddings = await embed_queries(query_texts)
+    kwargs: Dict[str, Any] = {"include": include} if include is not None else {}
+    with stage_timer("vector_query"):
+        return await inference_executor.run(
+            collection.query, query_embeddings=query_embeddings, n_results=n_results, **kwargs
+        )
+
+
+def collection_space() -> str:
+    """
+    Distance function of the guideline collection (Chroma's default is squared l2).
+    """
+    if isinstance(collection, NumpyIndex):
+        return collection.space
+    return str(((collection.metadata if collection is not None else None) or {}).get("hnsw:space", "l2"))
@@ -0,0 +1,431 @@
+# app/services/sessions.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from app.config import (
+    CHAT_SESSION_TTL,
+    CHAT_SESSION_MAX,
+    CHAT_SESSION_KEEP_MESSAGES,
+    CHAT_SESSION_SUMMARIZE_AFTER,
+    CHAT_SESSION_SUMMARY_MAX_TOKENS,
+    CHAT_SESSION_STORE,
+    CHAT_SESSION_DB,
+    CONTEXT_BUDGET_CHAT,
+    CONTEXT_CHAT_MAX_MESSAGES,
+    TEMPERATURE_CHAT,
+)
+from app.services.context_packer import estimate_tokens, pack_history
+from app.services.groq import groq_chat, groq_chat_stream
+from app.services.groq_scheduler import PRIORITY_BACKGROUND
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a safe clinical assistant. You explain triage results, guidelines, "
+    "and medical concepts. NEVER provide personal medical advice or dosing."
+)
+
+
+class ChatSession:
+    """
+    Server-side conversation state: the triage result, a rolling summary of
+    older turns and the most recent messages verbatim.
+    """
+
+    def __init__(self, triage: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.triage = triage
+        self.summary = ""
+        self.messages: List[Dict[str, str]] = []
+        self.turns = 0
+        self.lock = asyncio.Lock()  # one reply at a time per session
+        self.summarizing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "triage": self.triage,
+            "summary": self.summary,
+            "messages": list(self.messages),
+            "turns": self.turns,
+        }
+
+
+class SessionStore:
+    """
+    LRU of chat sessions with an idle TTL; every access refreshes the expiry.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def create(self, triage: Optional[Dict[str, Any]] = None) -> ChatSession:
+        session = ChatSession(triage)
+        with self._lock:
+            self._data[session.id] = (time.monotonic() + self.ttl, session)
+            self.created += 1
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < now:
+                del self._data[session_id]
+                self.expired += 1
+                return None
+            self._data[session_id] = (now + self.ttl, entry[1])
+            self._data.move_to_end(session_id)
+            return entry[1]
+
+    def require(self, session_id: str) -> ChatSession:
+        session = self.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired chat session.")
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._data.pop(session_id, None) is not None
+
+    # ---------- turn updates (overridden by the shared store) ----------
+    def record_turn(self, session: ChatSession, query: str, reply: str) -> None:
+        session.messages.append({"role": "user", "content": query})
+        session.messages.append({"role": "assistant", "content": reply})
+        session.turns += 1
+
+    def claim_summary(self, session: ChatSession) -> bool:
+        """
+        True when the caller may summarize `session` (no summary is running).
+        """
+        if session.summarizing:
+            return False
+        session.summarizing = True
+        return True
+
+    def save_summary(self, session: ChatSession, summary: str, folded: int) -> None:
+        # Turns appended while the summary was generated stay in session.messages
+        session.summary = summary
+        del session.messages[:folded]
+
+    def release_summary(self, session: ChatSession) -> None:
+        session.summarizing = False
+
+    def _count(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "store": "memory",
+                "sessions": self._count(),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "summaries": _summary_stats["runs"],
+                "summary_failures": _summary_stats["failures"],
+            }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    triage TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    turns INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    summarizing_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at);
+CREATE TABLE IF NOT EXISTS session_messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_messages_session ON session_messages (session_id, seq);
+"""
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Chat sessions in one SQLite file, so every worker of app.cli.serve sees
+    every session whichever process accepted the request. Same TTL and LRU
+    bound as the memory store (expiry is wall-clock time, shared by all
+    processes); a summary run is claimed with a lease so only one worker
+    folds a session at a time. Replies are serialized per session within a
+    process only.
+    """
+
+    def __init__(self, path: str, ttl: float, max_sessions: int, summary_lease_s: float = 120.0):
+        super().__init__(ttl, max_sessions)
+        self.path = path
+        self.summary_lease_s = summary_lease_s
+        self._db: Optional[sqlite3.Connection] = None
+        # One asyncio.Lock per live session in this process, shared by the objects loaded for it
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    # ---------- storage ----------
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def _attach_lock(self, session: ChatSession) -> ChatSession:
+        lock = self._session_locks.get(session.id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session.id] = lock
+        session.lock = lock
+        return session
+
+    def _delete_locked(self, db: sqlite3.Connection, where: str, params: tuple) -> int:
+        ids = [r["id"] for r in db.execute(f"SELECT id FROM sessions WHERE {where}", params)]
+        for session_id in ids:
+            db.execute("DELETE FROM session_messages WHERE session_id=?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE id=?", (session_id,))
+        return len(ids)
+
+    def create(self, triage: Optional[Dict[str, Any]] = None) -> ChatSession:
+        session = ChatSession(triage)
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT INTO sessions (id, triage, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (session.id, json.dumps(triage, ensure_ascii=False) if triage is not None else None,
+                     now, now + self.ttl),
+                )
+                self.created += 1
+                self.expired += self._delete_locked(db, "expires_at<?", (now,))
+                # Least recently used first: expires_at is refreshed on every access
+                self.evicted += self._delete_locked(
+                    db, "id IN (SELECT id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return self._attach_lock(session)
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT * FROM sessions WHERE id=?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if row["expires_at"] < now:
+                db.execute("BEGIN IMMEDIATE")
+                self.expired += self._delete_locked(db, "id=? AND expires_at<?", (session_id, now))
+                db.execute("COMMIT")
+                return None
+            db.execute("UPDATE sessions SET expires_at=? WHERE id=?", (now + self.ttl, session_id))
+            messages = db.execute(
+                "SELECT role, content FROM session_messages WHERE session_id=? ORDER BY seq", (session_id,)
+            ).fetchall()
+        session = ChatSession(json.loads(row["triage"]) if row["triage"] else None, session_id=session_id)
+        session.summary = row["summary"]
+        session.turns = row["turns"]
+        session.messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        return self._attach_lock(session)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            deleted = self._delete_locked(db, "id=?", (session_id,))
+            db.execute("COMMIT")
+        return deleted > 0
+
+    # ---------- turn updates ----------
+    def record_turn(self, session: ChatSession, query: str, reply: str) -> None:
+        super().record_turn(session, query, reply)
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "INSERT INTO session_messages (session_id, role, content) VALUES (?, ?, ?)",
+                    [(session.id, "user", query), (session.id, "assistant", reply)],
+                )
+                db.execute(
+                    "UPDATE sessions SET turns=turns+1, expires_at=? WHERE id=?",
+                    (time.time() + self.ttl, session.id),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def claim_summary(self, session: ChatSession) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._conn().execute(
+                "UPDATE sessions SET summarizing_until=? WHERE id=? AND summarizing_until<?",
+                (now + self.summary_lease_s, session.id, now),
+            )
+        session.summarizing = cur.rowcount == 1
+        return session.summarizing
+
+    def save_summary(self, session: ChatSession, summary: str, folded: int) -> None:
+        super().save_summary(session, summary, folded)
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("UPDATE sessions SET summary=? WHERE id=?", (summary, session.id))
+                # The folded turns are the oldest rows: later ones (from any worker) are kept
+                db.execute(
+                    "DELETE FROM session_messages WHERE seq IN "
+                    "(SELECT seq FROM session_messages WHERE session_id=? ORDER BY seq LIMIT ?)",
+                    (session.id, folded),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def release_summary(self, session: ChatSession) -> None:
+        super().release_summary(session)
+        with self._lock:
+            self._conn().execute("UPDATE sessions SET summarizing_until=0 WHERE id=?", (session.id,))
+
+    def _count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out["store"] = "sqlite"
+        return out
+
+
+if CHAT_SESSION_STORE == "sqlite":
+    session_store: SessionStore = SqliteSessionStore(CHAT_SESSION_DB, CHAT_SESSION_TTL, CHAT_SESSION_MAX)
+else:
+    session_store = SessionStore(CHAT_SESSION_TTL, CHAT_SESSION_MAX)
+_summary_stats = {"runs": 0, "failures": 0}
+_background: Set["asyncio.Task[None]"] = set()
+
+
+def _triage_context(triage: Dict[str, Any]) -> str:
+    keys = ("triage_level", "explanation", "recommendations")
+    compact = {k: triage[k] for k in keys if k in triage} or triage
+    return json.dumps(compact, ensure_ascii=False)
+
+
+def build_session_messages(session: ChatSession, query: str) -> Dict[str, Any]:
+    """
+    Prompt for the next reply: system prompt + triage result + rolling summary,
+    then the recent turns that fit CONTEXT_BUDGET_CHAT, then the new query.
+    Returns {"messages", "context"} (context = packing stats).
+    """
+    system_msg = CHAT_SYSTEM_PROMPT
+    if session.triage:
+        system_msg += f"\n\nTriage result for this patient:\n{_triage_context(session.triage)}"
+    if session.summary:
+        system_msg += f"\n\nSummary of the earlier conversation:\n{session.summary}"
+    packed, context = pack_history(
+        session.messages,
+        budget=max(0, CONTEXT_BUDGET_CHAT - estimate_tokens(system_msg) - estimate_tokens(query)),
+        max_messages=CONTEXT_CHAT_MAX_MESSAGES,
+    )
+    messages = [{"role": "system", "content": system_msg}] + packed
+    messages.append({"role": "user", "content": query})
+    return {"messages": messages, "context": context}
+
+
+async def session_reply_events(
+    session: ChatSession, query: str, canned: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    ("token", delta) events as Groq streams the reply, then ("done", {...}).
+    `canned` short-circuits the model (small-talk guardrails). The turn is
+    only recorded once the reply completed; older turns are then summarized
+    in the background.
+    """
+    async with session.lock:
+        context = None
+        if canned is not None:
+            reply = canned
+            yield "token", canned
+        else:
+            prompt = build_session_messages(session, query)
+            context = prompt["context"]
+            chunks: List[str] = []
+            async for token in groq_chat_stream(prompt["messages"], temperature=TEMPERATURE_CHAT, max_tokens=600):
+                chunks.append(token)
+                yield "token", token
+            reply = "".join(chunks)
+        record_turn(session, query, reply)
+        yield "done", {"session_id": session.id, "reply": reply, "turns": session.turns, "context": context}
+
+
+def record_turn(session: ChatSession, query: str, reply: str) -> None:
+    session_store.record_turn(session, query, reply)
+    if len(session.messages) > CHAT_SESSION_SUMMARIZE_AFTER and session_store.claim_summary(session):
+        task = asyncio.create_task(summarize_session(session))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+async def summarize_session(session: ChatSession) -> None:
+    """
+    Fold everything but the last CHAT_SESSION_KEEP_MESSAGES into the rolling
+    summary (low-priority Groq call, never blocks a reply).
+    """
+    try:
+        older = session.messages[:max(0, len(session.messages) - CHAT_SESSION_KEEP_MESSAGES)]
+        if not older:
+            return
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+        summary = await groq_chat(
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain the running summary of a conversation about a clinical triage result. "
+                    "Keep the patient facts, the questions asked and the key answers. Plain prose, no preamble."
+                )},
+                {"role": "user", "content": (
+                    f"Current summary:\n{session.summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+                )},
+            ],
+            temperature=0.1,
+            max_tokens=CHAT_SESSION_SUMMARY_MAX_TOKENS,
+            priority=PRIORITY_BACKGROUND,
+        )
+        session_store.save_summary(session, summary.strip(), len(older))
+        _summary_stats["runs"] += 1
+    except Exception as e:
+        _summary_stats["failures"] += 1
+        print(f"⚠️ Chat session summary failed: {e}")
+    finally:
+        session_store.release_summary(session)
@@ -0,0 +1,91 @@
+# app/services/single_flight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from app.config import SINGLE_FLIGHT_ENABLED
+from app.services.metrics import SINGLE_FLIGHT_CALLS, SINGLE_FLIGHT_WAITERS
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "callers")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0  # callers currently awaiting
+        self.callers = 0  # callers that joined over the flight's lifetime
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts
+    the work as a task, later callers await that same task until it finishes.
+    Results and exceptions reach every caller. A caller that is cancelled
+    only stops waiting; the task itself is cancelled once no caller is left.
+    Nothing is kept after completion (caching is the result caches' job).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.max_callers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Returns (result, shared); `shared` is True for callers that joined an
+        existing flight and so must not mutate the result in place.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return await fn(), False
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _t, key=key, flight=flight: self._done(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        SINGLE_FLIGHT_CALLS.inc(group=self.name, role="follower" if shared else "leader")
+        flight.waiters += 1
+        flight.callers += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _done(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self.max_callers = max(self.max_callers, flight.callers)
+        SINGLE_FLIGHT_WAITERS.observe(flight.callers, group=self.name)
+        if not flight.task.cancelled():
+            flight.task.exception()  # retrieved: callers that gave up must not leave it "never retrieved"
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": round(self.followers / calls, 4) if calls else 0.0,
+            "max_callers_per_key": self.max_callers,
+        }
+
+
+# Whole non-streaming triage, keyed on the normalized input hash
+triage_flight = SingleFlight("triage")
+# Analyzer stage (also shared by /triage/stream and batches), same key
+analyzer_flight = SingleFlight("analyzer")
+# Query embeddings, keyed on the exact retrieval query text
+embedding_flight = SingleFlight("embedding")
+
+
+def single_flight_stats() -> Dict[str, Any]:
+    return {f.name: f.stats() for f in (triage_flight, analyzer_flight, embedding_flight)}
@@ -0,0 +1,46 @@
+# app/services/speculative.py
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+SPECULATIVE_INCLUDE = ["documents", "distances", "embeddings"]
+
+
+def _distances(query: np.ndarray, vectors: np.ndarray, space: str) -> np.ndarray:
+    """
+    Distances in the collection's space: squared l2 (Chroma's default), cosine or ip.
+    """
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+        return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+    if space == "ip":
+        return 1.0 - vectors @ query
+    diff = vectors - query[None, :]
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def rescore_candidates(
+    results: Dict[str, Any], query_vector: List[float], k: int, space: str = "l2"
+) -> Tuple[List[str], List[str], List[float], float]:
+    """
+    Re-score the speculative candidate pool (first query of a Chroma result,
+    queried with SPECULATIVE_INCLUDE) against the refined query's embedding.
+    Returns the refined top-k snippets/ids/distances within the pool and the
+    overlap of that top-k with the speculative top-k (1.0 = same set). A pool
+    without stored vectors has overlap 0.0, so the refined query runs.
+    """
+    docs = ((results or {}).get("documents") or [[]])[0] or []
+    ids_ = ((results or {}).get("ids") or [[]])[0] or []
+    embeddings = (results or {}).get("embeddings")
+    vectors = embeddings[0] if embeddings is not None and len(embeddings) else []
+    pool = [(d, gid, v) for d, gid, v in zip(docs, ids_, vectors) if d and str(d).strip()]
+    if not pool:
+        return [], [], [], 0.0
+
+    matrix = np.asarray([v for _, _, v in pool], dtype=np.float32)
+    dist = _distances(np.asarray(query_vector, dtype=np.float32), matrix, space)
+    order = np.argsort(dist, kind="stable")[:k]  # ties keep the speculative order
+    speculative_top = {gid for _, gid, _ in pool[:k]}
+    refined_top = [pool[i][1] for i in order]
+    overlap = len(speculative_top & set(refined_top)) / max(1, min(k, len(pool)))
+    return [pool[i][0] for i in order], refined_top, [float(dist[i]) for i in order], overlap
@@ -0,0 +1,135 @@
+# app/services/startup.py
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.config import GROQ_API_KEY, GUIDELINES_SYNC_MARKER
+from app.services.retrieval import init_retrieval
+
+
+class StartupState:
+    """
+    What /readyz reports: model loaded, collection synced, and how long each step took.
+    """
+
+    def __init__(self):
+        self.model_loaded = False
+        self.collection_synced = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.model_loaded and self.collection_synced and bool(GROQ_API_KEY)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "checks": {
+                "model_loaded": self.model_loaded,
+                "collection_synced": self.collection_synced,
+                "groq_api_key": bool(GROQ_API_KEY),
+            },
+            "error": self.error,
+            "startup_ms": dict(self.timings),
+        }
+
+
+startup_state = StartupState()
+_warm_lock = threading.Lock()
+_sync_waiter: Optional[threading.Thread] = None
+
+
+def warm_up() -> None:
+    """
+    Load + warm the embedding model, open Chroma and sync GUIDELINES_FILE.
+    Runs in a background thread from the lifespan so /healthz answers at once
+    and /readyz flips to 200 when this finishes; with WARMUP_ON_STARTUP=0 the
+    first retrieval request runs it instead (ensure_retrieval). Runs once.
+    Under app.cli.serve only worker 0 syncs the guidelines, then writes
+    GUIDELINES_SYNC_MARKER; the others share its Chroma server and report
+    collection_synced once the marker of this server run appears. A
+    collection embedded with an older pooling is re-embedded in place first;
+    until then the old vectors keep being served.
+    """
+    with _warm_lock:
+        if not startup_state.collection_synced:
+            _warm_up()
+
+
+def _warm_up() -> None:
+    from app.routes.guidelines import preload_guidelines
+    from app.services import retrieval
+
+    t0 = time.perf_counter()
+    startup_state.error = None
+    serve_id = os.getenv("TRIAGE_SERVE_ID")
+    worker = os.getenv("TRIAGE_WORKER_ID", "0")
+    try:
+        startup_state.timings.update(init_retrieval())
+        startup_state.model_loaded = True
+        if worker != "0" and serve_id and not _sync_marked(serve_id):
+            _start_sync_waiter(serve_id)
+            return
+        if worker == "0":
+            if retrieval.embedding_stale:
+                t = time.perf_counter()
+                try:
+                    n = retrieval.reembed_collection()
+                    print(f"✅ Re-embedded {n} guidelines with {retrieval.embedding_info['embedding_pooling']} pooling")
+                except Exception as e:
+                    print(f"⚠️ Re-embedding failed, still serving the old vectors: {e}")
+                startup_state.timings["reembed_ms"] = round((time.perf_counter() - t) * 1000, 1)
+            t = time.perf_counter()
+            preload_guidelines()
+            startup_state.timings["guideline_sync_ms"] = round((time.perf_counter() - t) * 1000, 1)
+            if serve_id:
+                _mark_synced(serve_id)
+        startup_state.collection_synced = True
+    except Exception as e:
+        startup_state.error = str(e)
+        print(f"❌ Startup failed: {e}")
+        return
+    finally:
+        startup_state.timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    breakdown = ", ".join(f"{k}={v:.0f}" for k, v in startup_state.timings.items())
+    print(f"✅ Ready in {startup_state.timings['total_ms'] / 1000:.1f}s ({breakdown})")
+    if not GROQ_API_KEY:
+        print("⚠️ Missing GROQ_API_KEY in environment (.env); /readyz stays 503")
+
+
+# ---------- cross-worker sync signal ----------
+def _sync_marked(serve_id: str) -> bool:
+    try:
+        with open(GUIDELINES_SYNC_MARKER, "r", encoding="utf-8") as f:
+            return f.read().strip() == serve_id
+    except OSError:
+        return False
+
+
+def _mark_synced(serve_id: str) -> None:
+    os.makedirs(os.path.dirname(GUIDELINES_SYNC_MARKER) or ".", exist_ok=True)
+    tmp = GUIDELINES_SYNC_MARKER + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(serve_id)
+    os.replace(tmp, GUIDELINES_SYNC_MARKER)
+
+
+def _start_sync_waiter(serve_id: str) -> None:
+    global _sync_waiter
+    if _sync_waiter is None or not _sync_waiter.is_alive():
+        print("[INFO] Waiting for worker 0 to sync the guidelines")
+        _sync_waiter = threading.Thread(target=_await_sync, args=(serve_id, time.perf_counter()), daemon=True)
+        _sync_waiter.start()
+
+
+def _await_sync(serve_id: str, t0: float, poll_s: float = 0.5) -> None:
+    """
+    Non-zero workers: flip collection_synced once worker 0 marked this server run synced.
+    """
+    while not _sync_marked(serve_id):
+        time.sleep(poll_s)
+    startup_state.timings["sync_wait_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    startup_state.collection_synced = True
+    print("✅ Guidelines synced by worker 0, ready")
@@ -0,0 +1,313 @@
+# app/services/vector_index.py
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+INCLUDE_DEFAULT = ("documents", "metadatas", "distances")
+
+
+class NumpyIndex:
+    """
+    Exact in-memory vector index with the subset of the Chroma collection API
+    this app uses (add/upsert/delete/get/query/count/metadata/modify).
+
+    Vectors are kept as one contiguous row-normalized matrix plus their norms,
+    so a query batch is a single matmul + argpartition. `space="l2"` returns
+    Chroma's default squared-L2 distances (same ranking as the Chroma
+    collection); `space="cosine"` returns 1 - cosine similarity. float16
+    halves memory but is upcast block-wise on every query, which makes a
+    query roughly 10x slower than float32: use it only when memory-bound.
+    `where` filters (equality, $eq/$ne/$in/$nin, $and/$or) are boolean masks
+    cached per clause. Snapshots are .npy files memory-mapped on load.
+
+    Rows live in a preallocated buffer grown geometrically, so upserts cost
+    O(batch) amortized; `_matrix`/`_norms` are views of its filled part.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        space: str = "l2",
+        dtype: str = "float32",
+        path: Optional[str] = None,
+    ):
+        if space not in {"l2", "cosine"}:
+            raise ValueError(f"Unsupported space '{space}'")
+        self.name = name
+        self.metadata: Dict[str, Any] = dict(metadata or {})
+        self.space = space
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self._embed = embedding_function
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=self.dtype)
+        self._norms = np.zeros((0,), dtype=np.float32)
+        self._buf: Optional[np.ndarray] = None  # owned, writable storage; None while on the snapshot mmap
+        self._norm_buf: Optional[np.ndarray] = None
+        self._masks: Dict[str, np.ndarray] = {}
+        self.dirty = False
+
+    # ---------- persistence ----------
+    @classmethod
+    def load_or_create(cls, path: str, name: str, embedding_function=None, metadata=None, space="l2", dtype="float32"):
+        index = cls(name, embedding_function, metadata, space=space, dtype=dtype, path=path)
+        meta_file = os.path.join(path, "index.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            index.metadata = state.get("metadata") or {}  # stored metadata only: the compat check reads it
+            index.space = state.get("space", space)
+            index._ids = state["ids"]
+            index._documents = state["documents"]
+            index._metadatas = state["metadatas"]
+            index._rows = {gid: i for i, gid in enumerate(index._ids)}
+            if index._ids:
+                index._matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+                index._norms = np.load(os.path.join(path, "norms.npy"))
+                index.dtype = index._matrix.dtype
+        return index
+
+    def persist(self) -> None:
+        """
+        Write the snapshot atomically (vectors.npy / norms.npy / index.json).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self.dirty and os.path.exists(os.path.join(self.path, "index.json")):
+                return
+            os.makedirs(self.path, exist_ok=True)
+            for fname, arr in (("vectors.npy", self._matrix), ("norms.npy", self._norms)):
+                tmp = os.path.join(self.path, fname + ".tmp.npy")
+                np.save(tmp, np.ascontiguousarray(arr))
+                os.replace(tmp, os.path.join(self.path, fname))
+            tmp = os.path.join(self.path, "index.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "name": self.name,
+                    "metadata": self.metadata,
+                    "space": self.space,
+                    "ids": self._ids,
+                    "documents": self._documents,
+                    "metadatas": self._metadatas,
+                }, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(self.path, "index.json"))
+            self.dirty = False
+
+    # ---------- collection API ----------
+    def count(self) -> int:
+        return len(self._ids)
+
+    def modify(self, metadata: Optional[Dict[str, Any]] = None, **_) -> None:
+        if metadata is not None:
+            self.metadata = dict(metadata)
+            self.dirty = True
+
+    def _vectors(self, documents: Optional[List[str]], embeddings) -> np.ndarray:
+        if embeddings is None:
+            if self._embed is None:
+                raise ValueError("No embeddings given and no embedding_function set.")
+            embeddings = self._embed(list(documents))
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def add(self, ids: List[str], documents: Optional[List[str]] = None, metadatas=None, embeddings=None) -> None:
+        dupes = [gid for gid in ids if gid in self._rows]
+        if dupes or len(set(ids)) != len(ids):
+            raise ValueError(f"IDs already exist: {dupes[:5]}")
+        self.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def _set_storage(self, buf: np.ndarray, norm_buf: np.ndarray, n: int) -> None:
+        self._buf, self._norm_buf = buf, norm_buf
+        self._matrix, self._norms = buf[:n], norm_buf[:n]
+
+    def _reserve(self, n: int, dim: int) -> None:
+        """
+        Make the owned buffer hold at least n rows (copies once off a snapshot mmap).
+        """
+        if self._buf is not None and self._buf.shape[0] >= n:
+            return
+        filled = len(self._ids)
+        capacity = max(n, 64, 2 * (self._buf.shape[0] if self._buf is not None else filled))
+        buf = np.empty((capacity, dim), dtype=self.dtype)
+        norm_buf = np.empty((capacity,), dtype=np.float32)
+        if filled:
+            buf[:filled] = self._matrix
+            norm_buf[:filled] = self._norms
+        self._set_storage(buf, norm_buf, filled)
+
+    def upsert(self, ids: List[str], documents: Optional[List[str]] = None, metadatas=None, embeddings=None) -> None:
+        if not ids:
+            return
+        vecs = self._vectors(documents, embeddings)
+        if len(vecs) != len(ids):
+            raise ValueError(f"Got {len(vecs)} embeddings for {len(ids)} ids")
+        norms = np.linalg.norm(vecs, axis=1).astype(np.float32)
+        unit = (vecs / np.maximum(norms, 1e-12)[:, None]).astype(self.dtype)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+        # Repeated ids in one call: the last occurrence wins, like consecutive upserts
+        last = list({gid: i for i, gid in enumerate(ids)}.items())
+        with self._lock:
+            if self._ids and self._matrix.shape[1] != unit.shape[1]:
+                raise ValueError(f"Embedding dimension {unit.shape[1]} != index dimension {self._matrix.shape[1]}")
+            n = len(self._ids)
+            self._reserve(n + sum(1 for gid, _ in last if gid not in self._rows), unit.shape[1])
+            for gid, i in last:
+                row = self._rows.get(gid)
+                if row is None:
+                    row = self._rows[gid] = len(self._ids)
+                    self._ids.append(gid)
+                    self._documents.append(documents[i])
+                    self._metadatas.append(dict(metadatas[i] or {}))
+                else:
+                    self._documents[row] = documents[i]
+                    self._metadatas[row] = dict(metadatas[i] or {})
+                self._buf[row] = unit[i]
+                self._norm_buf[row] = norms[i]
+            self._set_storage(self._buf, self._norm_buf, len(self._ids))
+            self._masks.clear()
+            self.dirty = True
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            drop = set(ids or [])
+            if where:
+                drop.update(self._ids[i] for i in np.flatnonzero(self._where_mask(where)))
+            keep = [i for i, gid in enumerate(self._ids) if gid not in drop]
+            if len(keep) == len(self._ids):
+                return
+            self._set_storage(np.ascontiguousarray(np.asarray(self._matrix)[keep]), np.asarray(self._norms)[keep], len(keep))
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._rows = {gid: i for i, gid in enumerate(self._ids)}
+            self._masks.clear()
+            self.dirty = True
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include=("documents", "metadatas"), limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[gid] for gid in ids if gid in self._rows]
+            else:
+                rows = list(range(len(self._ids)))
+            if where:
+                mask = self._where_mask(where)
+                rows = [r for r in rows if mask[r]]
+            rows = rows[offset:offset + limit if limit is not None else None]
+            out: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            if "documents" in include:
+                out["documents"] = [self._documents[r] for r in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metadatas[r] for r in rows]
+            if "embeddings" in include:
+                out["embeddings"] = [(np.asarray(self._matrix[r], dtype=np.float32) * self._norms[r]).tolist() for r in rows]
+            return out
+
+    def query(self, query_texts: Optional[List[str]] = None, query_embeddings=None, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, include=INCLUDE_DEFAULT) -> Dict[str, Any]:
+        q = self._vectors(query_texts, query_embeddings)
+        with self._lock:
+            ids, dists = self.search(q, n_results, where)
+            out: Dict[str, Any] = {"ids": [[self._ids[r] for r in row] for row in ids]}
+            if "documents" in include:
+                out["documents"] = [[self._documents[r] for r in row] for row in ids]
+            if "metadatas" in include:
+                out["metadatas"] = [[self._metadatas[r] for r in row] for row in ids]
+            if "distances" in include:
+                out["distances"] = [d.tolist() for d in dists]
+            if "embeddings" in include:
+                out["embeddings"] = [
+                    [(np.asarray(self._matrix[r], dtype=np.float32) * self._norms[r]).tolist() for r in row] for row in ids
+                ]
+            return out
+
+    # ---------- search ----------
+    def _similarities(self, unit_q: np.ndarray) -> np.ndarray:
+        """
+        [M, N] cosine similarities; float16 matrices are upcast block by block.
+        """
+        if self._matrix.dtype == np.float32:
+            return unit_q @ self._matrix.T
+        block = 16384
+        out = np.empty((unit_q.shape[0], self._matrix.shape[0]), dtype=np.float32)
+        for start in range(0, self._matrix.shape[0], block):
+            chunk = np.asarray(self._matrix[start:start + block], dtype=np.float32)
+            out[:, start:start + block] = unit_q @ chunk.T
+        return out
+
+    def search(self, q: np.ndarray, k: int, where: Optional[Dict[str, Any]] = None) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Exact top-k rows and distances for each query vector (batched).
+        """
+        n = len(self._ids)
+        if n == 0 or k <= 0:
+            return [np.empty(0, dtype=np.int64)] * len(q), [np.empty(0, dtype=np.float32)] * len(q)
+        q = np.atleast_2d(np.asarray(q, dtype=np.float32))
+        q_norms = np.linalg.norm(q, axis=1)
+        sims = self._similarities(q / np.maximum(q_norms, 1e-12)[:, None])
+        if self.space == "cosine":
+            dist = 1.0 - sims
+        else:
+            # ||q - x||^2 = ||q||^2 - 2 ||q|| ||x|| cos + ||x||^2
+            dist = (q_norms[:, None] ** 2) - 2.0 * sims * q_norms[:, None] * self._norms[None, :] + self._norms[None, :] ** 2
+        if where:
+            dist = np.where(self._where_mask(where)[None, :], dist, np.inf)
+        k = min(k, n)
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < n else np.tile(np.arange(n), (len(q), 1))
+        rows, dists = [], []
+        for i in range(len(q)):
+            d = dist[i, top[i]]
+            order = np.argsort(d, kind="stable")
+            keep = np.isfinite(d[order])
+            rows.append(top[i][order][keep])
+            dists.append(d[order][keep].astype(np.float32))
+        return rows, dists
+
+    # ---------- metadata filters ----------
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._build_mask(where)
+            self._masks[key] = mask
+        return mask
+
+    def _build_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        n = len(self._ids)
+        mask = np.ones(n, dtype=bool)
+        for field, cond in where.items():
+            if field == "$and":
+                for sub in cond:
+                    mask &= self._where_mask(sub)
+            elif field == "$or":
+                any_mask = np.zeros(n, dtype=bool)
+                for sub in cond:
+                    any_mask |= self._where_mask(sub)
+                mask &= any_mask
+            else:
+                values = [m.get(field) for m in self._metadatas]
+                if isinstance(cond, dict):
+                    (op, target), = cond.items()
+                else:
+                    op, target = "$eq", cond
+                if op == "$eq":
+                    mask &= np.fromiter((v == target for v in values), dtype=bool, count=n)
+                elif op == "$ne":
+                    mask &= np.fromiter((v != target for v in values), dtype=bool, count=n)
+                elif op == "$in":
+                    mask &= np.fromiter((v in target for v in values), dtype=bool, count=n)
+                elif op == "$nin":
+                    mask &= np.fromiter((v not in target for v in values), dtype=bool, count=n)
+                else:
+                    raise ValueError(f"Unsupported where operator '{op}'")
+        return mask
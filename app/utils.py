@@ -2,11 +2,14 @@
 import hashlib
 import io
 import json
-import re
 from typing import List, Optional, Dict, Any
 
 import pdfplumber
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.services.json_scanner import scan_json
+from app.services.metrics import JSON_EXTRACT
 
 try:
     import pytesseract
@@ -14,6 +17,35 @@ try:
 except Exception:
     OCR_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except Exception:
+    ORJSON_AVAILABLE = False
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if ORJSON_AVAILABLE else 0
+
+
+def json_dumps(obj: Any) -> str:
+    """
+    Compact UTF-8 JSON text; orjson when installed, else the stdlib.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class: JSONResponse rendered with orjson when it is
+    installed (numpy scalars/arrays and non-str keys serialize too).
+    """
+
+    def render(self, content: Any) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(content, option=_ORJSON_OPTIONS)
+        return super().render(content)
+
 
 def _hash_id(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
@@ -42,6 +74,24 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
         raise HTTPException(status_code=500, detail=f"PDF extraction error: {str(e)}")
 
 
+def extract_text_from_upload(filename: str, data: bytes) -> str:
+    """
+    Text of an uploaded/offline .txt or .pdf file; HTTPException(400) when unusable.
+    """
+    fname = (filename or "").lower()
+    if fname.endswith(".txt"):
+        raw_text = data.decode("utf-8", errors="ignore")
+    elif fname.endswith(".pdf"):
+        if not data:
+            raise HTTPException(status_code=400, detail="Empty PDF file.")
+        raw_text = extract_text_from_pdf_bytes(data)
+        if not raw_text.strip():
+            raise HTTPException(status_code=400, detail="No text extracted from PDF.")
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Use .txt or .pdf")
+    return raw_text
+
+
 def build_retrieval_query_from_analyzer(an: Dict[str, Any], fallback_text: str) -> str:
     """
     Compact query from analyzer JSON to maximize embedding recall.
@@ -69,17 +119,14 @@ def try_parse_json_strict(s: str) -> Optional[Dict[str, Any]]:
 
 def extract_json_from_text(s: str) -> Optional[Dict[str, Any]]:
     """
-    Last-resort extractor: finds largest {...} JSON-looking block.
-    Keeps same behavior as original.
+    Last-resort extractor: strict parse first, then one pass of JsonScanner
+    for the first {...} object (skips prose/code fences, repairs trailing
+    commas and truncated output).
     """
-    # Remove common code fences
-    cleaned = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", s.strip(), flags=re.MULTILINE)
-    # Try direct parse
-    obj = try_parse_json_strict(cleaned)
-    if obj is not None:
+    obj = try_parse_json_strict(s)
+    if isinstance(obj, dict):
+        JSON_EXTRACT.inc(outcome="strict")
         return obj
-    # Regex to find JSON object (kept same as original)
-    match = re.search(r"\{(?:[^{}]|(?R))*\}", cleaned, flags=re.DOTALL)
-    if match:
-        return try_parse_json_strict(match.group(0))
-    return None
+    scanner = scan_json(s)
+    JSON_EXTRACT.inc(outcome=scanner.outcome)
+    return scanner.result
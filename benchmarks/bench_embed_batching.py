@@ -0,0 +1,97 @@
+# benchmarks/bench_embed_batching.py
+"""
+Throughput / latency of query embedding with and without the micro-batcher
+at 1, 8 and 32 concurrent clients.
+
+    python -m benchmarks.bench_embed_batching              # real BioGPT
+    python -m benchmarks.bench_embed_batching --synthetic  # cost model, no weights
+
+The synthetic model sleeps `base + per_item * n` per forward pass (sleep
+releases the GIL, like torch), which is roughly how a padded CPU batch scales.
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from app.services.batching import EmbeddingBatcher
+from app.services.inference import InferenceExecutor
+from benchmarks.common import summarize
+
+QUERIES = [
+    "symptoms: chest pain, shortness of breath | risk_factors: smoking",
+    "symptoms: fever, stiff neck, headache",
+    "symptoms: sudden severe back pain | diagnoses: bowel obstruction",
+    "symptoms: seizures and loss of consciousness",
+    "symptoms: nosebleeds and bruising | risk_factors: anticoagulants",
+    "symptoms: red eyes and sensitivity to light",
+    "symptoms: burn from hot water | risk_factors: rheumatoid arthritis",
+    "symptoms: abdominal pain, vomiting | diagnoses: appendicitis",
+]
+
+
+class SyntheticEmbedding:
+    def __init__(self, base_ms: float, per_item_ms: float, dim: int = 1024):
+        self.base = base_ms / 1000.0
+        self.per_item = per_item_ms / 1000.0
+        self.dim = dim
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        time.sleep(self.base + self.per_item * len(input))
+        return [[float(len(t))] * self.dim for t in input]
+
+
+async def run_mode(embed_fn, batched: bool, concurrency: int, n_requests: int, args) -> dict:
+    executor = InferenceExecutor(workers=args.workers, queue_depth=n_requests)
+    batcher = EmbeddingBatcher(embed_fn, executor, window_ms=args.window_ms, max_batch=args.max_batch)
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int):
+        async with sem:
+            q = QUERIES[i % len(QUERIES)] + f" #{i}"
+            t0 = time.perf_counter()
+            if batched:
+                await batcher.embed(q)
+            else:
+                await executor.run(embed_fn, [q])
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - t0
+    executor.shutdown()
+    out = summarize(latencies, elapsed)
+    if batched:
+        out["avg_batch"] = batcher.stats()["avg_batch"]
+    return out
+
+
+async def main(args) -> None:
+    if args.synthetic:
+        embed_fn = SyntheticEmbedding(args.base_ms, args.per_item_ms)
+    else:
+        from app.services.embeddings import BioGPTEmbeddingFunction
+        embed_fn = BioGPTEmbeddingFunction()
+        embed_fn(["warm-up"])
+
+    print(f"{'clients':>7} {'mode':<10} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'avg_batch':>9}")
+    for concurrency in args.concurrency:
+        n_requests = max(args.requests, concurrency * 4)
+        for batched in (False, True):
+            r = await run_mode(embed_fn, batched, concurrency, n_requests, args)
+            mode = "batched" if batched else "unbatched"
+            print(f"{concurrency:>7} {mode:<10} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r.get('avg_batch', 1):>9}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--window-ms", type=float, default=5.0)
+    ap.add_argument("--max-batch", type=int, default=16)
+    ap.add_argument("--synthetic", action="store_true")
+    ap.add_argument("--base-ms", type=float, default=40.0)
+    ap.add_argument("--per-item-ms", type=float, default=4.0)
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,69 @@
+# benchmarks/bench_http_pool.py
+"""
+Counts TCP connection setups for concurrent Groq calls against a local stub:
+a fresh AsyncClient per call (previous behaviour) vs the shared pooled client.
+
+    python -m benchmarks.bench_http_pool --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stub_server import StubServer
+
+
+async def _run(n_requests: int, concurrency: int, call) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await call()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    return time.perf_counter() - t0
+
+
+async def main(n_requests: int, concurrency: int, latency: float) -> None:
+    stub = await StubServer(latency=latency).start()
+    os.environ["GROQ_CHAT_URL"] = f"{stub.url}/openai/v1/chat/completions"
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    # The stub has no quota: keep the scheduler's per-minute buckets out of the measurement
+    os.environ.setdefault("GROQ_RPM", "0")
+    os.environ.setdefault("GROQ_TPM", "0")
+
+    import httpx
+    from app.config import HTTP_TIMEOUT
+    from app.services.groq import groq_chat
+    from app.services.http_client import start_http_client, close_http_client
+
+    messages = [{"role": "user", "content": "ping"}]
+
+    async def per_call():
+        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
+            r = await client.post(os.environ["GROQ_CHAT_URL"], json={"messages": messages})
+            r.raise_for_status()
+
+    async def shared():
+        await groq_chat(messages)
+
+    print(f"{'mode':<10} {'requests':>8} {'conns':>6} {'seconds':>8} {'rps':>8}")
+    for name, call in (("per-call", per_call), ("shared", shared)):
+        stub.reset()
+        if name == "shared":
+            await start_http_client()
+        elapsed = await _run(n_requests, concurrency, call)
+        if name == "shared":
+            await close_http_client()
+        print(f"{name:<10} {stub.requests:>8} {stub.connections:>6} {elapsed:>8.3f} {n_requests / elapsed:>8.1f}")
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.01, help="stub response delay (s)")
+    args = ap.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
@@ -0,0 +1,70 @@
+# benchmarks/bench_ingest_embedding.py
+"""
+Ingest embedding throughput on the WHO + synthetic guideline corpus:
+one padded batch per chunk in file order (previous behaviour) vs
+length-bucketed sub-batches with attention-mask pooling.
+
+    python -m benchmarks.bench_ingest_embedding --backend torch --batch-size 32
+"""
+import argparse
+import json
+import time
+
+import torch
+
+from app.services.embeddings import create_embedding_function
+
+
+def load_corpus(paths):
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend((it.get("text") or "").strip() for it in json.load(f))
+    return [t for t in texts if t]
+
+
+def naive(fn, texts, batch_size):
+    """
+    Chunks in file order, each padded to its longest member, mean over all positions.
+    """
+    out = []
+    for start in range(0, len(texts), batch_size):
+        enc = fn.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                           max_length=fn.max_length, return_tensors="pt").to(fn.device)
+        with torch.no_grad():
+            out.extend(fn.model(**enc).last_hidden_state.mean(dim=1).cpu().tolist())
+    return out
+
+
+def padding_ratio(fn, texts, batch_size, bucketed):
+    lengths = [len(ids) for ids in fn.tokenizer(texts, truncation=True, max_length=fn.max_length)["input_ids"]]
+    if bucketed:
+        lengths = sorted(lengths)
+    padded = sum(max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size]) for i in range(0, len(lengths), batch_size))
+    return padded / sum(lengths)
+
+
+def main(args) -> None:
+    texts = load_corpus(args.corpus) * args.repeat
+    fn = create_embedding_function(args.backend, threads=args.threads or None, batch_size=args.batch_size)
+    fn(texts[:2])  # warm-up
+    print(f"{len(texts)} texts, backend={args.backend}, batch_size={args.batch_size}")
+    runs = [("bucketed", lambda: fn(texts))]
+    if hasattr(fn, "model") and hasattr(fn.model, "config"):
+        runs.insert(0, ("naive", lambda: naive(fn, texts, args.batch_size)))
+    for name, run in runs:
+        t0 = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - t0
+        ratio = padding_ratio(fn, texts, args.batch_size, bucketed=name == "bucketed")
+        print(f"{name:<9} {elapsed:8.2f}s {len(texts) / elapsed:8.1f} docs/s  padded/real tokens {ratio:.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", nargs="+", default=["guidelines.json", "datasource/who_guidelines.json"])
+    ap.add_argument("--backend", default="torch")
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1)
+    main(ap.parse_args())
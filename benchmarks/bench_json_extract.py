@@ -0,0 +1,121 @@
+# benchmarks/bench_json_extract.py
+"""
+JSON extraction from LLM output: extract_json_from_text (strict parse +
+single-pass JsonScanner) vs a naive streaming extractor that re-parses the
+joined text after every chunk, plus stdlib json vs orjson response rendering.
+
+    python -m benchmarks.bench_json_extract
+    python -m benchmarks.bench_json_extract --corpus captured_outputs.jsonl --chunk 4
+
+The built-in corpus is the analyzer/reasoning bodies GroqStub answers with,
+wrapped the ways models actually misbehave (code fences, leading prose,
+trailing commas) and truncated at 25/50/75/90 %. --corpus takes captured raw
+completions, one JSON string or {"content": ...} per line.
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.json_scanner import JsonScanner
+from app.utils import ORJSON_AVAILABLE, FastJSONResponse, extract_json_from_text
+from benchmarks.stub_server import GroqStub
+
+
+def builtin_corpus() -> List[str]:
+    bodies = [
+        json.dumps(GroqStub.ANALYZER),
+        json.dumps(GroqStub.TRIAGE),
+        json.dumps(GroqStub.TRIAGE, indent=2),
+        json.dumps({**GroqStub.TRIAGE, "recommendations": GroqStub.TRIAGE["recommendations"] * 8,
+                    "explanation": GroqStub.TRIAGE["explanation"] * 6}),
+    ]
+    out: List[str] = []
+    for body in bodies:
+        out.append(body)
+        out.append(f"```json\n{body}\n```")
+        out.append(f"Here is the triage assessment:\n{body}\nLet me know if you need more detail.")
+        out.append(body[:-1].rstrip() + ",}")
+        for frac in (0.25, 0.5, 0.75, 0.9):
+            out.append(body[: int(len(body) * frac)])
+    return out
+
+
+def load_corpus(path: str) -> List[str]:
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                out.append(item["content"] if isinstance(item, dict) else str(item))
+    return out
+
+
+def naive_stream(text: str, chunk: int) -> Optional[Dict[str, Any]]:
+    # What "emit fields early" costs without a scanner: re-parse the prefix after every chunk
+    obj = None
+    for end in range(chunk, len(text) + chunk, chunk):
+        obj = _try_prefix(text[:end]) or obj
+    return obj
+
+
+def _try_prefix(prefix: str) -> Optional[Dict[str, Any]]:
+    start = prefix.find("{")
+    if start < 0:
+        return None
+    try:
+        obj = json.loads(prefix[start:prefix.rfind("}") + 1])
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def scanner_stream(text: str, chunk: int) -> Optional[Dict[str, Any]]:
+    scanner = JsonScanner(emit_fields=True)
+    for i in range(0, len(text), chunk):
+        scanner.feed(text[i:i + chunk])
+    return scanner.close()
+
+
+def bench(name: str, fn: Callable[[str], Any], corpus: List[str], repeat: int) -> None:
+    parsed = sum(1 for text in corpus if fn(text))
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            fn(text)
+    per_call_us = (time.perf_counter() - t0) / (repeat * len(corpus)) * 1e6
+    print(f"{name:<34} {per_call_us:>10.1f} {parsed:>4}/{len(corpus)}")
+
+
+def bench_render(repeat: int) -> None:
+    body = {"triage": GroqStub.TRIAGE, "analyzer": GroqStub.ANALYZER,
+            "guideline_snippets": ["Symptoms: chest pain. Assign Level 2 (Emergency). " * 4] * 5,
+            "guideline_ids": [f"g{i}" for i in range(5)]}
+    for name, render in (
+        ("render json (stdlib)", lambda c: json.dumps(c, ensure_ascii=False, separators=(",", ":")).encode()),
+        ("render FastJSONResponse" + ("" if ORJSON_AVAILABLE else " (no orjson)"), FastJSONResponse({}).render),
+    ):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            render(body)
+        print(f"{name:<34} {(time.perf_counter() - t0) / repeat * 1e6:>10.1f}")
+
+
+def main(args) -> None:
+    corpus = load_corpus(args.corpus) if args.corpus else builtin_corpus()
+    print(f"corpus: {len(corpus)} outputs, {sum(map(len, corpus))} chars, chunk={args.chunk}")
+    print(f"{'extractor':<34} {'us/call':>10} {'parsed':>9}")
+    bench("extract_json_from_text", extract_json_from_text, corpus, args.repeat)
+    bench(f"scanner stream ({args.chunk}-char chunks)", lambda t: scanner_stream(t, args.chunk), corpus, args.repeat)
+    bench(f"naive re-parse ({args.chunk}-char chunks)", lambda t: naive_stream(t, args.chunk), corpus,
+          max(1, args.repeat // 10))
+    bench_render(args.repeat * 10)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=None, help="JSONL of captured raw completions")
+    ap.add_argument("--chunk", type=int, default=4, help="characters per streamed chunk (~1 token)")
+    ap.add_argument("--repeat", type=int, default=200)
+    main(ap.parse_args())
@@ -0,0 +1,78 @@
+# benchmarks/bench_retrieval.py
+"""
+p50/p99 single-query latency and batched throughput: NumpyIndex (float32 /
+float16) vs a Chroma collection, on random BioGPT-sized vectors.
+
+    python -m benchmarks.bench_retrieval --sizes 200 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.vector_index import NumpyIndex
+from benchmarks.common import summarize
+
+
+def bench_queries(query_fn, queries: np.ndarray, k: int) -> dict:
+    latencies = []
+    t0 = time.perf_counter()
+    for q in queries:
+        t = time.perf_counter()
+        query_fn(q[None, :], k)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - t0)
+
+
+def build_chroma(vectors: np.ndarray, ids):
+    try:
+        import chromadb
+    except Exception:
+        return None
+    client = chromadb.EphemeralClient()
+    name = f"bench_{len(ids)}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    coll = client.create_collection(name)
+    for start in range(0, len(ids), 5000):
+        coll.add(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000].tolist())
+    return coll
+
+
+def main(args) -> None:
+    rng = np.random.default_rng(0)
+    print(f"{'n':>7} {'backend':<14} {'p50_ms':>8} {'p99_ms':>8} {'batch{}_ms'.format(args.batch):>11}")
+    for n in args.sizes:
+        vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        ids = [f"g{i}" for i in range(n)]
+        metas = [{"level": i % 5 + 1} for i in range(n)]
+
+        backends = {}
+        for dtype in ("float32", "float16"):
+            index = NumpyIndex(f"bench_{dtype}", dtype=dtype)
+            index.add(ids=ids, embeddings=vectors, metadatas=metas)
+            backends[f"numpy-{dtype}"] = lambda q, k, index=index: index.search(q, k)
+        chroma = build_chroma(vectors, ids) if not args.skip_chroma else None
+        if chroma is not None:
+            backends["chroma"] = lambda q, k: chroma.query(query_embeddings=q.tolist(), n_results=k)
+
+        for name, fn in backends.items():
+            r = bench_queries(fn, queries, args.k)
+            t = time.perf_counter()
+            fn(queries[: args.batch], args.k)
+            batch_ms = (time.perf_counter() - t) * 1000
+            print(f"{n:>7} {name:<14} {r['p50_ms']:>8} {r['p99_ms']:>8} {batch_ms:>11.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[200, 10_000, 100_000])
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("-k", type=int, default=5)
+    ap.add_argument("--skip-chroma", action="store_true")
+    main(ap.parse_args())
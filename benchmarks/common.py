@@ -0,0 +1,24 @@
+# benchmarks/common.py
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies_s: List[float], elapsed_s: float) -> Dict[str, float]:
+    """
+    Throughput plus p50/p95/p99 latency in milliseconds.
+    """
+    return {
+        "count": len(latencies_s),
+        "rps": round(len(latencies_s) / elapsed_s, 2) if elapsed_s else 0.0,
+        "p50_ms": round(percentile(latencies_s, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies_s, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies_s, 99) * 1000, 2),
+    }
@@ -0,0 +1,97 @@
+# benchmarks/fixtures.py
+"""
+Request bodies for load tests, drawn from datasource/ and guidelines.json so
+runs are reproducible across machines.
+"""
+import glob
+import json
+import os
+import random
+import re
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASOURCE = os.path.join(ROOT, "datasource")
+
+
+def _load_json(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def short_reports(limit: int = 200) -> List[str]:
+    """
+    Symptom/history notes rebuilt from guidelines.json entries (the triage answer is stripped).
+    """
+    out = []
+    for it in _load_json(os.path.join(ROOT, "guidelines.json"))[:limit]:
+        text = it.get("text") or ""
+        facts = re.findall(r"\b(?:Symptoms|History):\s*[^.]+\.", text)
+        if facts:
+            out.append(" ".join(facts))
+    return out
+
+
+def report_pdfs(include_large: bool = False) -> List[Tuple[str, bytes]]:
+    """
+    (filename, bytes) for the sample medical reports; the multi-MB scans only with include_large.
+    """
+    paths = sorted(glob.glob(os.path.join(DATASOURCE, "Medical Reports*", "*.pdf")))
+    if include_large:
+        paths += sorted(glob.glob(os.path.join(DATASOURCE, "[0-9].pdf")))
+    out = []
+    for path in paths:
+        with open(path, "rb") as f:
+            out.append((os.path.basename(path), f.read()))
+    return out
+
+
+def long_reports() -> List[str]:
+    """
+    Text layer of the sample PDFs (pdfplumber), for /triage with realistic lengths.
+    """
+    import io
+    import pdfplumber
+
+    out = []
+    for _, data in report_pdfs():
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            text = "\n".join((p.extract_text() or "") for p in pdf.pages).strip()
+        if text:
+            out.append(text)
+    return out
+
+
+def guideline_batch(run_id: str, seq: int, size: int = 5) -> Dict[str, Any]:
+    """
+    /ingest-guidelines payload with ids unique per (run, request) so every call really embeds.
+    """
+    items = _load_json(os.path.join(DATASOURCE, "who_guidelines.json"))
+    rng = random.Random(seq)
+    picked = rng.sample(items, min(size, len(items)))
+    return {"items": [
+        {"id": f"bench-{run_id}-{seq}-{i}", "text": it["text"], "metadata": {"source": "bench", "level": str(
+            (it.get("metadata") or {}).get("level", ""))}}
+        for i, it in enumerate(picked)
+    ]}
+
+
+def chat_payload(seq: int, turns: int = 4) -> Dict[str, Any]:
+    """
+    /chat body as agent.py sends it: prior turns plus the triage result as a system message.
+    """
+    triage = {"triage_level": "Level 2", "explanation": "Chest pain with dyspnea.", "recommendations": ["ECG"]}
+    history = []
+    for t in range(turns):
+        history.append({"role": "user", "content": f"Question {t} about the triage level?"})
+        history.append({"role": "assistant", "content": "It means the patient needs urgent assessment."})
+    history.append({"role": "system", "content": f"triage_result: {triage}"})
+    return {"history": history, "query": f"What should happen first for patient {seq}?"}
+
+
+def handoff_payload(seq: int) -> Dict[str, Any]:
+    return {
+        "patient": {"name": f"Bench Patient {seq}", "email": f"bench{seq}@example.org"},
+        "triage": {"triage_level": "Level 3", "explanation": "Stable.", "recommendations": []},
+        "instruction": "book a doctor appointment",
+    }
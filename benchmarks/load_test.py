@@ -0,0 +1,320 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test: starts the Groq and n8n stubs, launches the API with
+uvicorn pointed at them (fresh CHROMA_PATH), waits for /readyz, then drives
+/triage, /triage-upload, /chat, /ingest-guidelines and /handoff-n8n at a
+fixed concurrency. Reports RPS, p50/p95/p99 and peak server RSS per
+scenario, writes JSON and compares against a stored baseline.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 16 --groq-latency 0.3 --groq-jitter 0.1
+    python -m benchmarks.load_test --save-baseline            # record benchmarks/results/baseline.json
+    python -m benchmarks.load_test --fail-on-regression       # exit 1 when worse than the baseline
+
+Use --url to target an already running server (configure its GROQ_CHAT_URL /
+N8N_WEBHOOK_URL yourself, e.g. with `python -m benchmarks.stub_server`); pass
+--pid to still sample its RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.common import summarize
+from benchmarks.stub_server import GroqStub, N8nStub
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+SCENARIOS = ("triage", "triage-upload", "chat", "ingest", "handoff")
+
+
+# ---------- server process ----------
+def read_rss_mb(pid: int) -> Optional[float]:
+    """
+    Current RSS of `pid` plus its children (uvicorn workers, PDF pool) in MiB.
+    """
+    try:
+        import psutil
+
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs if p.is_running()) / 2 ** 20
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> None:
+        if self.pid is None:
+            return
+        rss = read_rss_mb(self.pid)
+        if rss is not None:
+            self.peak_mb = max(self.peak_mb or 0.0, rss)
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak_mb = None
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+        self.sample()
+
+
+def launch_server(port: int, env: Dict[str, str], workers: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return subprocess.Popen(cmd, env={**os.environ, **env}, cwd=fixtures.ROOT)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout_s: float, proc: Optional[subprocess.Popen],
+                     path: str = "/readyz") -> float:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout_s:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"API exited with code {proc.returncode} before becoming ready")
+        try:
+            r = await client.get(path)
+            if r.status_code == 200:
+                return time.perf_counter() - t0
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"API not ready after {timeout_s:.0f}s")
+
+
+# ---------- scenarios ----------
+def build_requests(run_id: str, long_reports: bool) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    texts = fixtures.short_reports()
+    if long_reports:
+        texts += fixtures.long_reports()
+    pdfs = fixtures.report_pdfs()
+    return {
+        "triage": lambda i: {"url": "/triage", "json": {"text": texts[i % len(texts)]}},
+        "triage-upload": lambda i: {
+            "url": "/triage-upload",
+            "files": {"file": (pdfs[i % len(pdfs)][0], pdfs[i % len(pdfs)][1], "application/pdf")},
+        },
+        "chat": lambda i: {"url": "/chat", "json": fixtures.chat_payload(i)},
+        "ingest": lambda i: {"url": "/ingest-guidelines", "json": fixtures.guideline_batch(run_id, i)},
+        "handoff": lambda i: {"url": "/handoff-n8n", "json": fixtures.handoff_payload(i)},
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, build: Callable[[int], Dict[str, Any]], n_requests: int,
+                       concurrency: int, warmup: int, pid: Optional[int]) -> Dict[str, Any]:
+    for i in range(warmup):
+        await client.post(**build(-1 - i))
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def one(i: int) -> None:
+        async with sem:
+            t = time.perf_counter()
+            try:
+                r = await client.post(**build(i))
+                key = str(r.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            statuses[key] = statuses.get(key, 0) + 1
+            if key == "200":
+                latencies.append(time.perf_counter() - t)
+
+    with RssSampler(pid) as rss:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - t0
+    out = summarize(latencies, elapsed)
+    out["errors"] = n_requests - len(latencies)
+    out["status"] = statuses
+    out["peak_rss_mb"] = round(rss.peak_mb, 1) if rss.peak_mb is not None else None
+    return out
+
+
+# ---------- baseline comparison ----------
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Print per-scenario deltas; returns the regressions (RPS down or p95 up by more than `tolerance`).
+    """
+    regressions = []
+    print(f"\n{'scenario':<14} {'rps':>16} {'p95_ms':>20} {'rss_mb':>16}")
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+
+        def delta(key: str) -> str:
+            b, c = base.get(key), cur.get(key)
+            if not b or c is None:
+                return f"{c}"
+            return f"{c} ({(c - b) / b * 100:+.0f}%)"
+
+        print(f"{name:<14} {delta('rps'):>16} {delta('p95_ms'):>20} {delta('peak_rss_mb'):>16}")
+        if base.get("rps") and cur["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']} -> {cur['rps']}")
+        if base.get("p95_ms") and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {cur['p95_ms']} ms")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=fixtures.ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+async def main(args) -> int:
+    groq = await GroqStub(latency=args.groq_latency, jitter=args.groq_jitter,
+                          rate_limit=args.rate_limit, seed=args.seed).start()
+    n8n = await N8nStub(latency=args.n8n_latency).start()
+    proc = None
+    pid = args.pid
+    base_url = args.url
+    chroma_dir = None
+    try:
+        if base_url is None:
+            chroma_dir = tempfile.mkdtemp(prefix="triage-load-")
+            env = {
+                "GROQ_CHAT_URL": f"{groq.url}/openai/v1/chat/completions",
+                "GROQ_API_KEY": os.environ.get("GROQ_API_KEY") or "load-test",
+                "N8N_WEBHOOK_URL": f"{n8n.url}/webhook/triage",
+                "CHROMA_PATH": chroma_dir,
+                # The stub has no quota; keep the client-side limiter out of the measurement unless asked
+                "GROQ_RPM": str(args.groq_rpm),
+                "GROQ_TPM": str(args.groq_tpm),
+            }
+            for kv in args.env:
+                k, _, v = kv.partition("=")
+                env[k] = v
+            proc = launch_server(args.port, env, args.workers)
+            pid = proc.pid
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            ready_s = await wait_ready(client, args.ready_timeout, proc, args.ready_path)
+            idle_rss = read_rss_mb(pid) if pid else None
+            print(f"API ready in {ready_s:.1f}s, idle RSS {idle_rss and round(idle_rss)} MiB")
+
+            run_id = uuid.uuid4().hex[:8]
+            requests_for = build_requests(run_id, args.long_reports)
+            results: Dict[str, Any] = {}
+            print(f"{'scenario':<14} {'count':>6} {'err':>5} {'rps':>8} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'rss_mb':>8}")
+            for name in args.scenarios:
+                groq.reset()
+                r = await run_scenario(client, requests_for[name], args.requests, args.concurrency, args.warmup, pid)
+                r["groq_requests"] = groq.requests
+                r["groq_rate_limited"] = groq.rate_limited
+                results[name] = r
+                print(f"{name:<14} {r['count']:>6} {r['errors']:>5} {r['rps']:>8} {r['p50_ms']:>9} "
+                      f"{r['p95_ms']:>9} {r['p99_ms']:>9} {str(r['peak_rss_mb']):>8}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        await groq.stop()
+        await n8n.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+            "ready_s": round(ready_s, 2),
+            "idle_rss_mb": round(idle_rss, 1) if idle_rss is not None else None,
+        },
+        "scenarios": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions vs baseline " + str(baseline.get("meta", {}).get("commit")) + ":")
+            for r in regressions:
+                print(f"  - {r}")
+            return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    ap.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--warmup", type=int, default=3, help="unmeasured requests per scenario")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--groq-latency", type=float, default=0.3)
+    ap.add_argument("--groq-jitter", type=float, default=0.1)
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="probability of a stub 429")
+    ap.add_argument("--n8n-latency", type=float, default=0.05)
+    ap.add_argument("--groq-rpm", type=int, default=0, help="GROQ_RPM for the API (0 = unlimited)")
+    ap.add_argument("--groq-tpm", type=int, default=0, help="GROQ_TPM for the API (0 = unlimited)")
+    ap.add_argument("--long-reports", action="store_true", help="add the PDF text layers to /triage inputs")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="extra API environment")
+    ap.add_argument("--ready-timeout", type=float, default=900.0)
+    ap.add_argument("--ready-path", default="/readyz",
+                    help="/healthz for scenarios that need no model (chat, handoff) with WARMUP_ON_STARTUP=0")
+    ap.add_argument("--url", default=None, help="existing API base URL (skips launching one)")
+    ap.add_argument("--pid", type=int, default=None, help="PID of the existing API, for RSS sampling")
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    sys.exit(asyncio.run(main(ap.parse_args())))
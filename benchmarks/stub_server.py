@@ -0,0 +1,254 @@
+# benchmarks/stub_server.py
+"""
+Minimal keep-alive HTTP/1.1 server that answers like Groq's OpenAI-compatible
+chat completions endpoint. Counts TCP connections so benchmarks can measure
+how many handshakes a client pays for.
+
+Latency, jitter and 429 injection make it usable as a Groq stand-in for load
+tests; GroqStub answers each pipeline prompt with a plausible body and
+N8nStub records webhook deliveries.
+
+    python -m benchmarks.stub_server --groq-port 9001 --n8n-port 9002 --latency 0.3 --jitter 0.1 --rate-limit 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def chat_completion(content: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def stream_chunks(content: str, chunk_chars: int = 12) -> List[Dict[str, Any]]:
+    """
+    chat.completion.chunk events for `stream: true`; usage rides on the last one under x_groq like Groq's.
+    """
+    chunks = [
+        {"id": "chatcmpl-stub", "object": "chat.completion.chunk",
+         "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}]}
+        for i in range(0, len(content), chunk_chars)
+    ]
+    chunks.append({
+        "id": "chatcmpl-stub", "object": "chat.completion.chunk",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "x_groq": {"usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4,
+                             "total_tokens": len(content) // 4}},
+    })
+    return chunks
+
+
+class StubServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        content: Optional[str] = None,
+        jitter: float = 0.0,
+        rate_limit: float = 0.0,
+        retry_after: float = 0.2,
+        seed: Optional[int] = None,
+    ):
+        """
+        latency/jitter: per-request delay is latency + uniform(0, jitter) seconds.
+        rate_limit: probability of answering 429 with a Retry-After of `retry_after` seconds.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.content = content or json.dumps({"symptoms": [], "risk_factors": [], "diagnoses": []})
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()  # idle keep-alive connections would otherwise outlive the server
+            await self._server.wait_closed()
+            self._server = None
+
+    def reset(self) -> None:
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def respond(self, method: str, path: str, body: bytes):
+        """
+        Returns (status, payload). Override for other endpoints.
+        """
+        return 200, chat_completion(self.content)
+
+    def _delay(self) -> float:
+        return self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _write(self, writer: asyncio.StreamWriter, status: int, data: bytes,
+               content_type: str = "application/json", extra: Optional[Dict[str, str]] = None) -> None:
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}"]
+        head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                delay = self._delay()
+                if delay:
+                    await asyncio.sleep(delay)
+                if self.rate_limit and self._rng.random() < self.rate_limit:
+                    self.rate_limited += 1
+                    data = json.dumps({"error": {"message": "Rate limit reached (stub)", "type": "tokens"}}).encode()
+                    self._write(writer, 429, data, extra={"Retry-After": str(self.retry_after)})
+                else:
+                    status, payload = await self.respond(method, path, body)
+                    if _wants_stream(body) and status == 200 and "choices" in payload:
+                        content = payload["choices"][0]["message"]["content"]
+                        events = "".join(f"data: {json.dumps(c)}\n\n" for c in stream_chunks(content))
+                        self._write(writer, 200, (events + "data: [DONE]\n\n").encode("utf-8"),
+                                    content_type="text/event-stream")
+                    else:
+                        self._write(writer, status, json.dumps(payload).encode("utf-8"))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+def _wants_stream(body: bytes) -> bool:
+    if b'"stream"' not in body:
+        return False
+    try:
+        return bool(json.loads(body).get("stream"))
+    except ValueError:
+        return False
+
+
+class GroqStub(StubServer):
+    """
+    Answers the analyzer, reasoning and chat prompts of this app with bodies
+    their parsers accept, and reports usage from the prompt size.
+    """
+
+    ANALYZER = {"symptoms": ["chest pain", "shortness of breath"], "risk_factors": ["hypertension"], "diagnoses": []}
+    TRIAGE = {
+        "triage_level": "Level 2",
+        "explanation": "Chest pain with dyspnea in a hypertensive patient warrants emergency assessment.",
+        "recommendations": ["ECG within 10 minutes", "Continuous monitoring", "Cardiology review"],
+    }
+    CHAT = "Level 2 means the patient should be seen urgently; the guidelines recommend an ECG first."
+
+    def answer(self, messages: List[Dict[str, Any]]) -> Tuple[str, int]:
+        system = (messages[0].get("content") or "") if messages else ""
+        if "report analyzer" in system:
+            content = json.dumps(self.ANALYZER)
+        elif "triage assistant" in system:
+            content = json.dumps(self.TRIAGE)
+        elif "running summary" in system:
+            content = "The user asked about the triage level and the recommended first steps."
+        else:
+            content = self.CHAT
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        return content, prompt_tokens
+
+    async def respond(self, method: str, path: str, body: bytes):
+        if not path.rstrip("/").endswith("/chat/completions"):
+            return 404, {"error": {"message": f"unknown path {path}"}}
+        try:
+            messages = json.loads(body).get("messages") or []
+        except ValueError:
+            messages = []
+        content, prompt_tokens = self.answer(messages)
+        return 200, chat_completion(content, prompt_tokens, len(content) // 4)
+
+
+class N8nStub(StubServer):
+    """
+    n8n webhook stand-in: accepts any POST and keeps the last deliveries.
+    """
+
+    def __init__(self, *args, keep: int = 100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keep = keep
+        self.deliveries: List[Any] = []
+
+    async def respond(self, method: str, path: str, body: bytes):
+        try:
+            self.deliveries.append(json.loads(body or b"null"))
+        except ValueError:
+            self.deliveries.append(body.decode("utf-8", errors="replace"))
+        del self.deliveries[:-self.keep]
+        return 200, {"status": "received", "count": self.requests}
+
+
+async def _serve(args) -> None:
+    groq = await GroqStub(port=args.groq_port, latency=args.latency, jitter=args.jitter,
+                          rate_limit=args.rate_limit, seed=args.seed).start()
+    n8n = await N8nStub(port=args.n8n_port, latency=args.n8n_latency).start()
+    print(f"GROQ_CHAT_URL={groq.url}/openai/v1/chat/completions")
+    print(f"N8N_WEBHOOK_URL={n8n.url}/webhook/triage")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await groq.stop()
+        await n8n.stop()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--groq-port", type=int, default=9001)
+    ap.add_argument("--n8n-port", type=int, default=9002)
+    ap.add_argument("--latency", type=float, default=0.3, help="Groq base latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.1, help="Groq extra uniform latency (s)")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="Probability of a 429")
+    ap.add_argument("--n8n-latency", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services import analyzer
+from app.services.pre_analyzer import PreAnalyzer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def pre():
+    return PreAnalyzer(
+        vocab_path=os.path.join(ROOT, "datasource", "clinical_vocabulary.json"),
+        sources=[os.path.join(ROOT, "guidelines.json"), os.path.join(ROOT, "datasource", "who_guidelines.json")],
+    )
+
+
+def test_free_text_fragments_are_not_vocabulary(pre):
+    phrases = {display for _, _, display in pre.automaton.phrases}
+    assert not phrases & {"eyes", "als", "prison inmate", "war veteran with injuries"}
+
+
+@pytest.mark.parametrize("text", ["pain", "fever", "chest pain"])
+def test_single_finding_is_not_confident(pre, text):
+    assert not pre.analyze(text)["confident"]
+
+
+def test_several_findings_are_confident(pre):
+    out = pre.analyze("chest pain and shortness of breath")
+    assert out["confident"]
+    assert out["result"]["symptoms"] == ["chest pain", "shortness of breath"]
+
+
+@pytest.mark.parametrize("text", ["pain", "fever"])
+def test_one_word_input_goes_to_groq(monkeypatch, pre, text):
+    calls = []
+
+    async def fake_groq(raw_text):
+        calls.append(raw_text)
+        return {"symptoms": [raw_text], "risk_factors": [], "diagnoses": []}
+
+    monkeypatch.setattr(analyzer, "PRE_ANALYZER_ENABLED", True)
+    monkeypatch.setattr(analyzer, "pre_analyzer", pre)
+    monkeypatch.setattr(analyzer, "_groq_analyzer", fake_groq)
+    data, info = asyncio.run(analyzer.analyze_report(text))
+    assert info["source"] == "groq"
+    assert calls == [text]
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.services import pipeline
+from app.services.speculative import rescore_candidates
+
+POOL = {
+    "ids": [["a", "b", "c", "d"]],
+    "documents": [["chest pain", "fever", "rash", "headache"]],
+    "distances": [[0.1, 0.2, 0.3, 0.4]],
+    "embeddings": [[[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.1, 0.9]]],
+}
+
+
+def test_same_query_keeps_the_speculative_top_k():
+    _, ids_, _, overlap = rescore_candidates(POOL, [1.0, 0.0], 2)
+    assert ids_ == ["a", "b"]
+    assert overlap == 1.0
+
+
+def test_different_query_reorders_by_refined_distance():
+    snippets, ids_, distances, overlap = rescore_candidates(POOL, [0.0, 1.0], 2, space="cosine")
+    assert ids_ == ["c", "d"]
+    assert snippets == ["rash", "headache"]
+    assert distances == sorted(distances)
+    assert overlap == 0.0
+
+
+def test_pool_without_vectors_is_never_reused():
+    results = {k: v for k, v in POOL.items() if k != "embeddings"}
+    assert rescore_candidates(results, [1.0, 0.0], 2)[3] == 0.0
+
+
+# Speculative top-5 near [1, 0]; the rest of the pool near [0, 1]
+WIDE_POOL = {
+    "ids": [[f"g{i}" for i in range(10)]],
+    "documents": [[f"guideline {i}" for i in range(10)]],
+    "distances": [[i / 10 for i in range(10)]],
+    "embeddings": [[[1.0, i / 100] for i in range(5)] + [[i / 100, 1.0] for i in range(5)]],
+}
+
+
+@pytest.fixture
+def fake_retrieval(monkeypatch):
+    """
+    Embeddings keyed by text; the full-index query records what it was called with.
+    """
+    vectors = {"raw text": [1.0, 0.0], "symptoms: rash": [0.0, 1.0]}
+    full_queries = []
+
+    async def embed_queries(texts):
+        return [vectors[t] for t in texts]
+
+    async def query_guidelines(texts, n_results=5, include=None, query_embeddings=None):
+        full_queries.append((texts, query_embeddings))
+        return {"ids": [["c"]], "documents": [["rash"]], "distances": [[0.0]]}
+
+    monkeypatch.setattr(pipeline, "embed_queries", embed_queries)
+    monkeypatch.setattr(pipeline, "query_guidelines", query_guidelines)
+    monkeypatch.setattr(pipeline, "collection_space", lambda: "l2")
+    return full_queries
+
+
+async def _resolve(retrieval_query):
+    speculation = asyncio.ensure_future(asyncio.sleep(0, result=WIDE_POOL))
+    return await pipeline.retrieve_after_analyzer(speculation, retrieval_query)
+
+
+def test_empty_analyzer_terms_reuse_only_because_the_query_is_the_raw_text(fake_retrieval):
+    # No analyzer terms: the refined query falls back to the raw text, so its top-k is the speculative one
+    retrieval_query = pipeline.build_retrieval_query_from_analyzer(
+        {"symptoms": [], "risk_factors": [], "diagnoses": []}, "raw text"
+    )
+    _, ids_, _, info = asyncio.run(_resolve(retrieval_query))
+    assert info == {"used": True, "overlap": 1.0}
+    assert ids_ == ["g0", "g1", "g2", "g3", "g4"]
+    assert fake_retrieval == []
+
+
+def test_diverging_refined_query_runs_the_full_search(fake_retrieval):
+    _, ids_, _, info = asyncio.run(_resolve("symptoms: rash"))
+    assert info == {"used": False, "overlap": 0.0}
+    assert ids_ == ["c"]
+    assert fake_retrieval == [(["symptoms: rash"], [[0.0, 1.0]])]